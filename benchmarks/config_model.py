@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Config model benchmark
+Checks that KerioConfig round-trips generated configs and then times the
+entity codec and parse / patch / serialize over configs with many
+connections. Runs anywhere, no PyGObject or Kerio client needed.
+
+    python3 benchmarks/config_model.py [--cases 500] [--connections 10 1000 10000]
+
+Round-trip properties, checked on random configs and field values:
+    parse(to_string(c)) gives back every field value of c
+    to_string is a fixed point after the first write
+    set() of an unchanged value writes the same bytes
+    other connections, unknown elements and comments are kept
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.kerioconf import ENTITY_CHARS, FIELDS, KerioConfig, encode  # noqa: E402
+
+# Printable text plus the characters Kerio escapes and some non-ASCII
+ALPHABET = ENTITY_CHARS + ':;=?[]^_`{|}~ -.,/' + 'abcXYZ0129' + 'äéñ€中'
+
+
+def random_text(rng, length=None):
+    return ''.join(rng.choice(ALPHABET) for _ in range(length or rng.randint(1, 24)))
+
+
+def old_encode(text):
+    """The per-character loop KerioConfigEditor.encode_html_entities used"""
+    special_chars = {char: f'&#{ord(char)};' for char in ENTITY_CHARS}
+    result = []
+    for char in text:
+        if char in special_chars:
+            result.append(special_chars[char])
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def generate(rng, connections):
+    """Config text with one persistent and many other connections, plus unknown parts"""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<!-- generated -->', '<config>',
+             '  <connections>']
+    for index in range(connections):
+        kind = 'persistent' if index == 0 else 'temporary'
+        lines.append(f'    <connection type="{kind}" id="{index}">')
+        for field in FIELDS:
+            if field == 'port' or rng.random() < 0.1:
+                continue
+            lines.append(f'      <{field}>{encode(random_text(rng))}</{field}>')
+        lines.append(f'      <extra note="{index}">{encode(random_text(rng))}</extra>')
+        lines.append('    </connection>')
+    lines.extend(['  </connections>', '  <options><log level="debug"/></options>', '</config>'])
+    return '\n'.join(lines) + '\n'
+
+
+def check_round_trips(cases, seed):
+    """Return a list of failure descriptions"""
+    rng = random.Random(seed)
+    failures = []
+    for case in range(cases):
+        source = generate(rng, rng.randint(1, 4))
+        config = KerioConfig.parse(source)
+        written = config.to_string()
+        if written != source:
+            failures.append(f"case {case}: unchanged config not written back verbatim")
+        before = {field: config.get(field) for field in FIELDS}
+        if config.to_string() != written:
+            failures.append(f"case {case}: to_string not stable")
+
+        for field in FIELDS:
+            if before[field] is not None and config.set(field, before[field]):
+                failures.append(f"case {case}: set({field!r}) of the same value reported a change")
+        if config.to_string() != written:
+            failures.append(f"case {case}: setting unchanged values changed the file")
+
+        values = {field: random_text(rng) for field in rng.sample(FIELDS, 3)}
+        removed = rng.choice([field for field in FIELDS if field not in values])
+        for field, value in values.items():
+            config.set(field, value)
+        config.set(removed, None)
+        patched = config.to_string()
+        reread = KerioConfig.parse(patched)
+        for field in FIELDS:
+            expected = values.get(field, None if field == removed else before[field])
+            if reread.get(field) != expected:
+                failures.append(f"case {case}: {field} read back as {reread.get(field)!r}, "
+                                f"expected {expected!r}")
+        if reread.to_string() != patched:
+            failures.append(f"case {case}: patched config is not a fixed point")
+        if (len(reread.connections()) != len(config.connections())
+                or reread.root.find('options/log') is None or '<!-- generated -->' not in patched):
+            failures.append(f"case {case}: lost connections, unknown elements or comments")
+    return failures
+
+
+def best_of(function, repeat=5):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--connections', type=int, nargs='+', default=[10, 1000, 10000])
+    args = parser.parse_args()
+
+    failures = check_round_trips(args.cases, args.seed)
+    for failure in failures[:20]:
+        print(failure)
+    print(f"round trips: {args.cases} cases, {len(failures)} failures")
+
+    # What the serializer encodes: short field values and whitespace between tags
+    rng = random.Random(args.seed)
+    nodes = [random_text(rng) for _ in range(20_000)] + ['\n      '] * 80_000
+    rng.shuffle(nodes)
+    if [old_encode(node) for node in nodes] != [encode(node) for node in nodes]:
+        print("codec differs from the old encoder")
+        failures.append('codec')
+    old = best_of(lambda: [old_encode(node) for node in nodes])
+    new = best_of(lambda: [encode(node) for node in nodes])
+    print(f"\nencode {len(nodes)} text nodes: loop {old * 1000:.1f} ms, "
+          f"table {new * 1000:.1f} ms ({old / new:.1f}x)")
+
+    print(f"\n{'connections':>11} {'bytes':>10} {'parse ms':>9} {'patch ms':>9} {'write ms':>9}")
+    for connections in args.connections:
+        source = generate(rng, connections)
+        parse = best_of(lambda: KerioConfig.parse(source))
+        config = KerioConfig.parse(source)
+        patch = best_of(lambda: (config.set('password', random_text(rng)),
+                                 config.set('active', rng.choice('01'))))
+        write = best_of(config.to_string)
+        print(f"{connections:11} {len(source):10} {parse * 1000:9.2f} {patch * 1000:9.3f} "
+              f"{write * 1000:9.2f}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Control channel benchmark
+Runs a VPNCore with a fake service and helper on the pure-Python loop,
+serves it on a ControlServer in a scratch $XDG_RUNTIME_DIR and then
+drives it the way users do: `kerio-vpn-indicator connect`, `status
+--json` and `auto-reconnect off` as fresh processes, plus a second
+`--daemon` that must refuse to start. Then checks that the command line
+acts on its own only when nothing is running: an instance that hangs,
+hangs up or never accepts gets an error instead of a second systemctl.
+Reports the request round trip in process and the hand-off time of the
+command line over a bare interpreter start. Runs anywhere, no systemd
+or PyGObject needed.
+
+    python3 benchmarks/control.py [--runs 20]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'kerio-vpn-indicator.py')
+sys.path.insert(0, ROOT)
+
+from instrumentation import make_core  # noqa: E402  (benchmarks/instrumentation.py)
+from kerio_vpn import cli  # noqa: E402
+from kerio_vpn.commands import CommandResult  # noqa: E402
+from kerio_vpn.control import ControlServer, InstanceLock, request, socket_path  # noqa: E402
+from kerio_vpn.kerioconf import KerioConfig  # noqa: E402
+
+
+class FakePrivileged:
+    """Records systemctl actions instead of running them"""
+
+    spawned = 0
+
+    def __init__(self):
+        self.actions = []
+
+    def systemctl(self, action):
+        self.actions.append(action)
+        return CommandResult(['systemctl', action], 0, '', '')
+
+    def close(self):
+        pass
+
+
+def wall_time(args, runs):
+    """Median seconds to run args to completion"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+class BrokenInstance:
+    """A control socket whose owner is stuck: it hangs, hangs up or never accepts"""
+
+    def __init__(self, path, behaviour):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.path = path
+        self.behaviour = behaviour
+        self.queued = []
+        if behaviour == 'stale':
+            self.sock.close()  # The file stays, nobody listens: ECONNREFUSED
+            return
+        self.sock.listen(0)
+        if behaviour == 'backlog':
+            # Fill the accept queue so a further connect blocks
+            for _ in range(2):
+                client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                client.setblocking(False)
+                try:
+                    client.connect(path)
+                except BlockingIOError:
+                    pass
+                self.queued.append(client)
+            return
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        try:
+            conn, _ = self.sock.accept()
+        except OSError:
+            return
+        conn.recv(4096)
+        if self.behaviour == 'hangup':
+            conn.close()
+        else:
+            self.queued.append(conn)  # 'hang': read the request, never answer
+
+    def close(self):
+        for sock in self.queued:
+            sock.close()
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def check_fallback(failures):
+    """The command line acts directly only when nothing is listening"""
+    ran = []
+    real_systemctl, real_probe = cli.systemctl, cli.probe_status
+    cli.systemctl = lambda action: ran.append(action) or 0
+    cli.probe_status = lambda: {'connected': False, 'service': 'inactive', 'interface': 'absent',
+                                'vpn_ip': None, 'server': None}
+    try:
+        for behaviour, falls_back in (('stale', True), ('hang', False), ('hangup', False),
+                                      ('backlog', False)):
+            instance = BrokenInstance(socket_path(), behaviour)
+            del ran[:]
+            errors = io.StringIO()
+            try:
+                with contextlib.redirect_stderr(errors):
+                    status = cli.control('reconnect')
+                    probed = cli.status(['--json'])
+            finally:
+                instance.close()
+            if falls_back and (ran != ['restart'] or status != 0):
+                failures.append(f"{behaviour} socket: no direct restart ({ran}, exit {status})")
+            if not falls_back and (ran or status != 1):
+                failures.append(f"{behaviour} instance: restarted directly ({ran}, exit {status})")
+            if not falls_back and 'reconnect' not in errors.getvalue():
+                failures.append(f"{behaviour} instance: no error reported")
+            if probed != 3:
+                failures.append(f"{behaviour} instance: status exited {probed}, expected a probe")
+    finally:
+        cli.systemctl, cli.probe_status = real_systemctl, real_probe
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['XDG_STATE_HOME'] = directory
+        os.environ['XDG_RUNTIME_DIR'] = directory
+        config_file = os.path.join(directory, 'kerio-kvc.conf')
+        config = KerioConfig.new()
+        config.set('server', 'vpn.example.com')
+        config.save(config_file)
+
+        lock = InstanceLock()
+        if not lock.acquire():
+            failures.append("could not take the instance lock in a fresh runtime dir")
+        core = make_core(False, config_file)
+        core.privileged = FakePrivileged()
+        core.start()
+        server = ControlServer(core.loop, core)
+        devnull = open(os.devnull, 'w')
+        with contextlib.redirect_stdout(devnull):
+            thread = threading.Thread(target=core.loop.run, daemon=True)
+            thread.start()
+
+            samples = []
+            for _ in range(200):
+                started = time.perf_counter()
+                state = request('status')
+                samples.append(time.perf_counter() - started)
+            round_trip = statistics.median(samples)
+            if state.get('pid') != os.getpid() or state.get('server') != 'vpn.example.com':
+                failures.append(f"unexpected status {state}")
+
+            second = subprocess.run([sys.executable, SCRIPT, '--daemon'], capture_output=True,
+                                    text=True, timeout=10)
+            if second.returncode != 1 or 'already running' not in second.stderr:
+                failures.append(f"second instance was not refused: {second.returncode} {second.stderr!r}")
+
+            result = subprocess.run([sys.executable, SCRIPT, 'connect'], timeout=10)
+            deadline = time.monotonic() + 5
+            while 'start' not in core.privileged.actions and time.monotonic() < deadline:
+                time.sleep(0.01)
+            if result.returncode != 0 or core.privileged.actions[:1] != ['start']:
+                failures.append(f"connect was not handed over: {core.privileged.actions}")
+
+            result = subprocess.run([sys.executable, SCRIPT, 'auto-reconnect', 'off'],
+                                    capture_output=True, text=True, timeout=10)
+            if result.stdout.strip() != 'Auto-reconnect: off' or core.reconnect_policy.enabled:
+                failures.append(f"auto-reconnect off: {result.stdout!r}")
+
+            result = subprocess.run([sys.executable, SCRIPT, 'status', '--json'],
+                                    capture_output=True, text=True, timeout=10)
+            if json.loads(result.stdout).get('pid') != os.getpid():
+                failures.append("status did not come from the running instance")
+
+            bare = wall_time([sys.executable, '-c', 'pass'], args.runs)
+            handoff = wall_time([sys.executable, SCRIPT, 'reconnect'], args.runs) - bare
+
+            core.loop.idle_add(core.loop.quit)
+            thread.join(5)
+        devnull.close()
+        print(f"status round trip in process: {round_trip * 1e6:.0f} us")
+        print(f"`kerio-vpn-indicator reconnect` hand-off: +{handoff * 1000:.1f} ms "
+              f"over interpreter start")
+        server.close()
+        core.shutdown()
+        core.loop.close()
+        lock.release()
+        if os.path.exists(server.path):
+            failures.append("control socket left behind")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_fallback(failures)
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
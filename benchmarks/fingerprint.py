@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Fingerprint fetcher benchmark
+Starts a local TLS server with a throwaway self-signed certificate,
+checks the in-process fingerprints against `openssl x509 -fingerprint`
+and the cache behaviour (a cached error is raised with a fresh
+traceback each time), then times a cold fetch, a cached lookup and
+the `openssl s_client | openssl x509` pipeline the editor used to run.
+Needs the openssl command to make the certificate.
+
+    python3 benchmarks/fingerprint.py [--runs 20]
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.fingerprint import FingerprintCache, fetch_certificate  # noqa: E402
+
+
+def make_certificate(directory, days=30):
+    """(certificate path, key path) of a new self-signed certificate"""
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key,
+                    '-out', cert, '-days', str(days), '-subj', '/CN=kerio-test'],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+class TLSListener:
+    """Local TLS server on 127.0.0.1 that waits `delay` seconds before each handshake"""
+
+    def __init__(self, cert, key, delay=0.0, fail=False):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.delay = delay
+        self.fail = fail  # Accept and hang up without a handshake
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.handshake, args=(conn,), daemon=True).start()
+
+    def handshake(self, conn):
+        with conn:
+            if self.delay:
+                time.sleep(self.delay)
+            if self.fail:
+                return
+            try:
+                with self.context.wrap_socket(conn, server_side=True) as tls:
+                    tls.recv(1)
+            except OSError:
+                pass
+
+    def close(self):
+        self.sock.close()
+
+
+def openssl_fingerprint(port):
+    """The pipeline save_config used to run, through a shell"""
+    result = subprocess.run(
+        f'openssl s_client -connect 127.0.0.1:{port} < /dev/null 2>/dev/null'
+        ' | openssl x509 -fingerprint -md5 -noout',
+        shell=True, capture_output=True, text=True, timeout=10)
+    return result.stdout.split('=', 1)[1].strip()
+
+
+def timed(function, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+    if shutil.which('openssl') is None:
+        print("openssl not found, cannot make a test certificate")
+        return 1
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(directory)
+        listener = TLSListener(cert, key)
+        expected = subprocess.run(['openssl', 'x509', '-in', cert, '-noout', '-fingerprint', '-md5'],
+                                  capture_output=True, text=True).stdout.split('=', 1)[1].strip()
+
+        now = [time.time()]
+        cache = FingerprintCache(ttl=60, clock=lambda: now[0])
+        fingerprint = cache.get('127.0.0.1', listener.port)
+        if fingerprint.md5 != expected:
+            failures.append(f"md5 {fingerprint.md5} != openssl {expected}")
+        if fingerprint.not_after is None or not 29 * 86400 < fingerprint.not_after - now[0] < 31 * 86400:
+            failures.append(f"not_after {fingerprint.not_after} is not 30 days out")
+
+        connections = listener.connections
+        cache.get('127.0.0.1', listener.port)
+        if listener.connections != connections:
+            failures.append("cached lookup reconnected")
+        now[0] += 61
+        cache.get('127.0.0.1', listener.port)
+        if listener.connections != connections + 1:
+            failures.append("expired entry was not fetched again")
+        now[0] = fingerprint.not_after - 1
+        cache.invalidate()
+        cache.get('127.0.0.1', listener.port)
+        now[0] += 2  # Past the certificate's expiry, well within the TTL
+        cache.get('127.0.0.1', listener.port)
+        if listener.connections != connections + 3:
+            failures.append("entry outlived the certificate")
+
+        closed = socket.create_server(('127.0.0.1', 0))
+        closed_port = closed.getsockname()[1]
+        closed.close()
+        depths = []
+        for _ in range(3):
+            try:
+                cache.get('127.0.0.1', closed_port)
+                failures.append("fetch from a closed port succeeded")
+            except OSError as e:
+                depths.append(len(traceback.extract_tb(e.__traceback__)))
+        if len(set(depths[1:])) > 1:
+            failures.append(f"a cached error's traceback grows on each lookup: {depths}")
+
+        for failure in failures:
+            print(failure)
+        print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+
+        warm = FingerprintCache()
+        warm.get('127.0.0.1', listener.port)
+        cold_ms = timed(lambda: fetch_certificate('127.0.0.1', listener.port), args.runs)
+        cached_ms = timed(lambda: warm.get('127.0.0.1', listener.port), args.runs)
+        openssl_ms = timed(lambda: openssl_fingerprint(listener.port), max(1, args.runs // 4))
+        print(f"\nopenssl pipeline  {openssl_ms:8.2f} ms")
+        print(f"in-process fetch  {cold_ms:8.2f} ms")
+        print(f"cached lookup     {cached_ms * 1000:8.2f} us")
+        listener.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
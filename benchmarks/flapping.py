@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Flap damping benchmark
+Replays flap traces on the simulated host twice: with debounce and flap
+detection off, which is how the core behaved before, and with the
+[flapping] defaults. In these traces every outage heals on its own, so
+each auto-reconnect is a false one that tore down a recovering tunnel.
+Reports the visible drops, notifications and false reconnects for both
+and checks that blips no longer surface at all. Recorded traces work
+the same way with --trace or --history.
+
+    python3 benchmarks/flapping.py [--trace FILE | --history [FILE]]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from replay import UP, blips, replay  # noqa: E402  (benchmarks/replay.py)
+from kerio_vpn.history import SessionLog  # noqa: E402
+from kerio_vpn.kerioconf import KerioConfig  # noqa: E402
+from kerio_vpn.settings import load_settings  # noqa: E402
+from kerio_vpn.simulation import load_trace, trace_from_sessions  # noqa: E402
+
+
+def self_healing_drops(count, every=40.0, lengths=(5, 12, 20), start=60.0):
+    """kvnet vanishes for longer than the debounce window and comes back by itself"""
+    trace = []
+    for index in range(count):
+        t = start + index * every
+        trace += [(t, 'tunnel_down', {}), (t + lengths[index % len(lengths)], 'tunnel_up', {})]
+    return trace
+
+
+TRACES = {
+    'link blips': UP + blips('link_down', 'link_up', 20, every=60.0),
+    'address blips': UP + blips('address_lost', 'address_added', 20, every=60.0, length=1.0),
+    'self-healing drops': UP + self_healing_drops(15),
+}
+
+
+def settings(damped):
+    result = load_settings(os.devnull)
+    if not damped:
+        result.set('flapping', 'down_after', '0')
+        result.set('flapping', 'enter_changes', '0')
+    return result
+
+
+def measure(trace, config_file, damped):
+    summary, _elapsed, output = replay(trace, config_file, settings=settings(damped))
+    if 'Error in' in output:
+        raise RuntimeError("a callback raised during the replay")
+    return {
+        'drops': summary['transitions'].count('disconnected'),
+        'notifications': len(summary['notifications']),
+        'false reconnects': summary['reconnect_attempts'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trace', help='compare on a JSON-lines trace')
+    parser.add_argument('--history', nargs='?', const='', metavar='FILE',
+                        help='compare on session history (default: your own)')
+    args = parser.parse_args()
+    failures = []
+
+    traces = TRACES
+    try:
+        if args.trace:
+            traces = {os.path.basename(args.trace): load_trace(args.trace)}
+        elif args.history is not None:
+            traces = {'history': trace_from_sessions(SessionLog(args.history or None).records())}
+    except (OSError, ValueError) as e:
+        print(f"Cannot replay: {e}", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['XDG_STATE_HOME'] = directory
+        config_file = os.path.join(directory, 'kerio-kvc.conf')
+        config = KerioConfig.new()
+        config.set('server', 'vpn.example.com')
+        config.save(config_file)
+
+        print(f"{'trace':>20}  {'':<9}{'drops':>7}{'notifications':>15}{'false reconnects':>18}")
+        for name, trace in traces.items():
+            before = measure(trace, config_file, damped=False)
+            after = measure(trace, config_file, damped=True)
+            for label, counts in (('before', before), ('after', after)):
+                print(f"{name if label == 'before' else '':>20}  {label:<9}{counts['drops']:>7}"
+                      f"{counts['notifications']:>15}{counts['false reconnects']:>18}")
+            if args.trace or args.history is not None:
+                continue
+            if any(after[key] > before[key] for key in after):
+                failures.append(f"{name}: worse with damping: {before} -> {after}")
+            if 'blips' in name and (after['drops'] or after['false reconnects']):
+                failures.append(f"{name}: blips still surface: {after}")
+            if after['false reconnects'] >= max(1, before['false reconnects']):
+                failures.append(f"{name}: false reconnects not reduced: {before} -> {after}")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Gateway selection benchmark
+Starts several local TLS listeners that delay their handshakes by known
+amounts (one never completes one), ranks them with GatewaySelector and
+checks the order, that the probes ran concurrently, that a cached
+ranking does not reconnect and that write_gateway moves the config and
+its fingerprint to the winner. Then checks the auto-reconnect path:
+switching is off unless enabled, only candidates with a pinned
+fingerprint are used, and a gateway presenting another certificate
+than its pin is refused. Needs the openssl command to make the test
+certificates.
+
+    python3 benchmarks/gateways.py [--attempts 3]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fingerprint import TLSListener, make_certificate  # noqa: E402  (benchmarks/fingerprint.py)
+from kerio_vpn.fingerprint import get_fingerprint  # noqa: E402
+from kerio_vpn.gateways import (GatewaySelector, UntrustedGateway, parse_fingerprints,  # noqa: E402
+                                write_gateway)
+from kerio_vpn.kerioconf import KerioConfig  # noqa: E402
+from kerio_vpn.settings import load_settings  # noqa: E402
+from kerio_vpn.simulation import Replay  # noqa: E402
+
+DELAYS = (0.08, 0.01, 0.15, 0.04)
+
+
+class MemoryConfig:
+    """Stands in for PrivilegedClient: the config lives in a string"""
+
+    def __init__(self, text):
+        self.text = text
+
+    def get_config(self, path=None):
+        return self.text
+
+    def put_config(self, text, path=None):
+        self.text = text
+
+    def close(self):
+        pass
+
+
+def memory_config(server, fingerprint):
+    config = KerioConfig.new()
+    config.set('server', server)
+    config.set('fingerprint', fingerprint)
+    return MemoryConfig(config.to_string())
+
+
+def check_pins(listeners, impostor, pinned, failures):
+    """write_gateway with known fingerprints: pin, refuse, learn the current one"""
+    fast, slow = listeners[1], listeners[0]
+    fast_result, = GatewaySelector(attempts=1, timeout=1).rank([('127.0.0.1', fast.port)])
+    privileged = memory_config('old.example.com:4090', 'AA:BB')
+
+    fingerprints = {}
+    try:
+        write_gateway(privileged, fast_result, fingerprints=fingerprints)
+        failures.append("switched to a gateway without a known fingerprint")
+    except UntrustedGateway:
+        pass
+    if KerioConfig.parse(privileged.text).get('server') != 'old.example.com:4090':
+        failures.append("a refused switch changed the config")
+    if fingerprints != {('old.example.com', 4090): 'AA:BB'}:
+        failures.append(f"the current pin was not learned: {fingerprints}")
+
+    fingerprints[('127.0.0.1', fast.port)] = pinned.lower()
+    if not write_gateway(privileged, fast_result, fingerprints=fingerprints):
+        failures.append("a pinned gateway was not switched to")
+    if KerioConfig.parse(privileged.text).get('fingerprint') != pinned:
+        failures.append("the pinned fingerprint was not written")
+
+    impostor_result, = GatewaySelector(attempts=1, timeout=1).rank([('127.0.0.1', impostor.port)])
+    fingerprints[('127.0.0.1', impostor.port)] = pinned
+    try:
+        write_gateway(privileged, impostor_result, fingerprints=fingerprints)
+        failures.append("switched to a gateway presenting another certificate than its pin")
+    except UntrustedGateway:
+        pass
+    if KerioConfig.parse(privileged.text).get('server') != f"127.0.0.1:{fast.port}":
+        failures.append("a refused impostor changed the config")
+
+    text = f"127.0.0.1:{slow.port}={pinned.lower()}, gw.example.com=11:22 [2001:db8::1]:4091=33:44"
+    expected = {('127.0.0.1', slow.port): pinned, ('gw.example.com', 4090): '11:22',
+                ('2001:db8::1', 4091): '33:44'}
+    if parse_fingerprints(text) != expected:
+        failures.append(f"parse_fingerprints gave {parse_fingerprints(text)}")
+    for bad in ('gw.example.com', 'gw.example.com=', 'gw.example.com:x=11:22'):
+        try:
+            parse_fingerprints(bad)
+            failures.append(f"parse_fingerprints accepted {bad!r}")
+        except ValueError:
+            pass
+
+
+def check_auto_reconnect(listeners, impostor, pinned, failures):
+    """VPNCore.select_gateway: opt-in, skips unpinned and impostor candidates"""
+    fastest, second, third = (listeners[index] for index in sorted(range(len(DELAYS)),
+                                                                   key=DELAYS.__getitem__)[:3])
+    candidates = ' '.join(f"127.0.0.1:{listener.port}" for listener in (impostor, fastest, second))
+    settings = load_settings(os.devnull)
+    settings.set('gateways', 'candidates', candidates)
+    settings.set('gateways', 'attempts', '1')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run = Replay([], settings=settings)
+    if run.core.gateway_candidates:
+        failures.append("auto-reconnect switches gateways without [gateways] switch = yes")
+    run.close()
+
+    settings.set('gateways', 'switch', 'yes')
+    # The impostor answers fastest with its own certificate; `fastest` has no pin
+    settings.set('gateways', 'fingerprints',
+                 f"127.0.0.1:{impostor.port}={pinned} 127.0.0.1:{second.port}={pinned}")
+    impostor.delay = 0.0
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run = Replay([], settings=settings)
+        run.core.privileged = memory_config(f"127.0.0.1:{third.port}", pinned)
+        chosen = run.core.select_gateway()
+        again = run.core.select_gateway()
+        run.close()
+    if chosen is None or chosen.port != second.port:
+        failures.append(f"auto-reconnect chose {chosen and chosen.address}, expected the "
+                        f"pinned 127.0.0.1:{second.port}")
+    if again is not None:
+        failures.append("selecting again rewrote the config")
+    written = KerioConfig.parse(run.core.privileged.text)
+    if written.get('fingerprint') != pinned:
+        failures.append("auto-reconnect pinned an unverified fingerprint")
+    for listener, reason in ((impostor, 'presents'), (fastest, 'no known fingerprint')):
+        if f"127.0.0.1:{listener.port}: " not in output.getvalue() or reason not in output.getvalue():
+            failures.append(f"skipping 127.0.0.1:{listener.port} ({reason}) was not reported")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--attempts', type=int, default=3)
+    args = parser.parse_args()
+    if shutil.which('openssl') is None:
+        print("openssl not found, cannot make a test certificate")
+        return 1
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['XDG_STATE_HOME'] = directory  # The replayed cores' state cache and history
+        cert, key = make_certificate(directory)
+        listeners = [TLSListener(cert, key, delay=delay) for delay in DELAYS]
+        broken = TLSListener(cert, key, fail=True)
+        candidates = [('127.0.0.1', listener.port) for listener in listeners + [broken]]
+
+        selector = GatewaySelector(attempts=args.attempts, timeout=1)
+        started = time.perf_counter()
+        results = selector.rank(candidates)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            print(result.describe())
+
+        expected = [listeners[index].port for index in sorted(range(len(DELAYS)),
+                                                               key=DELAYS.__getitem__)]
+        if [result.port for result in results[:len(DELAYS)]] != expected:
+            failures.append("ranking does not follow the injected delays")
+        if results[-1].port != broken.port or results[-1].success_rate != 0:
+            failures.append("the failing listener is not ranked last")
+        serial = sum(DELAYS) * args.attempts
+        if elapsed > serial:
+            failures.append(f"probing took {elapsed:.2f}s, no faster than one by one ({serial:.2f}s)")
+        print(f"\nprobed {len(candidates)} gateways x {args.attempts} in {elapsed * 1000:.0f} ms "
+              f"(one by one: at least {serial * 1000:.0f} ms)")
+
+        connections = sum(listener.connections for listener in listeners)
+        started = time.perf_counter()
+        selector.best(candidates)
+        cached = time.perf_counter() - started
+        if sum(listener.connections for listener in listeners) != connections:
+            failures.append("cached ranking reconnected")
+        print(f"cached ranking in {cached * 1e6:.1f} us")
+
+        config = KerioConfig.new()
+        config.set('server', 'old.example.com:4090')
+        config.set('fingerprint', 'AA:BB')
+        privileged = MemoryConfig(config.to_string())
+        best = selector.best(candidates)
+        write_gateway(privileged, best)
+        written = KerioConfig.parse(privileged.text)
+        if written.get('server') != best.address:
+            failures.append(f"config points at {written.get('server')}, not {best.address}")
+        if written.get('fingerprint') != get_fingerprint(best.host, best.port).md5:
+            failures.append("fingerprint was not replaced")
+        if write_gateway(privileged, best):
+            failures.append("writing the same gateway again changed the config")
+
+        pinned = get_fingerprint('127.0.0.1', listeners[0].port).md5
+        other = os.path.join(directory, 'other')
+        os.makedirs(other)
+        impostor = TLSListener(*make_certificate(other), delay=0.3)
+        check_pins(listeners, impostor, pinned, failures)
+        check_auto_reconnect(listeners, impostor, pinned, failures)
+
+        for listener in listeners + [broken, impostor]:
+            listener.close()
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
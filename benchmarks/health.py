@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Health probe check
+Runs probe_tcp and probe_udp against local servers on 127.0.0.1: a TCP
+listener, a closed port, a listener whose backlog is full so the
+handshake never completes, and a UDP echo server that can answer, stay
+silent or send a stale reply first. Checks answers, refusals and
+timeouts, then the HealthStats EWMA: how many consecutive lost rounds
+mark a tunnel degraded and how many answers clear it. Finally replays a
+connection through VPNCore on the simulated host while the echo server
+goes silent, and checks the dead-but-up transition: degraded, notified,
+restarted, connected again. A restart that keeps kvnet up and takes a
+few seconds must not end the outage before a probe answers through the
+restarted tunnel. Also reports the probe round trip.
+
+    python3 benchmarks/health.py
+"""
+
+import argparse
+import contextlib
+import io
+import math
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.commands import CommandResult  # noqa: E402
+from kerio_vpn.health import HealthProber, HealthStats, ProbeTarget, probe_tcp, probe_udp  # noqa: E402
+from kerio_vpn.settings import load_settings  # noqa: E402
+from kerio_vpn.service import UNIT  # noqa: E402
+from kerio_vpn.simulation import Replay  # noqa: E402
+
+TIMEOUT = 0.2
+RESTART = 5.0  # Seconds a slow `systemctl restart` takes
+
+
+class EchoServer:
+    """UDP echo on 127.0.0.1; mode is 'echo', 'silent', 'stale' or 'closed'"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.mode = 'echo'
+        self.received = 0
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(64)
+            except OSError:
+                return
+            if self.mode == 'closed':
+                return
+            self.received += 1
+            if self.mode == 'stale':
+                self.sock.sendto(b'stale!!!', address)
+            if self.mode != 'silent':
+                self.sock.sendto(data, address)
+
+    def close(self):
+        # shutdown() does not wake a blocked recvfrom on UDP; a datagram does
+        self.mode = 'closed'
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'', ('127.0.0.1', self.port))
+        self.thread.join(5)
+        self.sock.close()
+
+
+def closed_port():
+    """A local TCP port nobody listens on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def check_probes(echo, failures):
+    udp = ProbeTarget('udp', '127.0.0.1', echo.port)
+    with socket.socket() as listener, socket.socket() as queued:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(0)
+        tcp = ProbeTarget('tcp', '127.0.0.1', listener.getsockname()[1])
+        rtt = probe_tcp(tcp, TIMEOUT)
+        if rtt is None or not 0 <= rtt < TIMEOUT:
+            failures.append(f"tcp to a listener: {rtt!r}")
+        rtt = probe_tcp(ProbeTarget('tcp', '127.0.0.1', closed_port()), TIMEOUT)
+        if rtt is None:
+            failures.append("tcp to a closed port: a refusal did not count as an answer")
+
+        # One pending connection fills a backlog of 0 (the probes above may
+        # already have); further handshakes go unanswered
+        queued.settimeout(TIMEOUT)
+        queued.connect_ex(listener.getsockname())
+        started = time.monotonic()
+        rtt = probe_tcp(tcp, TIMEOUT)
+        elapsed = time.monotonic() - started
+        if rtt is not None:
+            failures.append(f"tcp to a full backlog answered in {rtt:.3f}s")
+        if not TIMEOUT * 0.9 <= elapsed < TIMEOUT * 3:
+            failures.append(f"tcp timeout of {TIMEOUT}s took {elapsed:.3f}s")
+
+    rtt = probe_udp(udp, TIMEOUT)
+    if rtt is None or not 0 <= rtt < TIMEOUT:
+        failures.append(f"udp echo: {rtt!r}")
+    echo.mode = 'stale'
+    rtt = probe_udp(udp, TIMEOUT)
+    if rtt is None:
+        failures.append("udp echo after a stale reply: the real answer was not waited for")
+    echo.mode = 'silent'
+    started = time.monotonic()
+    rtt = probe_udp(udp, TIMEOUT)
+    elapsed = time.monotonic() - started
+    if rtt is not None:
+        failures.append(f"udp to a silent server answered in {rtt:.3f}s")
+    if not TIMEOUT * 0.9 <= elapsed < TIMEOUT * 3:
+        failures.append(f"udp timeout of {TIMEOUT}s took {elapsed:.3f}s")
+    echo.mode = 'echo'
+
+
+def rounds_to_degrade(alpha, threshold):
+    """Consecutive lost rounds that take the loss EWMA from 0 to the threshold"""
+    return math.ceil(math.log(1 - threshold) / math.log(1 - alpha))
+
+
+def check_stats(failures):
+    for alpha, threshold in ((0.3, 0.5), (0.5, 0.5), (0.2, 0.7)):
+        stats = HealthStats(alpha=alpha, loss_threshold=threshold)
+        # Every probe lost from the start: still not degraded before min_samples
+        for count in range(1, stats.min_samples):
+            stats.add(None)
+            if stats.degraded:
+                failures.append(f"alpha {alpha}: degraded after {count} samples, "
+                                f"below min_samples {stats.min_samples}")
+        stats.reset()
+
+        for _ in range(10):
+            stats.add(0.01)
+        expected = rounds_to_degrade(alpha, threshold)
+        lost = 0
+        while not stats.degraded and lost < 100:
+            stats.add(None)
+            lost += 1
+        if lost != expected:
+            failures.append(f"alpha {alpha}, threshold {threshold}: degraded after "
+                            f"{lost} lost probes, expected {expected}")
+        answered = 0
+        while stats.degraded and answered < 100:
+            stats.add(0.01)
+            answered += 1
+        if answered != 1:
+            failures.append(f"alpha {alpha}: {answered} answers to clear a fresh degradation")
+        if stats.rtt != 0.01 or stats.describe() != f"RTT 10 ms, loss {stats.loss * 100:.0f}%":
+            failures.append(f"lost probes moved the RTT: {stats.describe()}")
+
+    stats = HealthStats(rtt_threshold=0.1)
+    for rtt in (0.05, 0.3, 0.3, 0.3):
+        stats.add(rtt)
+    if not stats.degraded:
+        failures.append(f"an RTT of {stats.rtt:.3f}s over 0.1s is not degraded")
+
+
+def check_dead_but_up(echo, failures):
+    """The tunnel stays up but the echo server goes silent: degraded, then restarted"""
+    settings = load_settings(os.devnull)
+    settings.set('health', 'targets', f"udp:127.0.0.1:{echo.port}")
+    settings.set('health', 'timeout', str(TIMEOUT))
+    interval = settings.getint('health', 'interval')
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run = Replay([(0, 'tunnel_up', {})], settings=settings)
+        run.core.health.device = None  # No kvnet here; 127.0.0.1 routes over lo
+        run.run(settle=interval * 5)
+        healthy = run.summary()
+        echo.mode = 'silent'
+        run.loop.advance(interval * (rounds_to_degrade(0.3, 0.5) + 3))
+        dead = run.summary()
+        echo.mode = 'echo'
+        run.loop.advance(600)
+        recovered = run.summary()
+        run.close()
+
+    if 'Health probe error' in output.getvalue() or 'Error in' in output.getvalue():
+        failures.append("a health probe raised during the replay")
+    if healthy['transitions'] != ['connected'] or echo.received < 4:
+        failures.append(f"answered probes: {healthy['transitions']}, "
+                        f"{echo.received} probes received")
+    if 'degraded' not in dead['transitions'][1:]:
+        failures.append(f"silent echo server: no degraded transition in {dead['transitions']}")
+    if 'Kerio VPN Degraded' not in dead['notifications']:
+        failures.append("silent echo server: no degraded notification")
+    if 'restart' not in dead['actions']:
+        failures.append(f"silent echo server: the tunnel was not restarted ({dead['actions']})")
+    if recovered['transitions'][-1] != 'connected':
+        failures.append(f"echo server back: ended {recovered['transitions'][-1]}")
+
+
+class DeferredExecutor:
+    """CommandRunner executor whose jobs run `delay` simulated seconds later"""
+
+    def __init__(self, loop, delay):
+        self.loop = loop
+        self.delay = delay
+
+    def submit(self, fn, *args):
+        def run():
+            fn(*args)
+            return False  # Once
+
+        self.loop.timeout_add(int(self.delay * 1000), run)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def check_restart_outage(echo, failures):
+    """A slow restart that keeps kvnet: the outage lasts until a probe answers again"""
+    settings = load_settings(os.devnull)
+    settings.set('health', 'targets', f"udp:127.0.0.1:{echo.port}")
+    settings.set('health', 'timeout', str(TIMEOUT))
+    interval = settings.getint('health', 'interval')
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run = Replay([(0, 'tunnel_up', {})], settings=settings)
+        run.core.health.device = None
+        run.run(settle=interval * 5)
+        policy = run.core.reconnect_policy
+        restarts = []
+        play = run.host.systemctl
+
+        def restart_in_place(action):
+            if action != 'restart':
+                return play(action)
+            restarts.append(run.clock())
+            return CommandResult(['systemctl', action, UNIT], 0)
+
+        run.host.systemctl = restart_in_place
+        run.core.commands.executor = DeferredExecutor(run.loop, RESTART)
+        echo.mode = 'silent'
+        outage_start = None
+        deadline = run.clock() + 3600
+        while not restarts and run.clock() < deadline:
+            run.loop.advance(1)
+            outage_start = outage_start or policy.outage_start
+        run.loop.advance(RESTART + interval * 3)  # Restarted, still not answering
+        still_open = policy.in_outage
+        echo.mode = 'echo'
+        answered = run.clock()
+        run.loop.advance(600)
+        times = list(policy.reconnect_times)
+        run.close()
+
+    if not restarts or outage_start is None:
+        failures.append("slow restart: the silent tunnel was not restarted")
+        return
+    if not still_open:
+        failures.append(f"slow restart: the outage ended before any probe answered ({times})")
+    if len(times) != 1 or times[0] < answered - outage_start:
+        failures.append(f"slow restart: reconnect times {times}, expected one of at least "
+                        f"{answered - outage_start:.0f}s")
+
+
+def time_probes(echo, runs):
+    """Median microseconds per UDP echo probe"""
+    target = ProbeTarget('udp', '127.0.0.1', echo.port)
+    prober = HealthProber([target], HealthStats(), device=None, timeout=1.0)
+    samples = []
+    for _ in range(runs):
+        results = prober.probe_round()
+        prober.record(results)
+        samples.append(results[0] if results[0] is not None else 1.0)
+    return statistics.median(samples) * 1e6, prober.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=500, help='probes for the round trip')
+    args = parser.parse_args()
+    failures = []
+
+    echo = EchoServer()
+    try:
+        check_probes(echo, failures)
+        check_stats(failures)
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ['XDG_STATE_HOME'] = directory  # The replayed cores' state cache and history
+            check_dead_but_up(echo, failures)
+            check_restart_outage(echo, failures)
+        rtt, stats = time_probes(echo, args.runs)
+        print(f"udp probe round trip: {rtt:.0f} us median ({stats.describe()})")
+        if stats.degraded:
+            failures.append(f"a local echo server looks degraded: {stats.describe()}")
+    finally:
+        echo.close()
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
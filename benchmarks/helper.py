@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Privileged helper check
+Runs kerio-vpn-helper unprivileged against a scratch root, with `echo`
+or a slow stand-in script as systemctl, and talks to it through the
+same clients the indicator and the editor use. Checks that peers
+failing the SO_PEERCRED test are turned away, that put_config replaces
+etc/kerio-kvc.conf atomically with mode 600 and rejects invalid XML,
+that only start/stop/restart reach systemctl, and that the client never
+sends a request twice: it retries when a restarted helper dropped the
+connection, not when an answer was merely slow. Also reports the
+request round trip. Runs anywhere, no root, sudo or systemd needed.
+
+    python3 benchmarks/helper.py
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import socket
+import stat
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.helper import (HelperClient, HelperError, HelperServer, HelperService,  # noqa: E402
+                              HelperTimeout, PrivilegedClient, peer_credentials)
+from kerio_vpn.kerioconf import CONFIG_FILE, KerioConfig  # noqa: E402
+from kerio_vpn.service import UNIT  # noqa: E402
+
+SLOW_SYSTEMCTL = """\
+#!/bin/sh
+sleep 1
+echo "$@" >> "$(dirname "$0")/systemctl.log"
+"""
+
+
+def start_helper(socket_path, root, systemctl):
+    """`python3 -m kerio_vpn.helper` on a scratch root; returns the process once it listens"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'kerio_vpn.helper', '--socket', socket_path,
+         '--root', root, '--systemctl', systemctl],
+        cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    # The socket file appears at bind(), a moment before listen()
+    while not listening(socket_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError(f"helper did not start (exit status {process.poll()})")
+        time.sleep(0.01)
+    return process
+
+
+def listening(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+            return True
+        except OSError:
+            return False
+
+
+def stop_helper(process):
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def check_peer_rejection(directory):
+    """A peer whose SO_PEERCRED uid and groups are not allowed gets refused and hung up on"""
+    failures = []
+    socket_path = os.path.join(directory, 'strict.sock')
+    server = HelperServer(HelperService(root=directory, systemctl=('echo',)),
+                          socket_path=socket_path)
+    # Unprivileged, the only peer we can be is ourselves: allow nobody
+    server.allowed_uids = set()
+    server.allowed_gids = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread.start()
+        client = HelperClient(socket_path, timeout=5)
+        try:
+            client.call('status')
+            failures.append("an unauthorized peer got an answer")
+        except HelperError as e:
+            if str(e) != 'permission denied':
+                failures.append(f"unexpected refusal {e!r}")
+        if client.sock is not None:
+            failures.append("the client kept the refused connection")
+        client.close()
+
+        server.shutdown()
+    thread.join(5)
+
+    # The credentials the server checks are the other end's
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        pid, uid, _gid = peer_credentials(ours)
+    if (pid, uid) != (os.getpid(), os.geteuid()):
+        failures.append(f"SO_PEERCRED reported pid {pid} uid {uid}")
+    return failures
+
+
+def check_config(client, root):
+    """put_config writes a 0600 file by rename and leaves it alone on invalid XML"""
+    failures = []
+    path = os.path.join(root, CONFIG_FILE.lstrip('/'))
+    if client.get_config() is not None:
+        failures.append("get_config returned text before any config existed")
+
+    config = KerioConfig.new()
+    config.set('server', 'vpn.example.com')
+    for server in ('vpn.example.com', 'vpn2.example.com'):
+        config.set('server', server)
+        inode = os.stat(path).st_ino if os.path.exists(path) else None
+        client.put_config(config.to_string())
+        info = os.stat(path)
+        if stat.S_IMODE(info.st_mode) != 0o600:
+            failures.append(f"config written with mode {stat.S_IMODE(info.st_mode):o}")
+        if inode is not None and info.st_ino == inode:
+            failures.append("config rewritten in place instead of replaced")
+        if client.get_config() != config.to_string():
+            failures.append("get_config does not return what put_config wrote")
+    leftovers = [name for name in os.listdir(os.path.dirname(path))
+                 if name != os.path.basename(path)]
+    if leftovers:
+        failures.append(f"temporary files left next to the config: {leftovers}")
+
+    written = client.get_config()
+    for text in ('<config><connection>', 42):
+        try:
+            client.call('put_config', text=text)
+            failures.append(f"put_config accepted {text!r}")
+        except HelperError:
+            pass
+    if client.get_config() != written:
+        failures.append("a refused put_config changed the config")
+    return failures
+
+
+def check_actions(client):
+    """start/stop/restart reach systemctl with the unit; nothing else does"""
+    failures = []
+    for action in ('start', 'stop', 'restart'):
+        result = client.systemctl(action)
+        if result['returncode'] != 0 or result['stdout'] != f"{action} {UNIT}\n":
+            failures.append(f"systemctl {action}: {result}")
+    for action in ('enable', 'daemon-reload', 'start; reboot', '', None):
+        try:
+            result = client.systemctl(action)
+            failures.append(f"systemctl {action!r} was not refused: {result}")
+        except HelperError as e:
+            if 'unsupported action' not in str(e):
+                failures.append(f"systemctl {action!r}: unexpected error {e}")
+    try:
+        client.call('shutdown')
+        failures.append("an unknown method was answered")
+    except HelperError:
+        pass
+    return failures
+
+
+def check_no_resend(directory, root):
+    """A helper restart is retried once; a slow answer is a timeout and never sent again"""
+    failures = []
+    socket_path = os.path.join(directory, 'helper.sock')
+    script = os.path.join(directory, 'slow-systemctl')
+    log = os.path.join(directory, 'systemctl.log')
+    with open(script, 'w') as f:
+        f.write(SLOW_SYSTEMCTL)
+    os.chmod(script, 0o755)
+
+    process = start_helper(socket_path, root, 'echo')
+    client = HelperClient(socket_path, timeout=5)
+    try:
+        client.systemctl('start')
+    finally:
+        stop_helper(process)
+    process = start_helper(socket_path, root, script)
+    try:
+        try:
+            client.systemctl('stop')  # The old connection is dead: sent again on a new one
+        except HelperError as e:
+            failures.append(f"no reconnect after a helper restart: {e}")
+        client.close()
+
+        privileged = PrivilegedClient(socket_path)
+        privileged.helper.timeout = 0.3
+        sudo_calls = []
+        # A fallback would run a real sudo; record it instead
+        privileged._sudo = lambda args, timeout=10: sudo_calls.append(args) or (
+            subprocess.CompletedProcess(['sudo'] + args, 1, '', 'not run'))
+        result = privileged.systemctl('restart')
+        if not result.timed_out:
+            failures.append(f"a slow restart was not reported as timed out: "
+                            f"{result.describe_error()}")
+        if sudo_calls:
+            failures.append(f"a slow helper answer fell back to sudo: {sudo_calls}")
+        try:
+            privileged.helper.call('systemctl', action='restart')
+            failures.append("a slow restart returned instead of timing out")
+        except HelperTimeout:
+            pass
+        except HelperError as e:
+            failures.append(f"a slow restart failed instead of timing out: {e}")
+        privileged.close()
+        time.sleep(2.5)  # Let every restart that got through finish
+    finally:
+        stop_helper(process)
+
+    with open(log) as f:
+        calls = f.read().splitlines()
+    expected = [f"stop {UNIT}", f"restart {UNIT}", f"restart {UNIT}"]
+    if calls != expected:
+        failures.append(f"systemctl ran {calls}, expected {expected}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200, help='requests for the round trip')
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = os.path.join(directory, 'root')
+        os.makedirs(os.path.join(root, 'etc'))
+        socket_path = os.path.join(directory, 'helper.sock')
+
+        failures += [f"peers: {failure}" for failure in check_peer_rejection(directory)]
+
+        process = start_helper(socket_path, root, 'echo')
+        client = HelperClient(socket_path, timeout=5)
+        try:
+            failures += [f"config: {failure}" for failure in check_config(client, root)]
+            failures += [f"actions: {failure}" for failure in check_actions(client)]
+            samples = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                client.get_config()
+                samples.append(time.perf_counter() - started)
+            print(f"helper round trip: {statistics.median(samples) * 1e6:.0f} us median")
+        finally:
+            client.close()
+            stop_helper(process)
+
+        failures += [f"resend: {failure}" for failure in check_no_resend(directory, root)]
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
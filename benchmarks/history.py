@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Session history check
+Writes small sessions.jsonl fixtures with known answers and checks the
+summary behind `kerio-vpn-indicator history`: uptime this week with
+sessions clipped at the week start and at now, mean time between drops
+over lost and degraded sessions only, and the nearest-rank p95 of the
+reconnect times. Then corrupts the log the ways a crash or a bad disk
+does (a truncated last line, binary junk, JSON that is not a session)
+and checks that those lines are skipped, not fatal. Then checks the
+session not in the log yet: a running instance's, asked over a stand-in
+control socket, and one a crashed core left checkpointed, which the
+next core logs when it starts. Reports how long a fully rotated log
+takes to summarize.
+
+    python3 benchmarks/history.py
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn import history  # noqa: E402
+from kerio_vpn.control import socket_path  # noqa: E402
+from kerio_vpn.history import (CHECKPOINT_INTERVAL, SessionLog, percentile,  # noqa: E402
+                               summarize, week_start)
+from kerio_vpn.simulation import Replay  # noqa: E402
+
+HOUR = 3600.0
+
+
+def session(connect, disconnect, cause='lost', reconnect_time=None):
+    return {'connect': connect, 'disconnect': disconnect, 'vpn_ip': '10.8.0.2',
+            'server': 'vpn.example.com', 'reconnect_attempts': 1,
+            'reconnect_time': reconnect_time, 'cause': cause, 'rx_bytes': 0, 'tx_bytes': 0}
+
+
+def fixture(now):
+    """Sessions around the start of this week, with the summary they must give"""
+    start = week_start(now)
+    records = [
+        session(start - 2 * HOUR, start + 1 * HOUR, 'lost'),  # 1 h inside the week
+        session(start + 2 * HOUR, start + 4 * HOUR, 'manual', reconnect_time=0.4),
+        session(start + 5 * HOUR, start + 20 * HOUR, 'degraded', reconnect_time=2.0),  # Ends after now
+    ]
+    records += [session(start - 100 * HOUR + index, start - 100 * HOUR + index + 0.5, 'manual',
+                        reconnect_time=index / 10) for index in range(1, 18)]
+    expected = {
+        'sessions': 20,
+        'drops': 2,
+        'uptime_week_pct': 100 * (1 + 2 + 5) / 10,  # now is 10 h into the week
+        # Whole sessions count here, clipped or not: 3 + 2 + 15 h and 17 half seconds
+        'mtbd_seconds': ((3 + 2 + 15) * HOUR + 17 * 0.5) / 2,
+        # 19 reconnect times, rank ceil(0.95 * 19) = 19: the largest, 2.0 s
+        'p95_reconnect_ms': 2000.0,
+    }
+    return records, expected
+
+
+def compare(failures, label, summary, expected):
+    for key, value in expected.items():
+        got = summary.get(key)
+        if isinstance(value, float) and isinstance(got, float):
+            if abs(got - value) > 1e-6 * max(1.0, abs(value)):
+                failures.append(f"{label}: {key} {got!r}, expected {value!r}")
+        elif got != value:
+            failures.append(f"{label}: {key} {got!r}, expected {value!r}")
+
+
+def check_math(failures):
+    now = week_start(time.time()) + 10 * HOUR
+    records, expected = fixture(now)
+    compare(failures, "fixture", summarize(records, now=now), expected)
+
+    empty = summarize([], now=now)
+    compare(failures, "no sessions", empty, {'sessions': 0, 'drops': 0, 'uptime_week_pct': 0.0,
+                                             'mtbd_seconds': None, 'p95_reconnect_ms': None})
+    no_drops = [session(now - 2 * HOUR, now - HOUR, 'manual')]
+    compare(failures, "no drops", summarize(no_drops, now=now),
+            {'drops': 0, 'mtbd_seconds': None, 'uptime_week_pct': 10.0})
+    at_week_start = summarize([session(now - HOUR, now)], now=week_start(now))
+    compare(failures, "now at the week start", at_week_start, {'uptime_week_pct': 0.0})
+
+    for values, pct, expected_value in (([5], 95, 5), (list(range(1, 21)), 95, 19),
+                                        (list(range(1, 21)), 50, 10), (list(range(100, 0, -1)), 95, 95),
+                                        (list(range(1, 21)), 100, 20), (list(range(1, 21)), 0, 1)):
+        got = percentile(values, pct)
+        if got != expected_value:
+            failures.append(f"p{pct} of {len(values)} values: {got}, expected {expected_value}")
+
+
+def check_corrupt(directory, failures):
+    """Damaged lines in the live log and a rotated one are skipped"""
+    now = week_start(time.time()) + 10 * HOUR
+    records, expected = fixture(now)
+    path = os.path.join(directory, 'sessions.jsonl')
+    lines = [json.dumps(record).encode() for record in records]
+    junk = [
+        b'',
+        b'\x00\x00\x00\x00',  # Zero-filled blocks after a crash
+        b'\xff\xfe binary \x80\x81',
+        b'[1, 2, 3]',
+        b'42',
+        b'"connect"',
+        b'null',
+        b'{"connect": 1700000000}',  # No disconnect
+        b'{"connect": "yesterday", "disconnect": 1700000000}',
+        b'{"connect": 1700000000, "disconnect": 1700000100, "reconnect_time": "fast"}',
+        b'{"connect": true, "disconnect": 1700000100}',
+    ]
+    with open(f"{path}.1", 'wb') as f:
+        f.write(b'\n'.join(lines[:10] + junk[:6]) + b'\n')
+    with open(path, 'wb') as f:
+        f.write(b'\n'.join(junk[6:] + lines[10:]) + b'\n')
+        f.write(json.dumps(records[0]).encode()[:25])  # The last write was cut short
+
+    log = SessionLog(path)
+    try:
+        loaded = log.records()
+    except Exception as e:
+        failures.append(f"records() raised {e!r} on a damaged log")
+        return
+    if loaded != records:
+        failures.append(f"{len(loaded)} records read from a damaged log, expected the "
+                        f"{len(records)} intact ones in order")
+    try:
+        compare(failures, "damaged log", summarize(loaded, now=now), expected)
+    except Exception as e:
+        failures.append(f"summarize() raised {e!r} on what records() returned")
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        status = history.main(['--file', path, '--json'])
+    if status != 0 or json.loads(output.getvalue())['sessions'] != len(records):
+        failures.append(f"`history --json` on a damaged log: {status} {output.getvalue()!r}")
+
+    log.append(records[1])
+    log.flush()
+    if log.records()[-1] != records[1]:
+        failures.append("a record appended after a truncated line was lost")
+
+
+class RunningInstance:
+    """Control socket of a running tray that answers every request with `state`"""
+
+    def __init__(self, state):
+        self.state = state
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(socket_path())
+        self.sock.listen(4)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn, conn.makefile('rwb') as f:
+                for line in f:
+                    answer = {'id': json.loads(line)['id'], 'result': self.state}
+                    f.write(json.dumps(answer).encode() + b'\n')
+                    f.flush()
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+        os.remove(socket_path())
+        self.thread.join(5)
+
+
+def history_json(argv):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        status = history.main(argv + ['--json'])
+    return status, json.loads(output.getvalue())
+
+
+def check_current(directory, failures):
+    """The session in progress counts, from the running instance or a checkpoint"""
+    os.environ['XDG_STATE_HOME'] = os.path.join(directory, 'state')
+    os.environ['XDG_RUNTIME_DIR'] = directory
+    log = SessionLog()
+    now = time.time()
+    log.append(session(now - 30 * 86400, now - 29 * 86400, 'lost', reconnect_time=1.0))
+    log.flush()
+
+    # A week-long connection that is still up
+    since = now - 7 * 86400
+    instance = RunningInstance({'connected': True, 'connected_since': since})
+    try:
+        _status, summary = history_json([])
+    finally:
+        instance.close()
+    if summary['sessions'] != 2 or summary['connected_since'] != since:
+        failures.append(f"running instance: {summary['sessions']} sessions, "
+                        f"connected since {summary['connected_since']}, expected 2 and {since}")
+    if summary['uptime_week_pct'] < 99.9:
+        failures.append(f"connected all week, uptime shown as {summary['uptime_week_pct']:.1f}%")
+
+    instance = RunningInstance({'connected': False, 'connected_since': None})
+    try:
+        _status, summary = history_json([])
+    finally:
+        instance.close()
+    if summary['sessions'] != 1 or summary['connected_since'] is not None:
+        failures.append(f"running but disconnected: {summary}")
+
+    # A core that crashed mid-session, then the next one starting
+    with contextlib.redirect_stdout(io.StringIO()):
+        crashed = Replay([(0, 'tunnel_up', {})])
+        crashed.run(settle=CHECKPOINT_INTERVAL * 3 + 10)  # Never closed, as after a kill
+    checkpoint = log.checkpointed()
+    if checkpoint is None or checkpoint['cause'] != 'interrupted':
+        failures.append(f"no checkpoint of the open session: {checkpoint}")
+        return
+    if crashed.clock() - checkpoint['disconnect'] > CHECKPOINT_INTERVAL:
+        failures.append("the checkpoint is older than one interval")
+    _status, summary = history_json([])
+    if summary['sessions'] != 2 or summary['connected_since'] is not None:
+        failures.append(f"no instance, a checkpoint left: {summary}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        restarted = Replay([(0, 'tunnel_up', {})])
+        restarted.run(settle=60)
+        restarted.close()
+    records = log.records()
+    if [record['cause'] for record in records] != ['lost', 'interrupted', 'exit']:
+        failures.append(f"after a crash and a restart the log holds {[r['cause'] for r in records]}")
+    elif records[1] != checkpoint:
+        failures.append(f"the crashed session was logged as {records[1]}, not {checkpoint}")
+    if os.path.exists(log.checkpoint_path):
+        failures.append("a checkpoint outlived its session")
+
+
+def time_summary(directory):
+    """A fully rotated log: (records, milliseconds to read and summarize)"""
+    path = os.path.join(directory, 'rotated', 'sessions.jsonl')
+    log = SessionLog(path)
+    now = time.time()
+    t = now - 365 * 86400
+    while len(log.files()) <= log.keep:
+        for _ in range(500):
+            log.append(session(t, t + 3000, 'lost', reconnect_time=1.5))
+            t += 3600
+        log.flush()
+    started = time.perf_counter()
+    records = log.records()
+    summarize(records, now=now)
+    return len(records), (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+    failures = []
+
+    check_math(failures)
+    with tempfile.TemporaryDirectory() as directory:
+        check_corrupt(directory, failures)
+        check_current(directory, failures)
+        count, elapsed = time_summary(directory)
+    print(f"summary of a fully rotated log: {count} sessions in {elapsed:.0f} ms")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
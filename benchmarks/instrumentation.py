@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Instrumentation overhead benchmark
+Runs VPNCore.update_status on the pure-Python loop with a fake service
+and compares instrumentation disabled, enabled and the bare method in
+interleaved rounds. Disabled must be indistinguishable from bare: no
+wrappers installed and a median per-call difference inside the noise
+between bare rounds. Then sends SIGUSR1 and checks the JSON snapshot.
+Runs anywhere, no systemd or PyGObject needed.
+
+    python3 benchmarks/instrumentation.py [--calls 20000] [--rounds 15]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.core import VPNCore  # noqa: E402
+from kerio_vpn.instrument import dump_path  # noqa: E402
+from kerio_vpn.kerioconf import KerioConfig  # noqa: E402
+from kerio_vpn.mainloop import SelectorLoop  # noqa: E402
+from kerio_vpn.settings import load_settings  # noqa: E402
+
+WRAPPED = ('update_status', 'check_interface', 'schedule_auto_reconnect', 'auto_reconnect')
+
+
+class FakeService:
+    """kerio-kvc.service that is always active and never spawns anything"""
+
+    available = True
+    spawned = 0
+    on_change = None
+
+    def status(self):
+        return True, 'active'
+
+
+def make_core(instrument, config_file):
+    settings = load_settings(os.devnull)
+    settings.set('diagnostics', 'instrument', 'yes' if instrument else 'no')
+    loop = SelectorLoop()
+    return VPNCore(loop, settings=settings, service=FakeService(),
+                   notify=lambda category, title, message: None,
+                   config_file=config_file)
+
+
+def per_call(fn, calls):
+    """Seconds per call of fn over calls calls"""
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=15)
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['XDG_STATE_HOME'] = directory
+        os.environ['XDG_RUNTIME_DIR'] = directory
+        config_file = os.path.join(directory, 'kerio-kvc.conf')
+        config = KerioConfig.new()
+        config.set('server', 'vpn.example.com')
+        config.save(config_file)
+        disabled = make_core(False, config_file)
+        enabled = make_core(True, config_file)
+
+        leaked = [name for name in WRAPPED if name in vars(disabled)]
+        if leaked or 'subprocess' in vars(disabled.commands) or 'timeout_add' in vars(disabled.loop):
+            failures.append(f"disabled instrumentation installed wrappers: {leaked}")
+
+        # update_status prints a line per check; keep the terminal out of the timings
+        samples = {'bare': [], 'bare again': [], 'disabled': [], 'enabled': []}
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            bare = VPNCore.update_status.__get__(disabled)  # The class function, never wrapped
+            for _round in range(args.rounds):
+                samples['bare'].append(per_call(bare, args.calls))
+                samples['disabled'].append(per_call(disabled.update_status, args.calls))
+                samples['enabled'].append(per_call(enabled.update_status, args.calls))
+                samples['bare again'].append(per_call(bare, args.calls))
+
+        medians = {name: statistics.median(values) for name, values in samples.items()}
+        for name, value in medians.items():
+            print(f"{name:>10}: {value * 1e6:7.3f} us/call")
+        noise = abs(medians['bare'] - medians['bare again'])
+        disabled_overhead = medians['disabled'] - min(medians['bare'], medians['bare again'])
+        enabled_overhead = medians['enabled'] - min(medians['bare'], medians['bare again'])
+        print(f"disabled overhead {disabled_overhead * 1e9:+.0f} ns/call "
+              f"(noise between bare rounds {noise * 1e9:.0f} ns), "
+              f"enabled overhead {enabled_overhead * 1e9:+.0f} ns/call")
+        tolerance = max(noise, 0.02 * medians['bare'])
+        if disabled_overhead > tolerance:
+            failures.append(f"disabled instrumentation measurable: {disabled_overhead * 1e9:.0f} ns/call")
+
+        status = enabled.instrumentation.histograms.get('update_status')
+        if status is None or status.count != args.calls * args.rounds:
+            failures.append("enabled instrumentation missed status checks")
+
+        # SIGUSR1 is handled on the loop, like GLib.unix_signal_add does in the tray
+        enabled.start()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            os.kill(os.getpid(), signal.SIGUSR1)
+            deadline = time.monotonic() + 5
+            while not os.path.exists(dump_path()) and time.monotonic() < deadline:
+                enabled.loop.iterate()
+        try:
+            with open(dump_path()) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            failures.append(f"no diagnostics after SIGUSR1: {e}")
+        else:
+            print(f"snapshot: {snapshot['open_fds']} fds, {snapshot['live_sources']} sources, "
+                  f"{snapshot['rss_bytes'] / 1e6:.1f} MB RSS, "
+                  f"update_status p95 <= {snapshot['histograms']['update_status']['p95']} s")
+            for key in ('open_fds', 'live_sources', 'rss_bytes', 'state', 'histograms'):
+                if snapshot.get(key) is None:
+                    failures.append(f"snapshot lacks {key}")
+            if snapshot['state'].get('subprocess_spawns') != 0:
+                failures.append("the fake service spawned processes")
+
+        for core in (disabled, enabled):
+            core.shutdown()
+            core.loop.close()
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Journal follower benchmark
+Feeds a JSON journal stream through a fake journalctl into
+JournalFollower on the pure-Python loop, then checks that the ring
+buffer stays bounded, that memory stays flat as the stream grows, and
+that filtering and "last disconnect" find the right entries. Reports
+parse throughput. Runs anywhere, no journald or PyGObject needed.
+
+    python3 benchmarks/journal_viewer.py [--entries 200000] [--capacity 10000]
+    python3 benchmarks/journal_viewer.py --replay recorded.json
+
+A recorded stream comes from `journalctl -u kerio-kvc.service -o json > recorded.json`.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.journal import JournalFollower  # noqa: E402
+from kerio_vpn.mainloop import SelectorLoop  # noqa: E402
+
+MESSAGES = (
+    (6, "Connecting to vpn.example.com:4090"),
+    (6, "Connected, assigned address 10.1.2.3"),
+    (7, "Keepalive sent"),
+    (4, "Server did not answer keepalive, retrying"),
+    (3, "Connection lost: timed out"),
+    (5, "Reconnecting in 5 seconds"),
+    (6, "Routing table updated"),
+)
+
+# Replays a file of JSON lines and exits; the arguments journalctl would get are ignored
+FAKE_JOURNALCTL = '''\
+import sys
+with open(sys.argv[1], 'rb') as f:
+    while True:
+        chunk = f.read(1 << 16)
+        if not chunk:
+            break
+        sys.stdout.buffer.write(chunk)
+'''
+
+
+def generate(path, entries, seed=1):
+    """Write a synthetic kerio-kvc journal; returns the message of the last disconnect"""
+    rng = random.Random(seed)
+    now = int(time.time() * 1000000)
+    last_disconnect = None
+    with open(path, 'w') as f:
+        for index in range(entries):
+            priority, message = rng.choice(MESSAGES)
+            message = f"{message} #{index}"
+            if 'lost' in message:
+                last_disconnect = message
+            record = {'__REALTIME_TIMESTAMP': str(now + index * 1000), 'PRIORITY': str(priority),
+                      'SYSLOG_IDENTIFIER': 'kvc', '_PID': '1234', 'MESSAGE': message}
+            if index % 1000 == 0:
+                record['MESSAGE'] = list(message.encode()) + [0xff]  # Not UTF-8
+            f.write(json.dumps(record) + '\n')
+    return last_disconnect
+
+
+def follow(stream, capacity):
+    """Run the follower over stream; returns (follower, seconds, peak traced bytes)"""
+    loop = SelectorLoop()
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as script:
+        script.write(FAKE_JOURNALCTL)
+    tracemalloc.start()
+    started = time.perf_counter()
+    follower = JournalFollower(loop, lambda entries: None, capacity=capacity,
+                               command=(sys.executable, script.name, stream),
+                               on_exit=lambda returncode: loop.quit())
+    loop.run()
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    loop.close()
+    os.unlink(script.name)
+    return follower, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--capacity', type=int, default=10000)
+    parser.add_argument('--replay', help='recorded `journalctl -o json` output to feed instead')
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.replay:
+            follower, elapsed, peak = follow(args.replay, args.capacity)
+            print(f"{follower.buffer.total} entries in {elapsed:.2f}s, "
+                  f"{follower.buffer.total / elapsed:,.0f}/s, peak {peak / 1e6:.1f} MB")
+            last = follower.buffer.last_disconnect()
+            print(f"last disconnect: {last.format_time() + ' ' + last.message if last else 'none'}")
+            return 0
+
+        peaks = []
+        for entries in (args.entries // 10, args.entries):
+            stream = os.path.join(directory, f'journal-{entries}.json')
+            expected_disconnect = generate(stream, entries)
+            follower, elapsed, peak = follow(stream, args.capacity)
+            buffer = follower.buffer
+            peaks.append(peak)
+            print(f"{entries:8} entries: {elapsed:6.2f}s, {entries / elapsed:9,.0f} entries/s, "
+                  f"{len(buffer)} buffered, peak {peak / 1e6:6.1f} MB")
+
+            if buffer.total != entries:
+                failures.append(f"{entries}: parsed {buffer.total} entries")
+            if len(buffer) != min(entries, args.capacity):
+                failures.append(f"{entries}: {len(buffer)} entries buffered, capacity {args.capacity}")
+            last = buffer.last_disconnect()
+            if last is None or last.message != expected_disconnect:
+                failures.append(f"{entries}: last disconnect is {last.message if last else None!r}")
+            matches = buffer.filter('KEEPALIVE')
+            if not matches or any('keepalive' not in entry.message.lower() for entry in matches):
+                failures.append(f"{entries}: case-insensitive filter is wrong")
+
+        # Ten times the stream may not need much more memory once the ring is full
+        if args.entries // 10 >= args.capacity and peaks[1] > peaks[0] * 1.5:
+            failures.append(f"memory grew with the stream: {peaks[0] / 1e6:.1f} -> {peaks[1] / 1e6:.1f} MB")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+OpenMetrics check
+Renders the metrics endpoint from realistic and awkward snapshots and
+validates the text against the OpenMetrics rules Prometheus enforces:
+one TYPE and at most one HELP per family ahead of its samples, families
+not interleaved, counters exposed as <name>_total under a family name
+without the suffix, histograms with ascending `le` buckets, cumulative
+counts and a +Inf bucket matching _count, +Inf/-Inf/NaN spelled the
+OpenMetrics way, escaped HELP text and a single trailing `# EOF`. Also
+scrapes the endpoint over TCP and a unix socket and reports the cost of
+one scrape.
+
+    python3 benchmarks/metrics.py [--runs 2000]
+"""
+
+import argparse
+import http.client
+import math
+import os
+import re
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.metrics import CONTENT_TYPE, Histogram, MetricsExporter, render  # noqa: E402
+
+NAME = r'[a-zA-Z_:][a-zA-Z0-9_:]*'
+NUMBER = r'[-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?|[-+]?Inf|NaN'
+SAMPLE = re.compile(rf'^({NAME})(?:\{{(.*)\}})? ({NUMBER})$')
+LABEL = re.compile(rf'({NAME})="((?:[^"\\\n]|\\[\\"n])*)"(?:,|$)')
+METADATA = re.compile(rf'^# (TYPE|HELP|UNIT) ({NAME})(?: (.*))?$')
+SUFFIXES = {
+    'counter': ('_total', '_created'),
+    'gauge': ('',),
+    'histogram': ('_bucket', '_count', '_sum', '_created'),
+}
+
+
+def number(text):
+    return float(text.replace('Inf', 'inf').replace('NaN', 'nan'))
+
+
+def validate(text):
+    """Problems with an OpenMetrics exposition, empty if it is valid"""
+    problems = []
+    if not text.endswith('# EOF\n'):
+        problems.append("does not end with '# EOF' and a newline")
+    lines = text[:-1].split('\n') if text.endswith('\n') else text.split('\n')
+    if lines.count('# EOF') != 1:
+        problems.append(f"{lines.count('# EOF')} '# EOF' lines")
+
+    families = {}  # name -> {'type', 'help', 'samples'}
+    current = None
+    finished = set()
+    for lineno, line in enumerate(lines, 1):
+        where = f"line {lineno}"
+        if line == '# EOF':
+            break
+        if not line:
+            problems.append(f"{where}: blank line")
+            continue
+        match = METADATA.match(line)
+        if match:
+            kind, name, rest = match.groups()
+            if name != current:
+                if name in finished or name in families:
+                    problems.append(f"{where}: family {name} is interleaved or repeated")
+                if current is not None:
+                    finished.add(current)
+                current = name
+                families[name] = {'type': None, 'help': None, 'samples': []}
+            family = families[name]
+            if family['samples']:
+                problems.append(f"{where}: {kind} after samples of {name}")
+            key = kind.lower()
+            if family.get(key) is not None:
+                problems.append(f"{where}: second {kind} for {name}")
+            family[key] = rest if rest is not None else ''
+            if kind == 'TYPE' and rest not in SUFFIXES:
+                problems.append(f"{where}: unknown type {rest!r}")
+            if kind == 'HELP' and '\\' in re.sub(r'\\[\\n"]', '', rest or ''):
+                problems.append(f"{where}: unescaped backslash in HELP")
+            continue
+        if line.startswith('#'):
+            problems.append(f"{where}: unknown comment {line!r}")
+            continue
+        match = SAMPLE.match(line)
+        if not match:
+            problems.append(f"{where}: not a sample: {line!r}")
+            continue
+        name, labels, value = match.groups()
+        family = families.get(current)
+        if family is None or family['type'] is None:
+            problems.append(f"{where}: sample {name} without a TYPE")
+            continue
+        suffix = name[len(current):] if name.startswith(current) else None
+        if suffix not in SUFFIXES.get(family['type'], ()):
+            problems.append(f"{where}: sample {name} does not belong to {family['type']} {current}")
+            continue
+        parsed = {}
+        if labels:
+            for label in LABEL.finditer(labels):
+                parsed[label.group(1)] = label.group(2)
+            if ','.join(f'{k}="{v}"' for k, v in parsed.items()) != labels:
+                problems.append(f"{where}: malformed labels {labels!r}")
+        family['samples'].append((suffix, parsed, value))
+
+    for name, family in families.items():
+        problems += [f"{name}: {problem}" for problem in check_family(name, family)]
+    return problems
+
+
+def check_family(name, family):
+    problems = []
+    samples = family['samples']
+    if family['type'] is None:
+        problems.append("no TYPE")
+    if not samples:
+        problems.append("no samples")
+    if family['type'] == 'counter':
+        if name.endswith('_total'):
+            problems.append("counter family named with _total")
+        for suffix, _labels, value in samples:
+            if suffix == '_total' and not number(value) >= 0:
+                problems.append(f"counter value {value}")
+    elif family['type'] == 'histogram':
+        buckets = [(labels.get('le'), value) for suffix, labels, value in samples if suffix == '_bucket']
+        counts = [value for suffix, _labels, value in samples if suffix == '_count']
+        if not buckets or buckets[-1][0] != '+Inf':
+            problems.append("no +Inf bucket last")
+        bounds = [number(bound) for bound, _value in buckets if bound is not None]
+        if bounds != sorted(bounds) or len(set(bounds)) != len(bounds):
+            problems.append(f"bucket bounds not ascending: {bounds}")
+        for bound, _value in buckets:
+            if bound != '+Inf' and (bound is None or '.' not in bound and 'e' not in bound):
+                problems.append(f"bucket bound {bound!r} is not a canonical float")
+        cumulative = [number(value) for _bound, value in buckets]
+        if cumulative != sorted(cumulative):
+            problems.append(f"bucket counts not cumulative: {cumulative}")
+        if counts and buckets and number(counts[0]) != cumulative[-1]:
+            problems.append(f"_count {counts[0]} differs from the +Inf bucket {cumulative[-1]}")
+    return problems
+
+
+def snapshot():
+    """What VPNCore publishes while connected, with a filled histogram"""
+    poll = Histogram()
+    for value in (0.0001, 0.0004, 0.002, 0.03, 0.03, 0.7, 9.0):
+        poll.observe(value)
+    return {
+        'connected': True, 'degraded': False, 'service_active': True,
+        'connection_start_time': time.time() - 3600, 'outages': 3, 'reconnect_attempts': 5,
+        'last_reconnect_time': 4.25, 'rx_bytes': 123456789, 'tx_bytes': 9876543,
+        'health_rtt': 0.012, 'health_loss': 0.0, 'poll_duration': poll.snapshot(),
+        'status_checks': 4096, 'subprocess_spawns': 2,
+    }
+
+
+def check_render(failures):
+    exporter = MetricsExporter('127.0.0.1:0')
+    for label, data in (("connected", snapshot()), ("empty snapshot", {}),
+                        ("no history yet", dict(snapshot(), last_reconnect_time=None,
+                                                health_rtt=None, health_loss=None))):
+        exporter.publish(data)
+        text = exporter.render()
+        failures += [f"{label}: {problem}" for problem in validate(text)]
+    if 'kerio_vpn_outages_total 3\n' not in render_of(exporter, snapshot()):
+        failures.append("the outages counter is not exposed as kerio_vpn_outages_total")
+
+    # Awkward values straight through render()
+    odd = Histogram(buckets=(1, 5, 10))
+    odd.observe(3)
+    text = render([
+        ('odd_help', 'gauge', 'Backslash \\ and\nnewline', 1.5),
+        ('odd_inf', 'gauge', 'Infinite', math.inf),
+        ('odd_negative_inf', 'gauge', 'Negative infinity', -math.inf),
+        ('odd_nan', 'gauge', 'Not a number', math.nan),
+        ('odd_flag', 'gauge', 'A bool', True),
+        ('odd_skipped', 'gauge', 'Skipped', None),
+        ('odd_int_buckets', 'histogram', 'Integer bucket bounds', odd.snapshot()),
+        ('odd_empty', 'histogram', 'Nothing observed', Histogram().snapshot()),
+    ])
+    failures += [f"awkward values: {problem}" for problem in validate(text)]
+    for expected in ('odd_inf +Inf\n', 'odd_negative_inf -Inf\n', 'odd_nan NaN\n', 'odd_flag 1\n',
+                     '# HELP odd_help Backslash \\\\ and\\nnewline\n'):
+        if expected not in text:
+            failures.append(f"awkward values: {expected!r} missing")
+    if 'odd_skipped' in text:
+        failures.append("a None value was rendered")
+    if render([]) != '# EOF\n':
+        failures.append(f"nothing to render gave {render([])!r}")
+
+
+def render_of(exporter, data):
+    exporter.publish(data)
+    return exporter.render()
+
+
+def scrape(exporter, path='/metrics'):
+    """(status, content type, body) of one GET against a started exporter"""
+    if exporter.listen.startswith('unix:'):
+        connection = http.client.HTTPConnection('localhost', timeout=5)
+        connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.sock.settimeout(5)
+        connection.sock.connect(exporter.listen[len('unix:'):])
+    else:
+        host, port = exporter.server.server_address[:2]
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response.status, response.getheader('Content-Type'), response.read().decode()
+    finally:
+        connection.close()
+
+
+def check_endpoints(directory, failures):
+    for listen in ('127.0.0.1:0', f"unix:{os.path.join(directory, 'metrics.sock')}"):
+        exporter = MetricsExporter(listen)
+        exporter.start()
+        try:
+            exporter.publish(snapshot())
+            status, content_type, body = scrape(exporter)
+            if status != 200 or content_type != CONTENT_TYPE:
+                failures.append(f"{listen}: {status} {content_type}")
+            failures += [f"{listen} scrape: {problem}" for problem in validate(body)]
+            status, _content_type, _body = scrape(exporter, '/other')
+            if status != 404:
+                failures.append(f"{listen}: /other answered {status}")
+        finally:
+            exporter.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=2000, help='renders to time')
+    args = parser.parse_args()
+    failures = []
+
+    check_render(failures)
+    with tempfile.TemporaryDirectory() as directory:
+        check_endpoints(directory, failures)
+
+    exporter = MetricsExporter('127.0.0.1:0')
+    exporter.publish(snapshot())
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        exporter.render()
+    elapsed = (time.perf_counter() - started) / args.runs
+    print(f"one scrape renders {len(exporter.render())} bytes in {elapsed * 1e6:.0f} us")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+rtnetlink monitor check
+Feeds InterfaceMonitor hand-built RTM_NEWLINK / RTM_DELLINK / RTM_NEWADDR
+messages for an interface that does not exist here: created, addressed,
+down, up, renamed away, renamed back under a new index, and deleted,
+with other links coming and going by the same name. Checks that a link
+renamed away reads as gone, that an address is only reported while the
+link is up, and that the monitor and `ip addr` agree on the real
+interfaces of this host. Reports the cost of one event against one
+`ip addr` run.
+
+    python3 benchmarks/netlink.py [--runs 20000]
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn import netlink  # noqa: E402
+from kerio_vpn.netlink import InterfaceMonitor, ip_addr_status  # noqa: E402
+
+IFNAME = 'kvnettest0'
+IF_OPER_DOWN = 2
+
+
+def attribute(attr_type, payload):
+    data = netlink.RTATTR.pack(netlink.RTATTR.size + len(payload), attr_type) + payload
+    return data + b'\0' * (netlink._align(len(data)) - len(data))
+
+
+def link(index, name, operstate=netlink.IF_OPER_UP):
+    return (netlink.IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0)
+            + attribute(netlink.IFLA_IFNAME, name.encode() + b'\0')
+            + attribute(netlink.IFLA_OPERSTATE, bytes([operstate])))
+
+
+def address(index, ip):
+    return (netlink.IFADDRMSG.pack(socket.AF_INET, 24, 0, 0, index)
+            + attribute(netlink.IFA_LOCAL, socket.inet_aton(ip)))
+
+
+def check_events(failures):
+    monitor = InterfaceMonitor(IFNAME)
+    try:
+        steps = [
+            ("before it exists", [], (False, False, None)),
+            ("created and addressed", [(netlink.RTM_NEWLINK, link(900, IFNAME)),
+                                       (netlink.RTM_NEWADDR, address(900, '10.8.0.2'))],
+             (True, True, '10.8.0.2')),
+            ("an address on another link", [(netlink.RTM_NEWADDR, address(901, '10.9.0.2'))],
+             (True, True, '10.8.0.2')),
+            ("link down", [(netlink.RTM_NEWLINK, link(900, IFNAME, IF_OPER_DOWN))],
+             (True, False, None)),
+            ("link up again", [(netlink.RTM_NEWLINK, link(900, IFNAME))], (True, True, '10.8.0.2')),
+            ("renamed away", [(netlink.RTM_NEWLINK, link(900, 'renamed0'))], (False, False, None)),
+            ("the renamed link changes", [(netlink.RTM_NEWLINK, link(900, 'renamed0'))],
+             (False, False, None)),
+            ("another link takes the name", [(netlink.RTM_NEWLINK, link(901, IFNAME))],
+             (True, True, None)),
+            ("a stale DELLINK for the name", [(netlink.RTM_DELLINK, link(900, IFNAME))],
+             (True, True, None)),
+            ("addressed", [(netlink.RTM_NEWADDR, address(901, '10.8.0.3'))], (True, True, '10.8.0.3')),
+            ("deleted", [(netlink.RTM_DELLINK, link(901, IFNAME))], (False, False, None)),
+        ]
+        for label, messages, expected in steps:
+            for msg_type, payload in messages:
+                monitor._handle(msg_type, payload)
+            got = (monitor.exists, monitor.up, monitor.vpn_ip)
+            if got != expected:
+                failures.append(f"{label}: (exists, up, vpn_ip) {got}, expected {expected}")
+    finally:
+        monitor.close()
+
+
+def check_backends(failures):
+    """The monitor and `ip addr` report the same for every link on this host"""
+    if shutil.which('ip') is None:
+        print("ip not found, not comparing the backends")
+        return
+    for ifname in sorted(os.listdir('/sys/class/net')) + ['kvnet-missing']:
+        monitor = InterfaceMonitor(ifname)
+        try:
+            got = (monitor.up, monitor.state, monitor.vpn_ip)
+        finally:
+            monitor.close()
+        expected = ip_addr_status(ifname)
+        if got != expected:
+            failures.append(f"{ifname}: netlink says {got}, ip addr {expected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20000, help='events to time')
+    args = parser.parse_args()
+    failures = []
+
+    check_events(failures)
+    check_backends(failures)
+
+    monitor = InterfaceMonitor(IFNAME)
+    payload = link(900, IFNAME)
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        monitor._handle(netlink.RTM_NEWLINK, payload)
+    event_us = (time.perf_counter() - started) / args.runs * 1e6
+    monitor.close()
+    if shutil.which('ip') is not None:
+        started = time.perf_counter()
+        for _ in range(20):
+            ip_addr_status('lo')
+        polled_us = (time.perf_counter() - started) / 20 * 1e6
+        print(f"one link event {event_us:.1f} us, one `ip addr` run {polled_us:.0f} us")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Desktop notification check
+Runs a stand-in org.freedesktop.Notifications on a private D-Bus and
+points Notifier at it. Checks that each category keeps one bubble by
+passing the id it got back as replaces_id, that categories do not share
+bubbles, that a burst inside the coalescing window reaches the daemon
+as one update with the newest text, that a bubble closed by the user is
+not replaced, and that the fallback is used when the daemon fails or is
+not on the bus. Needs PyGObject and dbus-daemon.
+
+    python3 benchmarks/notifications.py
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WINDOW = 0.2  # Coalescing window, seconds
+
+NOTIFICATIONS_XML = '''
+<node>
+  <interface name="org.freedesktop.Notifications">
+    <method name="Notify">
+      <arg name="app_name" type="s" direction="in"/>
+      <arg name="replaces_id" type="u" direction="in"/>
+      <arg name="app_icon" type="s" direction="in"/>
+      <arg name="summary" type="s" direction="in"/>
+      <arg name="body" type="s" direction="in"/>
+      <arg name="actions" type="as" direction="in"/>
+      <arg name="hints" type="a{sv}" direction="in"/>
+      <arg name="expire_timeout" type="i" direction="in"/>
+      <arg name="id" type="u" direction="out"/>
+    </method>
+    <signal name="NotificationClosed">
+      <arg name="id" type="u"/>
+      <arg name="reason" type="u"/>
+    </signal>
+  </interface>
+</node>
+'''
+
+
+class StandInDaemon:
+    """Notification daemon served from its own thread and main context
+
+    Like a real daemon it answers a replacement with the id it replaced
+    """
+
+    def __init__(self, address):
+        from gi.repository import Gio, GLib
+        from kerio_vpn import notifications
+
+        self.Gio, self.GLib, self.notifications = Gio, GLib, notifications
+        self.address = address
+        self.calls = []  # (replaces_id, summary, body, returned id)
+        self.next_id = 1
+        self.failing = False
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        if not self.ready.wait(10):
+            raise RuntimeError("stand-in notification daemon did not start")
+
+    def serve(self):
+        Gio, GLib = self.Gio, self.GLib
+        context = GLib.MainContext.new()
+        context.push_thread_default()
+        flags = (Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT
+                 | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION)
+        self.connection = Gio.DBusConnection.new_for_address_sync(self.address, flags, None, None)
+        info = Gio.DBusNodeInfo.new_for_xml(NOTIFICATIONS_XML).interfaces[0]
+        self.connection.register_object(self.notifications.NOTIFICATIONS_PATH, info,
+                                        self.method_call, None, None)
+        self.connection.call_sync('org.freedesktop.DBus', '/org/freedesktop/DBus',
+                                  'org.freedesktop.DBus', 'RequestName',
+                                  GLib.Variant('(su)', (self.notifications.NOTIFICATIONS_BUS_NAME, 0)),
+                                  GLib.VariantType('(u)'), Gio.DBusCallFlags.NONE, -1, None)
+        self.loop = GLib.MainLoop.new(context, False)
+        self.ready.set()
+        self.loop.run()
+        self.connection.close_sync(None)
+        context.pop_thread_default()
+
+    def method_call(self, connection, sender, path, interface, method, parameters, invocation):
+        if self.failing:
+            invocation.return_dbus_error('org.freedesktop.Notifications.Error', 'out of bubbles')
+            return
+        _app, replaces_id, _icon, summary, body, _actions, _hints, _timeout = parameters.unpack()
+        notification_id = replaces_id
+        if not notification_id:
+            notification_id = self.next_id
+            self.next_id += 1
+        self.calls.append((replaces_id, summary, body, notification_id))
+        invocation.return_value(self.GLib.Variant('(u)', (notification_id,)))
+
+    def close_bubble(self, notification_id, reason=2):
+        """The user dismissed a bubble"""
+        self.connection.emit_signal(
+            None, self.notifications.NOTIFICATIONS_PATH,
+            self.notifications.NOTIFICATIONS_INTERFACE, 'NotificationClosed',
+            self.GLib.Variant('(uu)', (notification_id, reason)))
+
+    def stop(self):
+        self.loop.quit()
+        self.thread.join(5)
+
+
+def pump(timeout, condition=lambda: False):
+    """Iterate the main context until condition() or the timeout; returns condition()"""
+    from gi.repository import GLib
+
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        if not context.iteration(False):
+            time.sleep(0.0005)
+    return condition()
+
+
+def check_categories(daemon, notifier, fallbacks, failures):
+    def show(category, title, count=1):
+        before = len(daemon.calls)
+        notifier.notify(category, title, f"{title} body")
+        if not pump(3, lambda: len(daemon.calls) >= before + count
+                    and category in notifier.notification_ids):
+            failures.append(f"{category} '{title}': the daemon was not called")
+            return None
+        return daemon.calls[-1]
+
+    first = show('connection', 'Connected')
+    other = show('gateway', 'Switched gateway')
+    pump(WINDOW * 1.5)
+    second = show('connection', 'Disconnected')
+    if None in (first, other, second):
+        return
+    if first[0] != 0 or other[0] != 0:
+        failures.append(f"a first bubble replaced {first[0]} / {other[0]}")
+    if other[3] == first[3]:
+        failures.append("two categories share one bubble")
+    if second[0] != first[3]:
+        failures.append(f"the connection bubble replaced {second[0]}, not its own {first[3]}")
+
+    # A burst in one category: the first goes out once the window has passed,
+    # the rest collapse into one update with the newest text
+    pump(WINDOW * 1.5)
+    before = len(daemon.calls)
+    for index in range(5):
+        notifier.notify('connection', f"Reconnecting ({index + 1})", "burst")
+    pump(WINDOW * 3)
+    burst = daemon.calls[before:]
+    if [call[1] for call in burst] != ["Reconnecting (1)", "Reconnecting (5)"]:
+        failures.append(f"a burst of 5 reached the daemon as {[call[1] for call in burst]}")
+    if any(call[0] != first[3] for call in burst):
+        failures.append(f"a burst did not replace the connection bubble: {burst}")
+
+    # Dismissed by the user: the next one is a new bubble
+    daemon.close_bubble(first[3])
+    if not pump(3, lambda: 'connection' not in notifier.notification_ids):
+        failures.append("NotificationClosed did not forget the connection bubble")
+    if notifier.notification_ids.get('gateway') != other[3]:
+        failures.append("closing one bubble forgot another category's")
+    pump(WINDOW * 1.5)
+    after_close = show('connection', 'Connected again')
+    if after_close is not None and after_close[0] != 0:
+        failures.append(f"a dismissed bubble was replaced ({after_close[0]})")
+    if fallbacks:
+        failures.append(f"the fallback ran with the daemon up: {fallbacks}")
+
+
+def check_fallback(daemon, client, failures):
+    """The daemon fails a call, then is not on the bus at all"""
+    from kerio_vpn.notifications import Notifier
+
+    fallbacks = []
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        notifier = Notifier(coalesce_window=WINDOW, connection=client,
+                            fallback=lambda title, message: fallbacks.append(title))
+        daemon.failing = True
+        notifier.notify('connection', 'Daemon error', 'body')
+        pump(3, lambda: fallbacks)
+        daemon.stop()
+        notifier.notify('gateway', 'No daemon', 'body')
+        pump(3, lambda: len(fallbacks) > 1)
+        notifier.close()
+    if fallbacks != ['Daemon error', 'No daemon']:
+        failures.append(f"fallback shown for {fallbacks}, expected a daemon error and no daemon")
+    if notifier.notification_ids:
+        failures.append(f"failed notifications left ids behind: {notifier.notification_ids}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+    failures = []
+
+    try:
+        from gi.repository import Gio
+    except ImportError:
+        print("PyGObject is not installed, skipping")
+        print("checks: skipped")
+        return 0
+    from kerio_vpn.notifications import Notifier
+
+    bus = Gio.TestDBus.new(Gio.TestDBusFlags.NONE)
+    bus.up()
+    flags = (Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT
+             | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION)
+    client = Gio.DBusConnection.new_for_address_sync(bus.get_bus_address(), flags, None, None)
+    daemon = StandInDaemon(bus.get_bus_address())
+    try:
+        fallbacks = []
+        notifier = Notifier(coalesce_window=WINDOW, connection=client,
+                            fallback=lambda title, message: fallbacks.append(title))
+        check_categories(daemon, notifier, fallbacks, failures)
+        notifier.close()
+        print(f"{len(daemon.calls)} notifications sent, {daemon.next_id - 1} bubbles opened")
+        check_fallback(daemon, client, failures)
+    finally:
+        daemon.stop()
+    client.close_sync(None)
+    bus.down()
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Reconnect policy simulation
+Drives the pure ReconnectPolicy through thousands of outages on a fake
+clock, where each attempt succeeds with a per-outage probability, and
+checks its promises: jittered delays stay within [0, cap] and spread
+over the whole range, the attempt limit is honoured and giving up is
+counted once per outage, unlimited mode opens the circuit breaker every
+breaker_threshold failures and cools down, and nothing is attempted
+after a manual disconnect, while offline or while disabled. Reports
+time-to-reconnect percentiles for both modes.
+
+    python3 benchmarks/reconnect_policy.py [--outages 5000] [--seed 1]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.reconnect import ReconnectPolicy  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cap(policy, attempt):
+    return min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1))
+
+
+def simulate(policy, clock, outages, rng, failures):
+    """Run `outages` outages to their end; returns the times to reconnect of the recovered ones"""
+    ratios = []
+    for _ in range(outages):
+        clock.now += rng.uniform(60, 3600)
+        policy.on_connection_lost()
+        if not policy.in_outage:
+            failures.append("a lost connection did not start an outage")
+            return ratios
+        success = rng.choice((0.05, 0.3, 0.8))  # Chance that one attempt brings the tunnel back
+        gave_up = policy.gave_up
+        while True:
+            delay = policy.next_delay()
+            attempt = policy.attempts
+            if delay is None:
+                if not policy.exhausted:
+                    failures.append(f"no attempt {attempt + 1} although the limit is not reached")
+                if policy.gave_up != gave_up + 1:
+                    failures.append(f"giving up counted {policy.gave_up - gave_up} times")
+                if policy.next_delay() is not None or policy.gave_up != gave_up + 1:
+                    failures.append("attempts continued after giving up")
+                policy.on_connected()  # The user brings it back eventually
+                break
+            if policy.max_attempts and attempt > policy.max_attempts:
+                failures.append(f"attempt {attempt} over the limit of {policy.max_attempts}")
+            breaker = (not policy.max_attempts and policy.breaker_threshold
+                       and attempt % policy.breaker_threshold == 0)
+            if breaker:
+                if delay != policy.cooldown:
+                    failures.append(f"attempt {attempt}: breaker waited {delay}, not the cool-down")
+            elif not 0 <= delay <= cap(policy, attempt):
+                failures.append(f"attempt {attempt}: delay {delay:.2f} outside [0, {cap(policy, attempt)}]")
+            else:
+                ratios.append(delay / cap(policy, attempt))
+
+            clock.now += delay
+            policy.on_attempt()
+            if policy.attempt_settled(True):
+                failures.append("an attempt settled before attempt_timeout")
+            if rng.random() < success:
+                clock.now += 5
+                policy.on_connected()
+                break
+            clock.now += policy.attempt_timeout
+            if not policy.attempt_settled(True):
+                failures.append("an attempt did not settle after attempt_timeout")
+        if policy.in_outage:
+            failures.append("the outage did not end")
+    return ratios
+
+
+def check_manual_and_offline(failures):
+    clock = FakeClock()
+    policy = ReconnectPolicy(clock=clock, rng=random.Random(1).random)
+
+    policy.on_manual_disconnect()
+    policy.on_connection_lost()
+    if policy.in_outage or policy.next_delay() is not None:
+        failures.append("manual disconnect: the drop started an outage or an attempt")
+    policy.on_manual_connect()
+    policy.on_connection_lost()
+    if policy.next_delay() is None:
+        failures.append("manual connect: reconnects did not resume")
+    policy.on_manual_disconnect()
+    if policy.in_outage or policy.attempts or policy.next_delay() is not None:
+        failures.append("manual disconnect during an outage: attempts continued")
+
+    policy.on_manual_connect()
+    policy.on_connection_lost()
+    policy.online = False
+    if policy.next_delay() is not None or policy.attempts:
+        failures.append("offline: an attempt was made or counted")
+    policy.online = True
+    policy.enabled = False
+    if policy.next_delay() is not None:
+        failures.append("disabled: an attempt was made")
+    policy.enabled = True
+    if policy.next_delay(immediate=True) != 0.0:
+        failures.append("an immediate attempt waited")
+    policy.uncount_attempt()
+    if policy.attempts:
+        failures.append("uncount_attempt left the attempt counted")
+    policy.damped = True
+    delay = policy.next_delay(immediate=True)
+    if delay != policy.damped_delay:
+        failures.append(f"a damped immediate attempt waited {delay}, not {policy.damped_delay}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--outages', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    failures = []
+
+    modes = {
+        'limited (3 attempts)': dict(max_attempts=3),
+        'unlimited with breaker': dict(max_attempts=0, breaker_threshold=10, cooldown=600.0),
+    }
+    for name, kwargs in modes.items():
+        rng = random.Random(args.seed)
+        clock = FakeClock()
+        policy = ReconnectPolicy(clock=clock, rng=rng.random,
+                                 history_size=args.outages, **kwargs)
+        mode_failures = []
+        started = time.perf_counter()
+        ratios = simulate(policy, clock, args.outages, rng, mode_failures)
+        elapsed = time.perf_counter() - started
+
+        stats = policy.stats()
+        times = sorted(policy.reconnect_times)
+        recovered = stats['outages'] - stats['gave_up']
+        if stats['outages'] != args.outages:
+            mode_failures.append(f"{stats['outages']} outages counted, expected {args.outages}")
+        if len(times) != args.outages:
+            mode_failures.append(f"{len(times)} reconnect times for {args.outages} outages")
+        mean = sum(ratios) / len(ratios) if ratios else 0
+        if not 0.45 <= mean <= 0.55:
+            mode_failures.append(f"jitter is not spread over [0, cap]: mean delay/cap {mean:.3f}")
+        if not kwargs['max_attempts'] and stats['gave_up']:
+            mode_failures.append("unlimited mode gave up")
+
+        def percentile(share):
+            return times[min(len(times) - 1, int(share * len(times)))] if times else 0
+
+        print(f"{name}: {args.outages} outages, {stats['total_attempts']} attempts, "
+              f"{stats['gave_up']} gave up, {recovered} recovered; time to reconnect "
+              f"p50 {percentile(0.5):.0f}s p95 {percentile(0.95):.0f}s max {times[-1]:.0f}s; "
+              f"mean delay/cap {mean:.3f}; {args.outages / elapsed:,.0f} outages/s")
+        failures += [f"{name}: {failure}" for failure in dict.fromkeys(mode_failures)]
+
+    manual_failures = []
+    check_manual_and_offline(manual_failures)
+    failures += [f"manual/offline: {failure}" for failure in manual_failures]
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Trace replay benchmark
+Replays connection traces through VPNCore on the simulated host from
+kerio_vpn.simulation: virtual time, no systemctl, ip or sudo. Each
+built-in scenario (drops, blips, slow starts, failing units, suspend,
+manual use, polling backends) asserts the connection transitions,
+notifications and systemctl calls it leads to. Then a synthetic week of
+mixed events measures how many status decisions the core evaluates per
+second of real time. Runs anywhere, no systemd or PyGObject needed.
+
+    python3 benchmarks/replay.py [--days 7]
+    python3 benchmarks/replay.py --trace FILE      # JSON lines, see load_trace()
+    python3 benchmarks/replay.py --history [FILE]  # your sessions.jsonl
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.history import SessionLog  # noqa: E402
+from kerio_vpn.kerioconf import KerioConfig  # noqa: E402
+from kerio_vpn.simulation import Replay, load_trace, trace_from_sessions  # noqa: E402
+
+UP = [(0, 'tunnel_up', {})]
+CONNECTED, LOST, RECONNECTING, FAILED, GAVE_UP = (
+    'Kerio VPN Connected', 'Kerio VPN Disconnected', 'Kerio VPN', 'Kerio VPN Error', 'Kerio VPN')
+UNSTABLE, STABLE = 'Kerio VPN Unstable', 'Kerio VPN Stable'
+
+
+def blips(event, restore, count, every=120.0, length=0.3, start=60.0):
+    """`count` short outages: event, then restore `length` seconds later"""
+    trace = []
+    for index in range(count):
+        t = start + index * every
+        trace += [(t, event, {}), (t + length, restore, {})]
+    return trace
+
+
+def mixed_trace(days, seed=1):
+    """A long synthetic trace: drops, blips, failing units and nightly suspends"""
+    rng = random.Random(seed)
+    trace = list(UP)
+    for day in range(days):
+        base = day * 86400.0
+        t = base + 8 * 3600
+        while t < base + 23 * 3600:
+            t += rng.expovariate(1 / 900)  # An incident every 15 minutes on average
+            kind = rng.random()
+            if kind < 0.4:
+                trace += [(t, 'link_down', {}), (t + rng.uniform(0.1, 2), 'link_up', {})]
+            elif kind < 0.6:
+                trace += [(t, 'address_lost', {}), (t + rng.uniform(0.1, 1), 'address_added', {})]
+            elif kind < 0.85:
+                trace.append((t, 'tunnel_down', {}))
+            elif kind < 0.95:
+                trace += [(t, 'uplink_down', {}), (t + rng.uniform(5, 120), 'uplink_up', {}),
+                          (t + 1, 'tunnel_down', {})]
+            else:
+                trace += [(t, 'failing_starts', {'count': 2}), (t, 'unit_failed', {})]
+            t += 130  # Let one incident settle before the next
+        trace += [(base + 23.5 * 3600, 'sleep', {}), (base + 31 * 3600, 'resume', {}),
+                  (base + 31 * 3600 + 8, 'uplink_up', {})]
+    return trace
+
+
+# name: (trace, Replay keyword arguments, expected summary entries)
+SCENARIOS = {
+    'steady': (UP, {}, {
+        'transitions': ['connected'],
+        'notifications': [CONNECTED],
+        'actions': [],
+    }),
+    'drop': (UP + [(60, 'tunnel_down', {})], {}, {
+        'transitions': ['connected', 'disconnected', 'connected'],
+        'notifications': [CONNECTED, LOST, RECONNECTING, CONNECTED],
+        'actions': ['restart'],
+        'reconnect_attempts': 1,
+    }),
+    'drop, polled backends': (UP + [(60, 'tunnel_down', {})], {'events': False}, {
+        'transitions': ['connected', 'disconnected', 'connected'],
+        'actions': ['restart'],
+        'reconnect_attempts': 1,
+    }),
+    'slow start': (UP + [(0, 'slow_start', {'seconds': 20}), (60, 'tunnel_down', {})], {}, {
+        'transitions': ['connected', 'disconnected', 'connected'],
+        'actions': ['restart'],  # Still inside attempt_timeout, no second attempt
+        'reconnect_attempts': 1,
+    }),
+    'failed unit': (UP + [(0, 'failing_starts', {'count': 5}), (60, 'unit_failed', {})], {}, {
+        'transitions': ['connected', 'disconnected'],
+        'notifications': [CONNECTED, LOST] + [RECONNECTING, FAILED] * 3 + [GAVE_UP],
+        'actions': ['start'] * 3,
+        'gave_up': 1,
+    }),
+    'suspend': (UP + [(600, 'sleep', {}), (1200, 'resume', {}), (1205, 'uplink_up', {})], {}, {
+        'transitions': ['connected', 'disconnected', 'connected'],
+        'actions': ['restart'],
+        'reconnect_attempts': 0,  # The resume reconnect does not count
+    }),
+    'manual': (UP + [(60, 'user_disconnect', {}), (300, 'user_connect', {})], {}, {
+        'transitions': ['connected', 'disconnected', 'connected'],
+        'notifications': [CONNECTED, LOST, CONNECTED],
+        'actions': ['stop', 'start'],
+        'reconnect_attempts': 0,
+    }),
+    # Blips stay inside the debounce window; this many make the link unstable
+    'link blips': (UP + blips('link_down', 'link_up', 5), {}, {
+        'transitions': ['connected'],
+        'notifications': [CONNECTED, UNSTABLE, STABLE],
+        'actions': [],
+    }),
+    'address blips': (UP + blips('address_lost', 'address_added', 5), {}, {
+        'transitions': ['connected'],
+        'actions': [],
+    }),
+}
+
+
+def replay(trace, config_file, **kwargs):
+    """Run one trace; returns (summary, seconds of real time, core output)"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run = Replay(trace, config_file=config_file, **kwargs)
+        started = time.perf_counter()
+        summary = run.run()
+        elapsed = time.perf_counter() - started
+        run.close()
+    return summary, elapsed, output.getvalue()
+
+
+def describe(summary):
+    return (f"{summary['simulated'] / 3600:.1f} h simulated, "
+            f"{len(summary['transitions'])} transitions, "
+            f"{len(summary['notifications'])} notifications, "
+            f"{len(summary['actions'])} systemctl calls "
+            f"({summary['reconnect_attempts']} auto-reconnect attempts), "
+            f"{summary['decisions']} status decisions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=7, help='length of the throughput trace')
+    parser.add_argument('--trace', help='replay a JSON-lines trace instead')
+    parser.add_argument('--history', nargs='?', const='', metavar='FILE',
+                        help='replay session history (default: your own)')
+    args = parser.parse_args()
+    failures = []
+
+    if args.history is not None:
+        history = SessionLog(args.history or None).records()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['XDG_STATE_HOME'] = directory
+        config_file = os.path.join(directory, 'kerio-kvc.conf')
+        config = KerioConfig.new()
+        config.set('server', 'vpn.example.com')
+        config.save(config_file)
+
+        if args.trace or args.history is not None:
+            try:
+                trace = load_trace(args.trace) if args.trace else trace_from_sessions(history)
+            except (OSError, ValueError) as e:
+                print(f"Cannot replay: {e}", file=sys.stderr)
+                return 1
+            summary, _elapsed, _output = replay(trace, config_file)
+            print(describe(summary))
+            print("transitions:", ' -> '.join(summary['transitions']))
+            return 0
+
+        for name, (trace, kwargs, expected) in SCENARIOS.items():
+            summary, _elapsed, output = replay(trace, config_file, **kwargs)
+            mismatches = [f"{key} {summary[key]!r}, expected {value!r}"
+                          for key, value in expected.items() if summary[key] != value]
+            if 'Error in' in output:
+                mismatches.append("a callback raised")
+            print(f"{name:>22}: {'ok' if not mismatches else 'FAILED'}")
+            failures += [f"{name}: {mismatch}" for mismatch in mismatches]
+
+        summary, elapsed, output = replay(mixed_trace(args.days), config_file)
+        if 'Error in' in output:
+            failures.append("mixed trace: a callback raised")
+        print(f"mixed trace: {describe(summary)}")
+        print(f"replayed in {elapsed:.2f} s: {summary['decisions'] / elapsed:,.0f} decisions/s, "
+              f"{summary['simulated'] / elapsed:,.0f}x real time")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
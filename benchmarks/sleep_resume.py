@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Suspend/resume benchmark
+Plays a laptop suspend against VPNCore: the tunnel dies while asleep,
+Wi-Fi takes a while to come back after resume, the uplink drops during
+an outage and the default route moves. Checks that status checks stop
+while asleep, that nothing is attempted or counted without an uplink
+and that the reconnect starts as soon as the uplink is back, and reports
+that delay. The helper and the tunnel are simulated.
+
+By default the sleep and uplink sources are plain objects on the
+pure-Python loop. With PyGObject installed, --bus runs the same script
+through SleepWatcher and ConnectivityWatcher against a stand-in logind
+and NetworkManager on a private D-Bus.
+
+    python3 benchmarks/sleep_resume.py [--bus]
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.commands import CommandResult  # noqa: E402
+from kerio_vpn.core import VPNCore  # noqa: E402
+from kerio_vpn.kerioconf import KerioConfig  # noqa: E402
+from kerio_vpn.settings import load_settings  # noqa: E402
+
+TUNNEL_SETUP = 0.1  # Seconds from `systemctl start` to an address on kvnet
+NM_STATE_ASLEEP, NM_STATE_CONNECTED_GLOBAL = 10, 70
+NM_CONNECTIVITY_NONE, NM_CONNECTIVITY_FULL = 1, 4
+
+
+class Tunnel:
+    """kvnet and kerio-kvc.service: the tunnel only comes up with an uplink"""
+
+    def __init__(self):
+        self.up = True
+        self.service_active = True
+        self.online = True
+        self.actions = []  # (monotonic time, systemctl action)
+
+    # SystemctlService stand-in
+    available = False  # Polled, like the systemctl fallback
+    spawned = 0
+    on_change = None
+
+    def status(self):
+        return self.service_active, 'active' if self.service_active else 'inactive'
+
+    def interface(self):
+        if self.up:
+            return True, 'UP', '10.8.0.2'
+        return False, 'not found', None
+
+    # PrivilegedClient stand-in, called on a worker thread
+    def systemctl(self, action):
+        self.actions.append((time.monotonic(), action))
+        self.up = False
+        self.service_active = action != 'stop'
+        if action != 'stop':
+            time.sleep(TUNNEL_SETUP)
+            self.up = self.online
+        return CommandResult(['systemctl', action], 0, '', '')
+
+    def close(self):
+        pass
+
+
+class FakeSleep:
+    available = True
+
+    def __init__(self):
+        self.sleeping = False
+        self.on_change = None
+
+    def close(self):
+        pass
+
+
+class FakeNetwork:
+    available = True
+
+    def __init__(self):
+        self.online = True
+        self.primary_connection = '/org/freedesktop/NetworkManager/ActiveConnection/1'
+        self.on_change = None
+
+    def close(self):
+        pass
+
+
+class FakeHost:
+    """Sleep and uplink sources as plain objects on the pure-Python loop"""
+
+    def __init__(self):
+        from kerio_vpn.mainloop import SelectorLoop
+        self.loop = SelectorLoop()
+        self.sleep = FakeSleep()
+        self.network = FakeNetwork()
+
+    def set_sleeping(self, sleeping):
+        self.sleep.sleeping = sleeping
+        self.loop.idle_add(self.sleep.on_change, self.sleep)  # Signals arrive on the loop
+
+    def set_uplink(self, online, primary):
+        self.network.online = online
+        self.network.primary_connection = primary
+        self.loop.idle_add(self.network.on_change, self.network)
+
+    def pump(self, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.loop.iterate()
+
+    def close(self):
+        self.loop.close()
+
+
+NM_XML = '''
+<node>
+  <interface name="org.freedesktop.NetworkManager">
+    <property name="State" type="u" access="read"/>
+    <property name="Connectivity" type="u" access="read"/>
+    <property name="PrimaryConnection" type="o" access="read"/>
+  </interface>
+</node>
+'''
+
+
+class BusHost:
+    """Stand-in logind and NetworkManager on a private bus, watched through D-Bus
+
+    The stand-ins answer from their own thread and main context: the
+    watchers load properties with blocking calls from the main thread
+    """
+
+    def __init__(self):
+        from gi.repository import Gio, GLib
+        from kerio_vpn import logind, networkmanager
+        from kerio_vpn.mainloop import GLibLoop
+
+        self.Gio, self.GLib = Gio, GLib
+        self.logind, self.nm = logind, networkmanager
+        self.loop = GLibLoop()
+        self.bus = Gio.TestDBus.new(Gio.TestDBusFlags.NONE)
+        self.bus.up()
+        self.address = self.bus.get_bus_address()
+        self.flags = (Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT
+                      | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION)
+        self.client = Gio.DBusConnection.new_for_address_sync(self.address, self.flags, None, None)
+
+        self.nm_properties = {
+            'State': GLib.Variant('u', NM_STATE_CONNECTED_GLOBAL),
+            'Connectivity': GLib.Variant('u', NM_CONNECTIVITY_FULL),
+            'PrimaryConnection': GLib.Variant('o', FakeNetwork().primary_connection),
+        }
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        if not self.ready.wait(10):
+            raise RuntimeError("stand-in logind and NetworkManager did not start")
+
+        self.sleep = logind.SleepWatcher(self.client)
+        self.network = networkmanager.ConnectivityWatcher(self.client)
+
+    def serve(self):
+        Gio, GLib = self.Gio, self.GLib
+        context = GLib.MainContext.new()
+        context.push_thread_default()
+        self.service = Gio.DBusConnection.new_for_address_sync(self.address, self.flags,
+                                                               None, None)
+        info = Gio.DBusNodeInfo.new_for_xml(NM_XML).interfaces[0]
+        self.service.register_object(self.nm.NM_PATH, info, None, self.get_property, None)
+        for name in (self.logind.LOGIND_BUS_NAME, self.nm.NM_BUS_NAME):
+            self.service.call_sync('org.freedesktop.DBus', '/org/freedesktop/DBus',
+                                   'org.freedesktop.DBus', 'RequestName',
+                                   GLib.Variant('(su)', (name, 0)), GLib.VariantType('(u)'),
+                                   Gio.DBusCallFlags.NONE, -1, None)
+        self.service_loop = GLib.MainLoop.new(context, False)
+        self.ready.set()
+        self.service_loop.run()
+        self.service.close_sync(None)
+        context.pop_thread_default()
+
+    def get_property(self, connection, sender, path, interface, name):
+        return self.nm_properties[name]
+
+    def set_sleeping(self, sleeping):
+        self.service.emit_signal(None, self.logind.LOGIND_PATH, self.logind.MANAGER_INTERFACE,
+                                 'PrepareForSleep', self.GLib.Variant('(b)', (sleeping,)))
+
+    def set_uplink(self, online, primary):
+        GLib = self.GLib
+        changed = {
+            'State': GLib.Variant('u', NM_STATE_CONNECTED_GLOBAL if online else NM_STATE_ASLEEP),
+            'Connectivity': GLib.Variant('u', NM_CONNECTIVITY_FULL if online else NM_CONNECTIVITY_NONE),
+            'PrimaryConnection': GLib.Variant('o', primary or '/'),
+        }
+        self.nm_properties.update(changed)
+        self.service.emit_signal(None, self.nm.NM_PATH, 'org.freedesktop.DBus.Properties',
+                                 'PropertiesChanged',
+                                 GLib.Variant('(sa{sv}as)', (self.nm.NM_INTERFACE, changed, [])))
+
+    def pump(self, seconds):
+        context = self.GLib.MainContext.default()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if not context.iteration(False):
+                time.sleep(0.001)
+
+    def close(self):
+        self.service_loop.quit()
+        self.thread.join(5)
+        self.client.close_sync(None)
+        self.bus.down()
+
+
+def make_core(host, tunnel, directory):
+    config_file = os.path.join(directory, 'kerio-kvc.conf')
+    config = KerioConfig.new()
+    config.set('server', 'vpn.example.com')
+    config.save(config_file)
+    settings = load_settings(os.devnull)
+    for key, value in (('fast_interval', '0.05'), ('base_interval', '0.05'),
+                       ('max_interval', '0.2'), ('fast_window', '0.5')):
+        settings.set('scheduler', key, value)
+    # Long enough that an attempt is still pending when the uplink goes away
+    settings.set('reconnect', 'base_delay', '5')
+    settings.set('reconnect', 'attempt_timeout', '1')
+    # Debounce and flap damping are covered by benchmarks/flapping.py
+    settings.set('flapping', 'down_after', '0')
+    settings.set('flapping', 'enter_changes', '0')
+    core = VPNCore(host.loop, settings=settings, service=tunnel,
+                   notify=lambda category, title, message: None, config_file=config_file,
+                   sleep=host.sleep, network=host.network)
+    core.privileged = tunnel
+    core.check_interface = tunnel.interface
+    return core
+
+
+def wait_for(host, condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        host.pump(0.005)
+    return condition()
+
+
+def run(host, failures):
+    """The suspend script; returns the delay from uplink to reconnect after resume"""
+    tunnel = Tunnel()
+    primary = FakeNetwork().primary_connection
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['XDG_STATE_HOME'] = directory
+        core = make_core(host, tunnel, directory)
+        policy = core.reconnect_policy
+        core.start()
+        if not wait_for(host, lambda: core.is_connected):
+            failures.append("never connected")
+
+        # Suspend: NetworkManager goes to sleep too and the tunnel dies
+        host.set_sleeping(True)
+        host.set_uplink(False, None)
+        tunnel.online = tunnel.up = False
+        host.pump(0.05)
+        ticks = core.scheduler.ticks
+        host.pump(0.5)
+        if core.scheduler.ticks != ticks:
+            failures.append(f"{core.scheduler.ticks - ticks} status checks while asleep")
+
+        # Resume without Wi-Fi: nothing may be attempted or counted
+        host.set_sleeping(False)
+        host.pump(0.5)
+        if tunnel.actions or policy.total_attempts:
+            failures.append(f"attempted without an uplink: {tunnel.actions}, "
+                            f"{policy.total_attempts} counted")
+
+        tunnel.online = True
+        uplink_at = time.monotonic()
+        host.set_uplink(True, primary)
+        if not wait_for(host, lambda: tunnel.actions):
+            failures.append("no reconnect once the uplink was back")
+            return None
+        resume_delay = tunnel.actions[0][0] - uplink_at
+        if not wait_for(host, lambda: core.is_connected):
+            failures.append("did not reconnect after resume")
+        if policy.total_attempts:
+            failures.append(f"the resume reconnect counted {policy.total_attempts} attempts")
+
+        # Drop with the uplink up: an attempt is queued behind the backoff...
+        tunnel.up = False
+        if not wait_for(host, lambda: core.reconnect_source is not None):
+            failures.append("no attempt scheduled after the drop")
+        # ...and handed back when the uplink goes away before it runs
+        tunnel.online = False
+        host.set_uplink(False, None)
+        host.pump(0.3)
+        if core.reconnect_source is not None or policy.attempts:
+            failures.append(f"attempt still pending or counted offline: {policy.attempts}")
+        actions = len(tunnel.actions)
+        tunnel.online = True
+        uplink_at = time.monotonic()
+        host.set_uplink(True, primary)
+        if not wait_for(host, lambda: len(tunnel.actions) > actions):
+            failures.append("no immediate attempt once the uplink was back")
+        elif tunnel.actions[-1][0] - uplink_at > 0.5:
+            failures.append("the attempt waited for the backoff")
+        if not wait_for(host, lambda: core.is_connected):
+            failures.append("did not reconnect after the uplink came back")
+        if policy.total_attempts != 1:
+            failures.append(f"{policy.total_attempts} attempts counted, expected 1")
+
+        # A new default route while connected only re-checks
+        actions = len(tunnel.actions)
+        host.set_uplink(True, primary.replace('/1', '/2'))
+        host.pump(0.3)
+        if len(tunnel.actions) != actions or not core.is_connected:
+            failures.append("a route change restarted a working tunnel")
+
+        core.shutdown()
+    return resume_delay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bus', action='store_true',
+                        help='go through logind and NetworkManager stand-ins on a private D-Bus')
+    args = parser.parse_args()
+    failures = []
+
+    host = BusHost() if args.bus else FakeHost()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        resume_delay = run(host, failures)
+    host.close()
+    if threading.active_count() > 1:
+        time.sleep(TUNNEL_SETUP)  # Let the last worker finish before exiting
+
+    if resume_delay is not None:
+        print(f"reconnect started {resume_delay * 1000:.1f} ms after the uplink was back "
+              f"(before: next 2 s status check plus up to 3 s backoff)")
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Soak test
+Drives VPNCore on the simulated host from kerio_vpn.simulation through
+millions of status ticks at accelerated time, with polled backends and a
+cycle of manual connects and disconnects, drops, blips, uplink changes
+and suspends repeating throughout. After a warm-up it samples resident
+memory, tracemalloc, open file descriptors and live main loop sources,
+and fails when any of them grows beyond its budget; the top allocators
+since the warm-up are listed to show where growth comes from. Then the
+real CommandRunner starts a few thousand processes to check that pipes
+and worker threads are released. About a month of uptime in a few
+minutes; without tracemalloc in well under one.
+
+    python3 benchmarks/soak.py [--ticks 1000000] [--samples 10]
+"""
+
+import argparse
+import contextlib
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.commands import CommandRunner  # noqa: E402
+from kerio_vpn.instrument import open_fds, rss_bytes  # noqa: E402
+from kerio_vpn.kerioconf import KerioConfig  # noqa: E402
+from kerio_vpn.mainloop import SelectorLoop  # noqa: E402
+from kerio_vpn.settings import load_settings  # noqa: E402
+from kerio_vpn.simulation import EPOCH, Replay  # noqa: E402
+
+# One soak cycle, (seconds into the cycle, event, arguments); it ends
+# connected and idle so every sample is taken in the same state
+CYCLE_LENGTH = 3600.0
+CYCLE = [
+    (60, 'user_disconnect', {}),
+    (180, 'user_connect', {}),
+    (600, 'tunnel_down', {}),  # Auto-reconnect
+    (1200, 'link_down', {}),
+    (1200.5, 'link_up', {}),
+    (1500, 'address_lost', {}),
+    (1500.3, 'address_added', {}),
+    (1800, 'user_reconnect', {}),
+    (2100, 'uplink_down', {}),
+    (2160, 'uplink_up', {}),
+    (2161, 'tunnel_down', {}),
+    (2400, 'failing_starts', {'count': 1}),
+    (2400, 'unit_failed', {}),
+    (2700, 'sleep', {}),
+    (3000, 'resume', {}),
+    (3005, 'uplink_up', {}),
+]
+
+
+class OutputSink:
+    """stdout for the core: keeps nothing but the count of callback errors"""
+
+    def __init__(self):
+        self.errors = 0
+
+    def write(self, text):
+        if 'Error in' in text:
+            self.errors += 1
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Soak:
+    """A Replay driven cycle after cycle, sampled between cycles"""
+
+    def __init__(self, config_file, interval):
+        settings = load_settings(os.devnull)
+        # Poll at a steady rate so a cycle is worth a predictable number of ticks
+        for option in ('fast_interval', 'base_interval', 'max_interval'):
+            settings.set('scheduler', option, str(interval))
+        self.replay = Replay([], settings=settings, events=False, config_file=config_file)
+        self.replay.core.listeners.append(self.on_changed)
+        self.cycles = 0
+        self.most_reconnect_sources = 0
+
+    @property
+    def ticks(self):
+        return self.replay.core.poll_histogram.count
+
+    def on_changed(self, core):
+        # Overlapping auto_reconnect timers would each restart the unit
+        pending = sum(1 for _interval, fn, _args in self.replay.loop.timers.values()
+                      if fn == core.auto_reconnect)
+        self.most_reconnect_sources = max(self.most_reconnect_sources, pending)
+
+    def start(self):
+        self.replay.host.tunnel_up()
+        self.replay.start()
+
+    def run_until_ticks(self, ticks):
+        replay = self.replay
+        while self.ticks < ticks:
+            base = EPOCH + self.cycles * CYCLE_LENGTH
+            for offset, event, arguments in CYCLE:
+                replay.loop.run_until(base + offset)
+                replay.apply(event, arguments)
+            replay.loop.run_until(base + CYCLE_LENGTH)
+            self.cycles += 1
+            # The replay's own records grow by design; only the core's state counts
+            replay.transitions.clear()
+            replay.host.actions.clear()
+            replay.host.notifications.clear()
+
+    def sample(self):
+        # A full collection also empties the free lists, which tracemalloc
+        # counts as allocated; a burst that fills them is not a leak
+        gc.collect()
+        return {
+            'ticks': self.ticks,
+            'cycles': self.cycles,
+            'rss': rss_bytes(),
+            'traced': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0,
+            'fds': open_fds(),
+            'sources': self.replay.loop.live_sources(),
+            'connected': self.replay.core.is_connected,
+        }
+
+    def close(self):
+        self.replay.close()
+
+
+def run_commands(count):
+    """Start `count` processes one after another on the real runner; (fds, threads) after each half"""
+    loop = SelectorLoop()
+    runner = CommandRunner(loop.idle_add)
+    remaining = [count]
+    marks = []
+
+    def next_command(result=None):
+        if result is not None and not result.ok:
+            raise RuntimeError(f"`true` failed: {result.describe_error()}")
+        if remaining[0] in (count // 2, 0):
+            marks.append((open_fds(), threading.active_count()))
+        if remaining[0] == 0:
+            loop.quit()
+            return
+        remaining[0] -= 1
+        runner.run(['true'], next_command, key=('true', remaining[0]))
+
+    loop.idle_add(next_command)
+    loop.run()
+    runner.shutdown()
+    loop.close()
+    return runner.spawned, marks
+
+
+def megabytes(size):
+    return f"{size / 2 ** 20:.1f} MB" if size is not None else 'n/a'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ticks', type=int, default=1000000, help='status ticks to simulate')
+    parser.add_argument('--samples', type=int, default=10, help='samples after the warm-up')
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help='simulated seconds between status checks')
+    parser.add_argument('--commands', type=int, default=2000,
+                        help='real processes to start through CommandRunner')
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false',
+                        help='skip allocation tracing (several times faster)')
+    parser.add_argument('--rss-budget', type=float, default=8.0, metavar='MB',
+                        help='resident memory growth allowed after the warm-up')
+    parser.add_argument('--traced-budget', type=float, default=256.0, metavar='KB',
+                        help='traced Python memory growth allowed after the warm-up')
+    parser.add_argument('--fd-budget', type=int, default=0, help='open fd growth allowed')
+    parser.add_argument('--source-budget', type=int, default=0,
+                        help='main loop source growth allowed')
+    parser.add_argument('--top', type=int, default=5, help='allocators to list')
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['XDG_STATE_HOME'] = directory
+        config_file = os.path.join(directory, 'kerio-kvc.conf')
+        config = KerioConfig.new()
+        config.set('server', 'vpn.example.com')
+        config.save(config_file)
+
+        sink = OutputSink()
+        soak = Soak(config_file, args.interval)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sink):
+            soak.start()
+            # Warm-up: histograms, caches and the session log settle first
+            soak.run_until_ticks(args.ticks // (args.samples + 1))
+            if args.tracemalloc:
+                tracemalloc.start(1)
+                snapshot = tracemalloc.take_snapshot()
+            samples = [soak.sample()]
+            for index in range(1, args.samples + 1):
+                soak.run_until_ticks(args.ticks * (index + 1) // (args.samples + 1))
+                samples.append(soak.sample())
+            if args.tracemalloc:
+                growth = tracemalloc.take_snapshot().compare_to(snapshot, 'traceback')
+                tracemalloc.stop()
+        elapsed = time.perf_counter() - started
+        soak.close()
+
+    print(f"{'ticks':>10}{'cycles':>8}{'rss':>10}{'traced':>12}{'fds':>6}{'sources':>9}")
+    for sample in samples:
+        print(f"{sample['ticks']:>10,}{sample['cycles']:>8}{megabytes(sample['rss']):>10}"
+              f"{sample['traced'] / 1024:>9.1f} KB{sample['fds'] or 0:>6}{sample['sources']:>9}")
+    simulated = soak.cycles * CYCLE_LENGTH
+    print(f"{soak.ticks:,} ticks and {soak.cycles:,} connect/disconnect cycles "
+          f"({simulated / 86400:.0f} days simulated) in {elapsed:.1f} s: "
+          f"{soak.ticks / elapsed:,.0f} ticks/s")
+
+    first, last = samples[0], samples[-1]
+    if sink.errors:
+        failures.append(f"{sink.errors} main loop callbacks raised")
+    if not all(sample['connected'] for sample in samples):
+        failures.append("the core was not connected at the end of every cycle")
+    if first['rss'] is not None and last['rss'] - first['rss'] > args.rss_budget * 2 ** 20:
+        failures.append(f"resident memory grew {megabytes(last['rss'] - first['rss'])}, "
+                        f"budget {args.rss_budget:g} MB")
+    if last['traced'] - first['traced'] > args.traced_budget * 1024:
+        failures.append(f"traced memory grew {(last['traced'] - first['traced']) / 1024:.1f} KB, "
+                        f"budget {args.traced_budget:g} KB")
+    if first['fds'] is not None and last['fds'] - first['fds'] > args.fd_budget:
+        failures.append(f"open fds grew from {first['fds']} to {last['fds']}")
+    if last['sources'] - first['sources'] > args.source_budget:
+        failures.append(f"main loop sources grew from {first['sources']} to {last['sources']}")
+    if soak.most_reconnect_sources > 1:
+        failures.append(f"{soak.most_reconnect_sources} auto-reconnect timers were pending at once")
+
+    if args.tracemalloc:
+        print("top allocators since the warm-up:")
+        for stat in growth[:args.top]:
+            frame = stat.traceback[-1]
+            print(f"  {stat.size_diff / 1024:+9.1f} KB {stat.count_diff:+7} blocks  "
+                  f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno}")
+
+    if args.commands:
+        try:
+            spawned, marks = run_commands(args.commands)
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            failures.append(f"commands: {e}")
+        else:
+            (fds_half, threads_half), (fds_end, threads_end) = marks
+            print(f"{spawned:,} processes through CommandRunner: "
+                  f"{fds_half} -> {fds_end} fds, {threads_half} -> {threads_end} threads")
+            if fds_half is not None and fds_end - fds_half > args.fd_budget:
+                failures.append(f"command pipes leaked: {fds_half} -> {fds_end} fds")
+            if threads_end > threads_half:
+                failures.append(f"command threads leaked: {threads_half} -> {threads_end}")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+CLI startup benchmark
+Runs the gi-free command line paths of kerio-vpn-indicator as fresh
+processes and compares their median wall time, minus a bare interpreter
+start, against a budget. Also fails if any of them imports gi.
+
+    python3 benchmarks/startup.py [--runs 20] [--budget-ms 50]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'kerio-vpn-indicator.py')
+
+# Paths that must stay fast; the tray itself is covered by later budgets
+COMMANDS = (
+    ('--help',),
+    ('status',),
+    ('status', '--json'),
+    ('history', '--file', os.devnull),
+)
+
+
+def wall_time(args, runs):
+    """Median seconds to run args to completion"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def imported_modules(args):
+    """Module names imported by a run, from -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            if name != 'package':  # header line
+                modules.add(name)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=50.0,
+                        help='allowed median time above a bare interpreter start')
+    args = parser.parse_args()
+
+    baseline = wall_time([sys.executable, '-c', 'pass'], args.runs)
+    print(f"{'python -c pass':32} {baseline * 1000:7.1f} ms")
+
+    failed = False
+    for command in COMMANDS:
+        argv = [SCRIPT] + list(command)
+        overhead = wall_time([sys.executable] + argv, args.runs) - baseline
+        leaked = sorted(name for name in imported_modules(argv)
+                        if name == 'gi' or name.startswith('gi.'))
+        verdict = 'ok'
+        if overhead * 1000 > args.budget_ms:
+            verdict = 'OVER BUDGET'
+        if leaked:
+            verdict = f"imports {', '.join(leaked)}"
+        failed = failed or verdict != 'ok'
+        print(f"{' '.join(command):32} {overhead * 1000:+7.1f} ms  {verdict}")
+
+    print(f"budget: +{args.budget_ms:.0f} ms over interpreter start, no gi imports")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Traffic counter check
+Points InterfaceCounters at a fake sysfs tree in a temp dir and drives
+a TrafficMonitor on a fake clock through it: current and average rates,
+session totals, the ring buffer bound, a counter that goes backwards
+(32-bit wrap or the interface recreated), an interface that vanishes
+mid-session and one that never existed. Checks that the statistics
+files are opened once and then read with pread, and reports the cost of
+one sample against reopening the files every time.
+
+    python3 benchmarks/traffic.py
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.instrument import open_fds  # noqa: E402
+from kerio_vpn.traffic import (COUNTERS, InterfaceCounters, TrafficMonitor,  # noqa: E402
+                               format_bytes, format_rate)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeInterface:
+    """statistics/ of one interface under a temp sysfs root"""
+
+    def __init__(self, sysfs_root, ifname='kvnet'):
+        self.directory = os.path.join(sysfs_root, ifname, 'statistics')
+        self.values = dict.fromkeys(COUNTERS, 0)
+
+    def create(self, **values):
+        os.makedirs(self.directory, exist_ok=True)
+        self.values = dict.fromkeys(COUNTERS, 0)
+        self.set(**values)
+
+    def set(self, **values):
+        """Rewrite counters in place: the reader keeps its descriptors open"""
+        self.values.update(values)
+        for name in COUNTERS:
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(f"{self.values[name]}\n")
+
+    def add(self, **deltas):
+        self.set(**{name: self.values[name] + delta for name, delta in deltas.items()})
+
+    def remove(self):
+        # Open sysfs files of a deleted interface fail to read; emptied ones do too
+        for name in COUNTERS:
+            open(os.path.join(self.directory, name), 'w').close()
+        shutil.rmtree(os.path.dirname(self.directory))
+
+
+def expect(failures, label, value, expected):
+    if value != expected:
+        failures.append(f"{label}: {value!r}, expected {expected!r}")
+
+
+def check_rates(sysfs_root, failures):
+    interface = FakeInterface(sysfs_root)
+    interface.create(rx_bytes=5000, tx_bytes=700)
+    clock = FakeClock()
+    counters = InterfaceCounters('kvnet', sysfs_root=sysfs_root)
+    monitor = TrafficMonitor(counters, size=4, clock=clock)
+
+    fds = open_fds()
+    expect(failures, "first sample", monitor.sample(), True)
+    expect(failures, "totals after one sample", monitor.session_totals()['rx_bytes'], 0)
+    expect(failures, "rates after one sample", monitor.current_rates(), (0.0, 0.0))
+    for rx, tx in ((1000, 100), (3000, 300)):
+        clock.now += 1
+        interface.add(rx_bytes=rx, tx_bytes=tx)
+        monitor.sample()
+    expect(failures, "current rates", monitor.current_rates(), (3000.0, 300.0))
+    expect(failures, "average rates", monitor.average_rates(), (2000.0, 200.0))
+    totals = monitor.session_totals()
+    expect(failures, "session totals", (totals['rx_bytes'], totals['tx_bytes']), (4000, 400))
+    if fds is not None:
+        expect(failures, "descriptors held", open_fds() - fds, len(COUNTERS))
+
+    # The ring keeps `size` samples; the average covers only those
+    for _ in range(5):
+        clock.now += 2
+        interface.add(rx_bytes=500)
+        monitor.sample()
+    expect(failures, "ring size", len(monitor.samples), 4)
+    expect(failures, "average over the ring", monitor.average_rates(), (250.0, 0.0))
+
+    # A counter going backwards was reset: all it shows now is new traffic
+    before, counter = monitor.session_totals()['rx_bytes'], interface.values['rx_bytes']
+    clock.now += 1
+    interface.set(rx_bytes=2 ** 32 - 100)
+    monitor.sample()
+    clock.now += 1
+    interface.set(rx_bytes=50)
+    monitor.sample()
+    expect(failures, "totals across a wrap", monitor.session_totals()['rx_bytes'],
+           before + (2 ** 32 - 100 - counter) + 50)
+
+    # The interface goes away mid-session and comes back with fresh counters
+    before = monitor.session_totals()['rx_bytes']
+    interface.remove()
+    clock.now += 1
+    expect(failures, "sample of a removed interface", monitor.sample(), False)
+    expect(failures, "descriptors after removal", counters.fds, None)
+    expect(failures, "sample while it is missing", monitor.sample(), False)
+    interface.create(rx_bytes=300)
+    clock.now += 1
+    expect(failures, "sample after it is back", monitor.sample(), True)
+    expect(failures, "totals after recreation", monitor.session_totals()['rx_bytes'], before + 300)
+
+    monitor.reset()
+    expect(failures, "totals after reset", monitor.session_totals()['rx_bytes'], 0)
+    counters.close()
+    if fds is not None:
+        expect(failures, "descriptors after close", open_fds() - fds, 0)
+
+
+def check_missing(sysfs_root, failures):
+    counters = InterfaceCounters('nosuchif', sysfs_root=sysfs_root)
+    monitor = TrafficMonitor(counters, clock=FakeClock())
+    expect(failures, "missing interface read", counters.read(), None)
+    expect(failures, "missing interface sample", monitor.sample(), False)
+    expect(failures, "missing interface rates", monitor.average_rates(), (0.0, 0.0))
+
+    # A partial tree (some files missing) is treated as missing, without leaking fds
+    partial = os.path.join(sysfs_root, 'partial', 'statistics')
+    os.makedirs(partial)
+    for name in COUNTERS[:3]:
+        with open(os.path.join(partial, name), 'w') as f:
+            f.write("1\n")
+    fds = open_fds()
+    expect(failures, "partial interface read", InterfaceCounters('partial', sysfs_root).read(), None)
+    if fds is not None:
+        expect(failures, "descriptors after a partial tree", open_fds() - fds, 0)
+
+
+def check_format(failures):
+    for value, expected in ((0, '0 B'), (1023, '1023 B'), (1536, '1.5 KB'),
+                            (5 * 2 ** 20, '5.0 MB'), (3 * 2 ** 40, '3.0 TB')):
+        expect(failures, f"format_bytes({value})", format_bytes(value), expected)
+    expect(failures, "format_rate(2048)", format_rate(2048), '2.0 KB/s')
+
+
+def time_samples(sysfs_root, runs):
+    """Microseconds per sample with kept-open descriptors and with reopening"""
+    kept = InterfaceCounters('kvnet', sysfs_root=sysfs_root)
+    kept.read()
+    started = time.perf_counter()
+    for _ in range(runs):
+        kept.read()
+    pread = (time.perf_counter() - started) / runs
+    kept.close()
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        reopened = InterfaceCounters('kvnet', sysfs_root=sysfs_root)
+        reopened.read()
+        reopened.close()
+    reopen = (time.perf_counter() - started) / runs
+    return pread * 1e6, reopen * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5000, help='samples to time')
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as sysfs_root:
+        check_rates(sysfs_root, failures)
+        check_missing(sysfs_root, failures)
+        check_format(failures)
+
+        FakeInterface(sysfs_root).create(rx_bytes=123456789)
+        pread, reopen = time_samples(sysfs_root, args.runs)
+        print(f"one sample: {pread:.1f} us with pread on open files, "
+              f"{reopen:.1f} us reopening them ({reopen / pread:.1f}x)")
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
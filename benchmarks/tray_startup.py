@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tray startup benchmark
+Starts the tray with KERIO_VPN_STARTUP_PROBE set, which makes it print
+each startup phase and quit after the first status check, and times the
+phases from process launch. Also lists import time per module on the
+path to the icon and on the deferred path. Needs PyGObject and a desktop
+session for the phase timings; the import report runs anywhere.
+
+    python3 benchmarks/tray_startup.py [--runs 10]
+
+Budget (median on a mid-range laptop, warm caches):
+    first icon          300 ms   interpreter + gi + Gtk + AppIndicator3
+    first status check  600 ms   core, D-Bus clients, first update_status
+    kerio_vpn imports    25 ms   gi-free modules loaded before the icon
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'kerio-vpn-indicator.py')
+
+BUDGET_MS = {'icon': 300.0, 'first-status': 600.0}
+OWN_IMPORT_BUDGET_MS = 25.0
+
+# What the tray imports before the icon, and what start_core pulls in later
+CRITICAL_IMPORTS = 'import kerio_vpn.tray'
+CRITICAL_GI_FREE_IMPORTS = 'import kerio_vpn.statecache, kerio_vpn.traffic'
+DEFERRED_IMPORTS = 'import kerio_vpn.core, kerio_vpn.systemd, kerio_vpn.notifications'
+DEFERRED_GI_FREE_IMPORTS = 'import kerio_vpn.core'
+
+
+def run_phases():
+    """Seconds from launch to each reported phase, None if the tray could not start"""
+    env = dict(os.environ, KERIO_VPN_STARTUP_PROBE='1')
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SCRIPT], env=env, cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    phases = {}
+    try:
+        for line in process.stdout:
+            if line.startswith('startup: '):
+                phases[line.split(': ', 1)[1].strip()] = time.perf_counter() - started
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return phases if 'icon' in phases else None
+
+
+def import_times(statement):
+    """[(module, self ms, cumulative ms, top level)] for kerio_vpn and top-level imports"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return None
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        top_level = not name.startswith('  ')
+        name = name.strip()
+        if top_level or name.startswith('kerio_vpn') or name in ('gi', 'gi.repository'):
+            rows.append((name, int(self_us) / 1000, int(cumulative_us) / 1000, top_level))
+    return rows
+
+
+def report_imports(title, statement):
+    """Print the per-module table; returns ms spent importing kerio_vpn, None on failure"""
+    rows = import_times(statement)
+    print(f"\n{title}: {statement}")
+    if rows is None:
+        print("  (import failed, PyGObject missing?)")
+        return None
+    for name, self_ms, cumulative_ms, _top_level in sorted(rows, key=lambda row: -row[2]):
+        print(f"  {name:36} {self_ms:7.1f} ms self {cumulative_ms:8.1f} ms total")
+    return sum(cumulative_ms for name, _self_ms, cumulative_ms, top_level in rows
+               if top_level and name.startswith('kerio_vpn'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    failed = False
+
+    samples = []
+    for _ in range(args.runs):
+        phases = run_phases()
+        if phases is None:
+            break
+        samples.append(phases)
+    if samples:
+        print("phase                median ms   budget")
+        for phase in ('icon', 'core', 'first-status'):
+            values = [phases[phase] for phases in samples if phase in phases]
+            if not values:
+                continue
+            median_ms = statistics.median(values) * 1000
+            budget = BUDGET_MS.get(phase)
+            verdict = ''
+            if budget is not None:
+                verdict = f"{budget:6.0f}  {'ok' if median_ms <= budget else 'OVER BUDGET'}"
+                failed = failed or median_ms > budget
+            print(f"{phase:20} {median_ms:9.1f}   {verdict}")
+    else:
+        print("tray did not start (no PyGObject or no desktop session), skipping phase timings")
+
+    report_imports("before the icon", CRITICAL_IMPORTS)
+    own = report_imports("before the icon, gi-free part", CRITICAL_GI_FREE_IMPORTS)
+    if report_imports("deferred until after the icon", DEFERRED_IMPORTS) is None:
+        report_imports("deferred, gi-free part", DEFERRED_GI_FREE_IMPORTS)
+    if own is not None:
+        verdict = 'ok' if own <= OWN_IMPORT_BUDGET_MS else 'OVER BUDGET'
+        failed = failed or own > OWN_IMPORT_BUDGET_MS
+        print(f"\nkerio_vpn import time before the icon: {own:.1f} ms "
+              f"(budget {OWN_IMPORT_BUDGET_MS:.0f} ms) {verdict}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+systemd unit watcher check
+Runs a stand-in org.freedesktop.systemd1 with one kerio-kvc.service unit
+on a private D-Bus and points UnitWatcher at it. Checks that the watcher
+subscribes and loads the unit, serves status() from its cache without
+spawning systemctl, follows PropertiesChanged, ignores repeats and
+unwatched properties, fetches a property that was only invalidated, and
+falls back to systemctl when systemd is not on the bus. Reports the
+delay from a unit change to on_change. Needs PyGObject and dbus-daemon.
+
+    python3 benchmarks/unit_watcher.py [--runs 200]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kerio_vpn.service import UNIT  # noqa: E402
+
+UNIT_PATH = '/org/freedesktop/systemd1/unit/kerio_2dkvc_2eservice'
+ENTERED = 1700000000123456  # ActiveEnterTimestamp, microseconds
+
+SYSTEMD_XML = '''
+<node>
+  <interface name="org.freedesktop.systemd1.Manager">
+    <method name="Subscribe"/>
+    <method name="LoadUnit">
+      <arg name="name" type="s" direction="in"/>
+      <arg name="unit" type="o" direction="out"/>
+    </method>
+  </interface>
+  <interface name="org.freedesktop.systemd1.Unit">
+    <property name="ActiveState" type="s" access="read"/>
+    <property name="SubState" type="s" access="read"/>
+    <property name="ActiveEnterTimestamp" type="t" access="read"/>
+    <property name="Description" type="s" access="read"/>
+  </interface>
+</node>
+'''
+
+
+class StandInSystemd:
+    """systemd1 with one unit, served from its own thread and main context
+
+    The watcher makes blocking calls (Subscribe, LoadUnit, GetAll) from the
+    main thread, so the stand-in must not need the main context to answer
+    """
+
+    def __init__(self, address):
+        from gi.repository import Gio, GLib
+        from kerio_vpn import systemd
+
+        self.Gio, self.GLib, self.systemd = Gio, GLib, systemd
+        self.address = address
+        self.properties = {
+            'ActiveState': GLib.Variant('s', 'active'),
+            'SubState': GLib.Variant('s', 'running'),
+            'ActiveEnterTimestamp': GLib.Variant('t', ENTERED),
+            'Description': GLib.Variant('s', 'Kerio VPN client'),
+        }
+        self.subscribed = 0
+        self.loaded = []
+        self.gets = 0
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        if not self.ready.wait(10):
+            raise RuntimeError("stand-in systemd did not start")
+
+    def serve(self):
+        Gio, GLib = self.Gio, self.GLib
+        context = GLib.MainContext.new()
+        context.push_thread_default()
+        flags = (Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT
+                 | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION)
+        self.connection = Gio.DBusConnection.new_for_address_sync(self.address, flags, None, None)
+        manager, unit = Gio.DBusNodeInfo.new_for_xml(SYSTEMD_XML).interfaces
+        self.connection.register_object(self.systemd.SYSTEMD_PATH, manager,
+                                        self.method_call, None, None)
+        self.connection.register_object(UNIT_PATH, unit, None, self.get_property, None)
+        self.connection.call_sync('org.freedesktop.DBus', '/org/freedesktop/DBus',
+                                  'org.freedesktop.DBus', 'RequestName',
+                                  GLib.Variant('(su)', (self.systemd.SYSTEMD_BUS_NAME, 0)),
+                                  GLib.VariantType('(u)'), Gio.DBusCallFlags.NONE, -1, None)
+        self.loop = GLib.MainLoop.new(context, False)
+        self.ready.set()
+        self.loop.run()
+        self.connection.close_sync(None)
+        context.pop_thread_default()
+
+    def method_call(self, connection, sender, path, interface, method, parameters, invocation):
+        if method == 'Subscribe':
+            self.subscribed += 1
+            invocation.return_value(None)
+        elif method == 'LoadUnit':
+            self.loaded.append(parameters.unpack()[0])
+            invocation.return_value(self.GLib.Variant('(o)', (UNIT_PATH,)))
+        else:
+            invocation.return_dbus_error('org.freedesktop.DBus.Error.UnknownMethod', method)
+
+    def get_property(self, connection, sender, path, interface, name):
+        self.gets += 1
+        return self.properties[name]
+
+    def change(self, invalidate=(), **values):
+        """Update properties and emit PropertiesChanged; names in `invalidate` go without a value"""
+        GLib = self.GLib
+        for name, value in values.items():
+            self.properties[name] = GLib.Variant(self.properties[name].get_type_string(), value)
+        changed = {name: self.properties[name] for name in values if name not in invalidate}
+        self.connection.emit_signal(
+            None, UNIT_PATH, 'org.freedesktop.DBus.Properties', 'PropertiesChanged',
+            GLib.Variant('(sa{sv}as)', (self.systemd.UNIT_INTERFACE, changed, list(invalidate))))
+
+    def stop(self):
+        self.loop.quit()
+        self.thread.join(5)
+
+
+def pump(timeout, condition):
+    """Iterate the main context until condition() or the timeout; returns condition()"""
+    from gi.repository import GLib
+
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        if not context.iteration(False):
+            time.sleep(0.0005)
+    return condition()
+
+
+def check_watcher(systemd, client, failures):
+    from kerio_vpn.systemd import UnitWatcher
+
+    changes = []
+    watcher = UnitWatcher(UNIT, connection=client, on_change=changes.append)
+    if not watcher.available:
+        failures.append("the watcher did not find the stand-in systemd")
+        return None
+    if systemd.subscribed != 1 or systemd.loaded != [UNIT]:
+        failures.append(f"Subscribe called {systemd.subscribed} times, LoadUnit with {systemd.loaded}")
+    if watcher.status() != (True, 'active') or watcher.sub_state != 'running':
+        failures.append(f"initial state {watcher.status()} {watcher.sub_state}")
+    if watcher.active_enter_timestamp != ENTERED / 1e6:
+        failures.append(f"ActiveEnterTimestamp read as {watcher.active_enter_timestamp}")
+
+    def expect_change(label, state, **values):
+        before = len(changes)
+        systemd.change(**values)
+        if not pump(3, lambda: len(changes) > before):
+            failures.append(f"{label}: no on_change")
+            return
+        pump(0.05, lambda: False)  # A second on_change would arrive now
+        if len(changes) != before + 1:
+            failures.append(f"{label}: on_change called {len(changes) - before} times")
+        if watcher.active_state != state:
+            failures.append(f"{label}: ActiveState {watcher.active_state}, expected {state}")
+
+    expect_change("stopping", 'deactivating', ActiveState='deactivating', SubState='stop-sigterm')
+    expect_change("stopped", 'inactive', ActiveState='inactive', SubState='dead')
+    if watcher.status() != (False, 'inactive'):
+        failures.append(f"status after stopping: {watcher.status()}")
+
+    # A repeat and an unwatched property are signalled but change nothing;
+    # the next real change must be the only on_change
+    systemd.change(ActiveState='inactive')
+    systemd.change(Description='Kerio VPN client (changed)')
+    expect_change("after a repeat and an unwatched property", 'activating',
+                  ActiveState='activating', SubState='start')
+
+    gets = systemd.gets
+    expect_change("invalidated without a value", 'active', invalidate=('ActiveState',),
+                  ActiveState='active')
+    if systemd.gets != gets + 1:
+        failures.append(f"an invalidated property took {systemd.gets - gets} Get calls")
+
+    if watcher.spawned:
+        failures.append(f"systemctl spawned {watcher.spawned} times with systemd on the bus")
+    return watcher, changes
+
+
+def time_changes(systemd, watcher, changes, runs):
+    """Median microseconds from PropertiesChanged emitted to on_change"""
+    samples = []
+    for index in range(runs):
+        before = len(changes)
+        started = time.perf_counter()
+        systemd.change(ActiveState='inactive' if index % 2 else 'active')
+        if pump(3, lambda: len(changes) > before):
+            samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6 if samples else None
+
+
+def check_fallback(client, failures):
+    """systemd gone from the bus: no cache, status() runs systemctl"""
+    from kerio_vpn.systemd import UnitWatcher
+
+    output = io.StringIO()
+    started = time.monotonic()
+    with contextlib.redirect_stdout(output):
+        watcher = UnitWatcher(UNIT, connection=client)
+        elapsed = time.monotonic() - started
+        watcher.status()
+    if watcher.available:
+        failures.append("a watcher without systemd on the bus claims to be available")
+    if watcher.spawned != 1:
+        failures.append(f"status() without systemd spawned systemctl {watcher.spawned} times")
+    if 'using systemctl' not in output.getvalue():
+        failures.append("the fallback to systemctl was not reported")
+    if elapsed > 1:
+        failures.append(f"finding systemd missing took {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200, help='unit changes to time')
+    args = parser.parse_args()
+    failures = []
+
+    try:
+        from gi.repository import Gio
+    except ImportError:
+        print("PyGObject is not installed, skipping")
+        print("checks: skipped")
+        return 0
+
+    bus = Gio.TestDBus.new(Gio.TestDBusFlags.NONE)
+    bus.up()
+    flags = (Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT
+             | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION)
+    client = Gio.DBusConnection.new_for_address_sync(bus.get_bus_address(), flags, None, None)
+    systemd = StandInSystemd(bus.get_bus_address())
+    try:
+        result = check_watcher(systemd, client, failures)
+        if result is not None:
+            latency = time_changes(systemd, *result, args.runs)
+            if latency is not None:
+                print(f"unit change to on_change: {latency:.0f} us median")
+    finally:
+        systemd.stop()
+    check_fallback(client, failures)
+    client.close_sync(None)
+    bus.down()
+
+    for failure in failures:
+        print(failure)
+    print(f"checks: {'ok' if not failures else f'{len(failures)} failed'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -84,6 +84,13 @@ if [ "$XDG_CURRENT_DESKTOP" = "GNOME" ]; then
     echo ""
 fi
 
+# Install shared modules
+echo "Installing shared modules..."
+sudo mkdir -p /usr/local/lib/kerio-vpn-indicator
+sudo rm -rf /usr/local/lib/kerio-vpn-indicator/kerio_vpn
+sudo cp -r kerio_vpn /usr/local/lib/kerio-vpn-indicator/
+echo "✓ Installed to /usr/local/lib/kerio-vpn-indicator"
+
 # Install the indicator script
 echo "Installing kerio-vpn-indicator..."
 sudo cp kerio-vpn-indicator.py /usr/local/bin/kerio-vpn-indicator
@@ -107,7 +114,15 @@ mkdir -p ~/.config/autostart
 cp kerio-vpn-indicator.desktop ~/.config/autostart/
 echo "✓ Installed autostart entry"
 
-# Install sudoers rules if they exist
+# Install the privileged helper, so the indicator and the editor don't
+# need sudo for each action
+echo "Installing privileged helper..."
+sudo cp kerio-vpn-helper.socket kerio-vpn-helper.service /etc/systemd/system/
+sudo systemctl daemon-reload
+sudo systemctl enable --now kerio-vpn-helper.socket
+echo "✓ Installed kerio-vpn-helper.socket"
+
+# Install sudoers rules if they exist (fallback when the helper is not running)
 if [ -f "kerio-vpn-sudoers" ]; then
     echo "Installing sudoers rules for passwordless operation..."
     sudo visudo -c -f kerio-vpn-sudoers
@@ -7,12 +7,28 @@ GUI tool to edit /etc/kerio-kvc.conf settings
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib
-import xml.etree.ElementTree as ET
-import html
-import subprocess
 import os
 import sys
 
+# Shared modules live next to this script in a checkout and under
+# /usr/local/lib/kerio-vpn-indicator once installed
+for lib_dir in (os.path.dirname(os.path.realpath(__file__)), '/usr/local/lib/kerio-vpn-indicator'):
+    if os.path.isdir(os.path.join(lib_dir, 'kerio_vpn')):
+        sys.path.insert(0, lib_dir)
+        break
+
+from kerio_vpn.commands import CommandResult, CommandRunner
+from kerio_vpn.conntest import LABELS, ConnectionTest
+from kerio_vpn.fingerprint import get_fingerprint
+from kerio_vpn.gateways import GatewaySelector, parse_candidates
+from kerio_vpn.health import HealthProber
+from kerio_vpn.helper import SYSTEMCTL_TIMEOUT, PrivilegedClient
+from kerio_vpn.kerioconf import KerioConfig
+from kerio_vpn.mainloop import GLibLoop
+from kerio_vpn.service import UNIT
+from kerio_vpn.settings import load_settings
+from kerio_vpn.systemd import UnitWatcher
+
 class KerioConfigEditor(Gtk.Window):
     def __init__(self):
         super().__init__(title="Kerio VPN Configuration")
@@ -21,6 +37,31 @@ class KerioConfigEditor(Gtk.Window):
         self.set_position(Gtk.WindowPosition.CENTER)
         
         self.config_file = '/etc/kerio-kvc.conf'
+        self.config = None  # KerioConfig as loaded, edited in place on save
+        
+        # Cached service state over D-Bus, falls back to systemctl
+        self.unit_watcher = UnitWatcher('kerio-kvc.service')
+        
+        # Root operations go through kerio-vpn-helper, one connection for
+        # the editor's lifetime; falls back to sudo without the helper
+        settings = load_settings()
+        self.settings = settings
+        self.privileged = PrivilegedClient(settings.get('helper', 'socket'))
+        
+        # Helper calls and the connection test's blocking calls run off the
+        # GTK thread; the helper serves one call at a time, so they can wait
+        # on each other for up to SYSTEMCTL_TIMEOUT
+        self.loop = GLibLoop()
+        self.commands = CommandRunner(self.loop.idle_add)
+        self.connection_test = None
+        self.busy = 0  # Calls and tests in flight; the buttons wait for all of them
+        
+        # The server field may list several gateways; rankings are cached
+        self.gateway_selector = GatewaySelector(
+            attempts=settings.getint('gateways', 'attempts'),
+            timeout=settings.getfloat('gateways', 'timeout'),
+            ttl=settings.getfloat('gateways', 'cache_ttl')
+        )
         
         # Main container
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
@@ -44,7 +85,7 @@ class KerioConfigEditor(Gtk.Window):
         label = Gtk.Label(label="VPN Server:", xalign=0)
         grid.attach(label, 0, 0, 1, 1)
         self.server_entry = Gtk.Entry()
-        self.server_entry.set_placeholder_text("vpn.example.com or IP address")
+        self.server_entry.set_placeholder_text("vpn.example.com, or several separated by commas")
         self.server_entry.set_hexpand(True)
         grid.attach(self.server_entry, 1, 0, 1, 1)
         
@@ -93,6 +134,7 @@ class KerioConfigEditor(Gtk.Window):
         # Status label
         self.status_label = Gtk.Label(label="")
         self.status_label.set_margin_top(10)
+        self.status_label.set_line_wrap(True)  # Test results list every phase
         vbox.pack_start(self.status_label, False, False, 0)
         
         # Buttons
@@ -101,20 +143,20 @@ class KerioConfigEditor(Gtk.Window):
         vbox.pack_start(button_box, False, False, 0)
         
         # Load button
-        load_button = Gtk.Button(label="Load Current Settings")
-        load_button.connect("clicked", self.on_load_clicked)
-        button_box.pack_start(load_button, True, True, 0)
+        self.load_button = Gtk.Button(label="Load Current Settings")
+        self.load_button.connect("clicked", self.on_load_clicked)
+        button_box.pack_start(self.load_button, True, True, 0)
         
         # Save button
-        save_button = Gtk.Button(label="Save & Apply")
-        save_button.get_style_context().add_class("suggested-action")
-        save_button.connect("clicked", self.on_save_clicked)
-        button_box.pack_start(save_button, True, True, 0)
+        self.save_button = Gtk.Button(label="Save & Apply")
+        self.save_button.get_style_context().add_class("suggested-action")
+        self.save_button.connect("clicked", self.on_save_clicked)
+        button_box.pack_start(self.save_button, True, True, 0)
         
         # Test connection button
-        test_button = Gtk.Button(label="Test Connection")
-        test_button.connect("clicked", self.on_test_clicked)
-        button_box.pack_start(test_button, True, True, 0)
+        self.test_button = Gtk.Button(label="Test Connection")
+        self.test_button.connect("clicked", self.on_test_clicked)
+        button_box.pack_start(self.test_button, True, True, 0)
         
         # Close button
         close_button = Gtk.Button(label="Close")
@@ -128,66 +170,38 @@ class KerioConfigEditor(Gtk.Window):
         """Toggle password visibility"""
         self.password_entry.set_visibility(widget.get_active())
     
-    def decode_html_entities(self, text):
-        """Decode HTML entities like &#33; -> !"""
-        if not text:
-            return text
-        return html.unescape(text)
-    
-    def encode_html_entities(self, text):
-        """Encode special characters as HTML entities"""
-        if not text:
-            return text
-        
-        # Map of characters to their HTML entity codes
-        special_chars = {
-            '!': '&#33;',
-            '"': '&#34;',
-            '#': '&#35;',
-            '$': '&#36;',
-            '%': '&#37;',
-            '&': '&#38;',
-            "'": '&#39;',
-            '<': '&#60;',
-            '>': '&#62;',
-            '@': '&#64;',
-            '\\': '&#92;'
-        }
-        
-        # Process character by character to avoid double-encoding
-        result = []
-        for char in text:
-            if char in special_chars:
-                result.append(special_chars[char])
-            else:
-                result.append(char)
-        
-        return ''.join(result)
+    def is_active(self, value):
+        """Kerio accepts 'yes'/'no' as well as '1'/'0' for <active>"""
+        return value.strip().lower() in ['yes', '1', 'true']
     
     def load_config(self):
-        """Load configuration from /etc/kerio-kvc.conf"""
+        """Read /etc/kerio-kvc.conf through the helper on a worker, then fill in the form"""
+        self.set_busy(True)
+        self.show_status("Loading configuration...", "info")
+        self.commands.call(lambda: self.privileged.get_config(self.config_file),
+                           callback=self.on_config_loaded, key=('config', 'load'),
+                           timeout=SYSTEMCTL_TIMEOUT + 10)
+        return False  # Don't repeat the timeout
+    
+    def on_config_loaded(self, config_text, error):
+        """The config text arrived, or reading it failed"""
+        self.set_busy(False)
+        if error is not None:
+            self.show_status(f"Error loading config: {error}", "error")
+            return
         try:
-            # Read config file with sudo
-            result = subprocess.run(
-                ['sudo', 'cat', self.config_file],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode != 0:
+            if config_text is None:
                 self.show_status("Configuration file not found. Please fill in the settings.", "warning")
-                return False
+                return
             
-            # Parse XML from string
-            root = ET.fromstring(result.stdout)
+            # Parse once; saving patches this copy, so nothing it holds is lost
+            self.config = KerioConfig.parse(config_text)
+            config = self.config
             
-            connection = root.find('.//connection[@type="persistent"]')
-            if connection is not None:
+            if config.connection() is not None:
                 # Load values
-                server = connection.find('server')
-                if server is not None and server.text:
-                    server_text = self.decode_html_entities(server.text)
+                server_text = config.get('server')
+                if server_text:
                     # Check if port is included in server (format: server:port)
                     if ':' in server_text:
                         server_parts = server_text.rsplit(':', 1)
@@ -197,27 +211,26 @@ class KerioConfigEditor(Gtk.Window):
                         self.server_entry.set_text(server_text)
                 
                 # Check for separate port element
-                port = connection.find('port')
-                if port is not None and port.text:
-                    self.port_entry.set_text(port.text)
+                port = config.get('port')
+                if port:
+                    self.port_entry.set_text(port)
                 
-                username = connection.find('username')
-                if username is not None and username.text:
-                    self.username_entry.set_text(self.decode_html_entities(username.text))
+                username = config.get('username')
+                if username:
+                    self.username_entry.set_text(username)
                 
-                password = connection.find('password')
-                if password is not None and password.text:
-                    self.password_entry.set_text(self.decode_html_entities(password.text))
+                password = config.get('password')
+                if password:
+                    self.password_entry.set_text(password)
                 
-                description = connection.find('description')
-                if description is not None and description.text:
-                    self.description_entry.set_text(self.decode_html_entities(description.text))
+                description = config.get('description')
+                if description:
+                    self.description_entry.set_text(description)
                 
                 # Handle both 'yes'/'no' and '1'/'0' for active
-                active = connection.find('active')
-                if active is not None and active.text:
-                    active_value = active.text.strip().lower()
-                    self.autoconnect_check.set_active(active_value in ['yes', '1', 'true'])
+                active = config.get('active')
+                if active:
+                    self.autoconnect_check.set_active(self.is_active(active))
                 
                 self.show_status("Configuration loaded successfully", "success")
             else:
@@ -225,12 +238,9 @@ class KerioConfigEditor(Gtk.Window):
                 
         except Exception as e:
             self.show_status(f"Error loading config: {e}", "error")
-            return False
-        
-        return False  # Don't repeat the timeout
     
-    def save_config(self):
-        """Save configuration to /etc/kerio-kvc.conf"""
+    def save_config(self, on_saved):
+        """Save configuration to /etc/kerio-kvc.conf; on_saved(ok) runs once it is written or failed"""
         # Validate inputs
         server = self.server_entry.get_text().strip()
         port = self.port_entry.get_text().strip()
@@ -239,127 +249,147 @@ class KerioConfigEditor(Gtk.Window):
         
         if not server:
             self.show_status("Server is required", "error")
-            return False
+            on_saved(False)
+            return
         
         if not port:
             port = "4090"
         
         if not username:
             self.show_status("Username is required", "error")
-            return False
+            on_saved(False)
+            return
         
         if not password:
             self.show_status("Password is required", "error")
-            return False
+            on_saved(False)
+            return
         
-        # Build XML manually to avoid double-encoding
-        xml_lines = ['<config>', '  <connections>', '    <connection type="persistent">']
+        # Several gateways: probe them all at once and keep the fastest
+        try:
+            candidates = parse_candidates(server, port)
+        except ValueError:
+            self.show_status("Invalid port", "error")
+            on_saved(False)
+            return
         
-        xml_lines.append(f'      <server>{self.encode_html_entities(server)}:{port}</server>')
-        xml_lines.append(f'      <username>{self.encode_html_entities(username)}</username>')
-        xml_lines.append(f'      <password>{self.encode_html_entities(password)}</password>')
+        self.set_busy(True)
         
-        # Get server fingerprint
-        fingerprint = None
-        try:
-            # First try to preserve existing fingerprint
-            result = subprocess.run(['sudo', 'cat', self.config_file], 
-                                   capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                root = ET.fromstring(result.stdout)
-                connection = root.find('.//connection[@type="persistent"]')
-                if connection is not None:
-                    fp_elem = connection.find('fingerprint')
-                    if fp_elem is not None and fp_elem.text:
-                        fingerprint = fp_elem.text
-                        print(f"Preserving existing fingerprint: {fingerprint}")
-        except:
-            pass
-        
-        # If no existing fingerprint, get it from the server using MD5
-        if not fingerprint:
-            try:
-                print(f"Getting MD5 fingerprint from {server}:{port}...")
-                result = subprocess.run(
-                    f'openssl s_client -connect {server}:{port} < /dev/null 2>/dev/null | openssl x509 -fingerprint -md5 -noout',
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                
-                if result.returncode == 0 and result.stdout:
-                    # Extract fingerprint from output like "MD5 Fingerprint=XX:XX:XX:..."
-                    for line in result.stdout.split('\n'):
-                        if 'Fingerprint=' in line:
-                            fingerprint = line.split('=')[1].strip()
-                            print(f"Got fingerprint: {fingerprint}")
-                            break
-            except Exception as e:
-                print(f"Could not get fingerprint: {e}")
-                # Continue without fingerprint - Kerio will generate it on first connection
+        def finish(ok):
+            self.set_busy(False)
+            on_saved(ok)
+        
+        if len(candidates) == 1:
+            self.write_config(candidates[0][0], str(candidates[0][1]), username, password, finish)
+            return
         
+        def on_ranked(ranking, error):
+            if error is not None:
+                self.show_status(f"Could not measure gateways: {error}", "error")
+                finish(False)
+                return
+            if ranking[0] is None:
+                self.show_status("None of the gateways answered", "error")
+                finish(False)
+                return
+            best, results = ranking
+            print("Gateway ranking:")
+            for result in results:
+                print(f"  {result.describe()}")
+            self.write_config(best.host, str(best.port), username, password, finish)
+        
+        # Up to attempts × timeout of TLS handshakes: keep them off the GTK thread
+        self.show_status("Measuring gateways...", "info")
+        self.commands.call(lambda: self.rank_gateways(candidates), callback=on_ranked,
+                           key=('gateways', 'rank'))
+    
+    def rank_gateways(self, candidates):
+        """Worker thread: (best gateway or None, full ranking)"""
+        best = self.gateway_selector.best(candidates)
+        return best, self.gateway_selector.rank(candidates)
+    
+    def write_config(self, server, port, username, password, on_saved):
+        """Patch the loaded config with the chosen endpoint and write it"""
+        # Other connections and unknown elements stay as they were
+        config = self.config or KerioConfig.new()
+        
+        if config.set_endpoint(server, port):
+            # A fingerprint read with the config belongs to the old server
+            config.set('fingerprint', None)
+        config.set('username', username)
+        config.set('password', password)
+        
+        # Keep the fingerprint read with the config
+        fingerprint = config.get('fingerprint')
         if fingerprint:
-            xml_lines.append(f'      <fingerprint>{fingerprint}</fingerprint>')
+            print(f"Preserving existing fingerprint: {fingerprint}")
+            self.store_config(config, on_saved)
+            return
         
-        xml_lines.append(f'      <active>{"1" if self.autoconnect_check.get_active() else "0"}</active>')
+        def on_fingerprint(fingerprint, error):
+            if error is not None:
+                print(f"Could not get fingerprint: {error}")
+                # Continue without fingerprint - Kerio will generate it on first connection
+            else:
+                print(f"Got fingerprint: {fingerprint}")
+                config.set('fingerprint', fingerprint)
+            self.store_config(config, on_saved)
+        
+        # No existing fingerprint: a TLS handshake with the server, cached per
+        # server and port, run on a worker so a slow server cannot freeze Save
+        print(f"Getting MD5 fingerprint from {server}:{port}...")
+        self.show_status("Reading the server certificate...", "info")
+        self.commands.call(lambda: get_fingerprint(server, port).md5, callback=on_fingerprint,
+                           key=('fingerprint', server, port))
+    
+    def store_config(self, config, on_saved):
+        """Apply the remaining fields and write the config through the helper"""
+        # Leave 'yes'/'no' style values alone unless the choice changed
+        autoconnect = self.autoconnect_check.get_active()
+        if self.is_active(config.get('active') or '') != autoconnect:
+            config.set('active', "1" if autoconnect else "0")
         
         description = self.description_entry.get_text().strip()
-        if description:
-            xml_lines.append(f'      <description>{self.encode_html_entities(description)}</description>')
-        
-        xml_lines.extend(['    </connection>', '  </connections>', '</config>'])
+        config.set('description', description or None)
         
-        xml_content = '\n'.join(xml_lines) + '\n'
+        xml_content = config.to_string()
         
-        # Write to temporary file
-        temp_file = '/tmp/kerio-kvc.conf.tmp'
-        try:
-            with open(temp_file, 'w') as f:
-                f.write(xml_content)
-            
-            # Move to final location with sudo
-            result = subprocess.run(
-                ['sudo', 'mv', temp_file, self.config_file],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode != 0:
-                self.show_status(f"Error saving config: {result.stderr}", "error")
-                return False
-            
-            # Set proper permissions
-            subprocess.run(['sudo', 'chmod', '600', self.config_file], timeout=5)
-            
+        def on_stored(_result, error):
+            if error is not None:
+                self.show_status(f"Error saving config: {error}", "error")
+                on_saved(False)
+                return
+            self.config = config
             self.show_status("Configuration saved successfully", "success")
-            return True
-            
-        except Exception as e:
-            self.show_status(f"Error saving config: {e}", "error")
-            return False
+            on_saved(True)
+        
+        # The helper replaces the file atomically with mode 600
+        self.show_status("Saving configuration...", "info")
+        self.commands.call(lambda: self.privileged.put_config(xml_content, self.config_file),
+                           callback=on_stored, key=('config', 'store'),
+                           timeout=SYSTEMCTL_TIMEOUT + 10)
+    
+    def set_busy(self, busy):
+        """Keep Load, Save and Test idle while a helper call or test runs; calls nest"""
+        self.busy += 1 if busy else -1
+        for button in (self.load_button, self.save_button, self.test_button):
+            button.set_sensitive(self.busy == 0)
     
     def restart_service(self):
-        """Restart Kerio VPN service"""
-        try:
-            result = subprocess.run(
-                ['sudo', 'systemctl', 'restart', 'kerio-kvc.service'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
+        """Restart Kerio VPN service on a worker"""
+        def on_restarted(result, error):
+            self.set_busy(False)
+            if error is not None:
+                result = CommandResult.from_call_error(['systemctl', 'restart', UNIT], error)
+            if result.ok:
                 self.show_status("VPN service restarted successfully", "success")
-                return True
             else:
-                self.show_status(f"Error restarting service: {result.stderr}", "error")
-                return False
-                
-        except Exception as e:
-            self.show_status(f"Error restarting service: {e}", "error")
-            return False
+                self.show_status(f"Error restarting service: {result.describe_error()}", "error")
+        
+        self.set_busy(True)
+        self.show_status("Restarting VPN service...", "info")
+        self.commands.call(lambda: self.privileged.systemctl('restart'), callback=on_restarted,
+                           key=('systemctl', 'restart'), timeout=SYSTEMCTL_TIMEOUT + 10)
     
     def show_status(self, message, status_type="info"):
         """Show status message with color"""
@@ -380,7 +410,11 @@ class KerioConfigEditor(Gtk.Window):
     
     def on_save_clicked(self, widget):
         """Save button clicked"""
-        if self.save_config():
+        self.save_config(self.on_saved)
+    
+    def on_saved(self, ok):
+        """Save & Apply finished writing the config"""
+        if ok:
             # Ask if user wants to restart service
             dialog = Gtk.MessageDialog(
                 transient_for=self,
@@ -404,118 +438,43 @@ class KerioConfigEditor(Gtk.Window):
         print("Test connection button clicked")
         
         # Save first
-        if not self.save_config():
+        self.save_config(self.on_saved_for_test)
+    
+    def on_saved_for_test(self, ok):
+        """The config for the connection test was written, or could not be"""
+        if not ok:
             print("Config save failed, aborting test")
             return
         
         print("Config saved, restarting service...")
         self.show_status("Restarting VPN service...", "info")
-        
-        # Try to restart service
-        try:
-            result = subprocess.run(
-                ['sudo', 'systemctl', 'restart', 'kerio-kvc.service'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode != 0:
-                print(f"Service restart failed: {result.stderr}")
-                self.show_status(f"Failed to restart service: {result.stderr}", "error")
-                return
-            
-            print("Service restarted successfully, starting connection check...")
-            self.show_status("Testing connection...", "info")
-            
-            # Initialize test counters
-            self.test_check_count = 0
-            self.test_max_attempts = 10
-            
-            # Start checking connection status
-            GLib.timeout_add_seconds(2, self.check_connection_status)
-            
-        except subprocess.TimeoutExpired:
-            print("Service restart timeout")
-            self.show_status("Service restart timeout", "error")
-        except Exception as e:
-            print(f"Service restart error: {e}")
-            self.show_status(f"Connection test failed: {e}", "error")
+        self.set_busy(True)
+        
+        # Follows unit and kvnet events; probes the [health] targets if any are set
+        self.connection_test = ConnectionTest(
+            self.loop, self.commands, self.privileged, self.unit_watcher,
+            on_progress=self.on_test_progress, on_done=self.on_test_done,
+            prober=HealthProber.from_settings(self.settings)
+        )
+        self.connection_test.start()
     
-    def check_connection_status(self):
-        """Check if VPN connected successfully - returns True to continue, False to stop"""
-        self.test_check_count += 1
-        print(f"\nConnection check attempt {self.test_check_count}/{self.test_max_attempts}")
-        
-        try:
-            # Step 1: Check if service is running
-            print("  Checking service status...")
-            result = subprocess.run(
-                ['systemctl', 'is-active', 'kerio-kvc.service'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            
-            service_status = result.stdout.strip()
-            print(f"  Service status: {service_status} (returncode={result.returncode})")
-            
-            if result.returncode != 0:
-                print(f"  Service not active")
-                self.show_status("Service not active - check credentials and server", "error")
-                return False  # Stop checking
-            
-            # Step 2: Check if interface exists and is up
-            print("  Checking interface kvnet...")
-            result = subprocess.run(
-                ['ip', 'addr', 'show', 'kvnet'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            
-            if result.returncode != 0:
-                print(f"  Interface kvnet not found")
-                if self.test_check_count < self.test_max_attempts:
-                    self.show_status(f"Waiting for interface... ({self.test_check_count}/{self.test_max_attempts})", "info")
-                    return True  # Continue checking
-                else:
-                    self.show_status("Timeout - VPN interface not created", "error")
-                    return False  # Stop checking
-            
-            # Step 3: Extract IP address
-            print("  Interface found, looking for IP address...")
-            ip_found = None
-            for line in result.stdout.split('\n'):
-                if 'inet ' in line and 'inet6' not in line:
-                    parts = line.strip().split()
-                    if len(parts) >= 2:
-                        ip_found = parts[1].split('/')[0]
-                        print(f"  Found IP: {ip_found}")
-                        break
-            
-            if ip_found:
-                print(f"  SUCCESS! VPN connected with IP {ip_found}")
-                self.show_status(f"✓ Connection successful! VPN IP: {ip_found}", "success")
-                return False  # Stop checking
-            else:
-                print(f"  No IP address assigned yet")
-                if self.test_check_count < self.test_max_attempts:
-                    self.show_status(f"Connecting... ({self.test_check_count}/{self.test_max_attempts})", "info")
-                    return True  # Continue checking
-                else:
-                    print(f"  TIMEOUT - No IP after {self.test_max_attempts} attempts")
-                    self.show_status("Timeout - VPN did not get IP address", "error")
-                    return False  # Stop checking
-                
-        except subprocess.TimeoutExpired:
-            print(f"  Command timeout")
-            self.show_status("Check timeout - command took too long", "error")
-            return False  # Stop checking
-        except Exception as e:
-            print(f"  Error during check: {e}")
-            self.show_status(f"Error checking status: {e}", "error")
-            return False  # Stop checking
+    def on_test_progress(self, test, phase):
+        """A phase of the connection test was reached"""
+        print(f"  {LABELS[phase]} after {test.timings[phase] * 1000:.0f} ms")
+        if test.next_phase is not None:
+            self.show_status(f"{LABELS[phase].capitalize()} after {test.timings[phase]:.1f}s, "
+                             f"waiting for {LABELS[test.next_phase]}...", "info")
+    
+    def on_test_done(self, test):
+        """The connection test succeeded or failed"""
+        self.set_busy(False)
+        timings = f" ({test.describe()})" if test.timings else ""
+        if test.ok:
+            print(f"  SUCCESS! VPN connected with IP {test.vpn_ip}")
+            self.show_status(f"Connection successful! VPN IP: {test.vpn_ip}{timings}", "success")
+        else:
+            print(f"  FAILED: {test.error}")
+            self.show_status(f"{test.error}{timings}", "error")
 
 def main():
     # Check if running in terminal
@@ -524,7 +483,8 @@ def main():
         pass
     
     win = KerioConfigEditor()
-    win.connect("destroy", Gtk.main_quit)
+    win.connect("destroy", lambda widget: (win.commands.shutdown(), win.privileged.close(),
+                                           Gtk.main_quit()))
     win.show_all()
     Gtk.main()
 
@@ -0,0 +1,3 @@
+"""
+Shared modules for the Kerio VPN indicator and configuration editor
+"""
@@ -0,0 +1,310 @@
+"""
+Command line entry point
+`kerio-vpn-indicator` with no arguments starts the tray icon; the
+subcommands below never import gi or GTK, so scripts and SSH sessions
+get an answer in tens of milliseconds. Keep imports inside the
+handlers: benchmarks/startup.py holds this path to its budget
+"""
+
+import sys
+
+USAGE = """\
+usage: kerio-vpn-indicator [--daemon | status [--json] | connect | disconnect | reconnect
+                            | auto-reconnect [on|off] | reload | history | gateways]
+
+  (no arguments)  show the tray icon, unless it is already running
+  --daemon        monitor and auto-reconnect without a user interface
+  status          print the VPN state; exit status 0 when connected, 3 otherwise
+  connect         start kerio-kvc.service (through kerio-vpn-helper or sudo)
+  disconnect      stop kerio-kvc.service
+  reconnect       restart kerio-kvc.service
+  auto-reconnect  turn auto-reconnect on or off, or toggle it (running instance only)
+  reload          re-read /etc/kerio-kvc.conf (running instance only)
+  history         summarize recorded sessions (see `history --help`)
+  gateways        rank candidate gateways by TLS handshake time (see `gateways --help`)
+
+With the tray or --daemon running, status answers from its cached state
+and the actions are handed to it over $XDG_RUNTIME_DIR/kerio-vpn-indicator.sock.
+"""
+
+
+def running_instance(method, **params):
+    """
+    Result of method from the running tray or daemon, None if none is
+    running. Raises HelperError when one may be running but the request
+    failed: it may have got through, so acting directly could do it twice
+    """
+    import os
+    from kerio_vpn import control
+
+    if not os.path.exists(control.socket_path()):
+        return None  # Skips the client imports when nothing is running
+    import errno
+    from kerio_vpn.helper import HelperUnavailable
+
+    try:
+        return control.request(method, **params)
+    except HelperUnavailable as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+            return None  # A stale socket left by an instance that is gone
+        raise
+
+
+def claim_instance():
+    """The instance lock for this process, None if another copy holds it"""
+    from kerio_vpn.control import InstanceLock
+
+    lock = InstanceLock()
+    if lock.acquire():
+        return lock
+    holder = lock.holder()
+    print(f"kerio-vpn-indicator is already running{f' (pid {holder})' if holder else ''}",
+          file=sys.stderr)
+    return None
+
+
+def probe_status():
+    """One-shot state from a netlink dump and `systemctl is-active`"""
+    from kerio_vpn import kerioconf
+    from kerio_vpn.netlink import INTERFACE, InterfaceMonitor, ip_addr_status
+    from kerio_vpn.service import UNIT, systemctl_status
+
+    service_active, service_state = systemctl_status(UNIT)
+    try:
+        monitor = InterfaceMonitor(INTERFACE)
+        interface_up, interface_state, vpn_ip = monitor.up, monitor.state, monitor.vpn_ip
+        monitor.close()
+    except OSError:
+        interface_up, interface_state, vpn_ip = ip_addr_status(INTERFACE)
+    try:
+        server = kerioconf.read_server()
+    except Exception:
+        server = None  # /etc/kerio-kvc.conf is usually root-only
+    return {
+        'connected': service_active and interface_up and vpn_ip is not None,
+        'service': service_state,
+        'interface': interface_state,
+        'vpn_ip': vpn_ip,
+        'server': server,
+    }
+
+
+def status(argv):
+    """The running instance's cached state, or a one-shot probe without one"""
+    # Parsed by hand: argparse alone costs more than the rest of this path
+    if any(arg != '--json' for arg in argv):
+        print("usage: kerio-vpn-indicator status [--json]", file=sys.stderr)
+        return 2
+
+    try:
+        state = running_instance('status')
+    except Exception as e:  # HelperError; status only reads, so probe directly instead
+        print(f"kerio-vpn-indicator did not answer ({e}), checking directly", file=sys.stderr)
+        state = None
+    state = state or probe_status()
+    if '--json' in argv:
+        import json
+        print(json.dumps(state, indent=2))
+    else:
+        print(f"VPN:       {'connected' if state['connected'] else 'disconnected'}"
+              f"{' (degraded)' if state.get('degraded') else ''}")
+        print(f"Service:   {state['service'] or 'unknown'}")
+        print(f"Interface: {state['interface']}")
+        if state['vpn_ip']:
+            print(f"IP:        {state['vpn_ip']}")
+        if state['server']:
+            print(f"Server:    {state['server']}")
+        if 'auto_reconnect' in state:
+            print(f"Auto-reconnect: {'on' if state['auto_reconnect'] else 'off'}")
+        if state.get('flap_score'):
+            print(f"Flap score: {state['flap_score']}{' (unstable)' if state['flapping'] else ''}")
+    # LSB status convention: 3 means "not running"
+    return 0 if state['connected'] else 3
+
+
+def control(method, **params):
+    """Hand an action to the running instance; without one, act directly where possible"""
+    from kerio_vpn.control import CLIENT_TIMEOUT
+    from kerio_vpn.helper import HelperError, HelperTimeout
+
+    try:
+        state = running_instance(method, **params)
+    except HelperTimeout:
+        print(f"kerio-vpn-indicator did not answer {method} within {CLIENT_TIMEOUT}s; "
+              f"it may still carry it out", file=sys.stderr)
+        return 1
+    except HelperError as e:
+        print(f"kerio-vpn-indicator {method} failed: {e}", file=sys.stderr)
+        return 1
+    if state is not None:
+        if method == 'auto_reconnect':
+            print(f"Auto-reconnect: {'on' if state['auto_reconnect'] else 'off'}")
+        return 0
+    fallback = {'connect': 'start', 'disconnect': 'stop', 'reconnect': 'restart'}.get(method)
+    if fallback is None:
+        print("kerio-vpn-indicator is not running", file=sys.stderr)
+        return 1
+    return systemctl(fallback)
+
+
+def systemctl(action):
+    """Run `systemctl <action>` on the VPN unit through the helper or sudo"""
+    from kerio_vpn.helper import PrivilegedClient
+    from kerio_vpn.service import UNIT
+    from kerio_vpn.settings import load_settings
+
+    privileged = PrivilegedClient(load_settings().get('helper', 'socket'), interactive=True)
+    result = privileged.systemctl(action)
+    privileged.close()
+    if not result.ok:
+        print(f"Failed to {action} {UNIT}: {result.describe_error()}", file=sys.stderr)
+        return result.returncode or 1
+    return 0
+
+
+def gateways(argv):
+    """Probe candidate gateways concurrently and optionally switch to the best"""
+    import argparse
+    from kerio_vpn.gateways import GatewaySelector, parse_candidates, write_gateway
+    from kerio_vpn.settings import load_settings
+
+    settings = load_settings()
+    parser = argparse.ArgumentParser(
+        prog='kerio-vpn-indicator gateways',
+        description='Rank Kerio gateways by TLS handshake time, best first')
+    parser.add_argument('candidates', nargs='*', metavar='host[:port]',
+                        help='gateways to probe (default: [gateways] candidates in settings.conf)')
+    parser.add_argument('--attempts', type=int, default=settings.getint('gateways', 'attempts'))
+    parser.add_argument('--timeout', type=float, default=settings.getfloat('gateways', 'timeout'),
+                        help='seconds per handshake')
+    parser.add_argument('--apply', action='store_true',
+                        help='write the best gateway into /etc/kerio-kvc.conf')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    try:
+        candidates = parse_candidates(' '.join(args.candidates) or
+                                      settings.get('gateways', 'candidates'))
+    except ValueError as e:
+        parser.error(f"invalid port: {e}")
+    if not candidates:
+        parser.error("no candidates given and none in settings.conf")
+
+    selector = GatewaySelector(attempts=args.attempts, timeout=args.timeout)
+    results = selector.rank(candidates)
+    best = selector.best(candidates)
+
+    if args.json:
+        import json
+        print(json.dumps([result.as_dict() for result in results], indent=2))
+    else:
+        for result in results:
+            print(result.describe())
+    if best is None:
+        print("No gateway answered", file=sys.stderr)
+        return 1
+
+    if args.apply:
+        from kerio_vpn.helper import HelperError, PrivilegedClient
+
+        privileged = PrivilegedClient(settings.get('helper', 'socket'), interactive=True)
+        try:
+            if write_gateway(privileged, best):
+                print(f"Switched to {best.address}; reconnect to use it", file=sys.stderr)
+            else:
+                print(f"Already using {best.address}", file=sys.stderr)
+        except (HelperError, OSError) as e:
+            print(f"Could not update the config: {e}", file=sys.stderr)
+            return 1
+        finally:
+            privileged.close()
+    return 0
+
+
+def daemon(argv):
+    """Headless monitor: the tray's core without the tray"""
+    import signal
+    from kerio_vpn.core import VPNCore
+    from kerio_vpn.service import UNIT
+
+    # journald and pipes see every line as it happens
+    sys.stdout.reconfigure(line_buffering=True)
+
+    # With PyGObject around, follow the unit over D-Bus instead of polling
+    # systemctl; without it the pure-Python loop does the same job
+    try:
+        from kerio_vpn.configmonitor import ConfigMonitor
+        from kerio_vpn.logind import SleepWatcher
+        from kerio_vpn.mainloop import GLibLoop
+        from kerio_vpn.networkmanager import ConnectivityWatcher
+        from kerio_vpn.systemd import UnitWatcher
+        loop = GLibLoop()
+        service = UnitWatcher(UNIT)
+        sleep, network = SleepWatcher(), ConnectivityWatcher()
+    except ImportError:
+        from kerio_vpn.mainloop import SelectorLoop
+        ConfigMonitor = None
+        loop = SelectorLoop()
+        service = sleep = network = None
+
+    core = VPNCore(loop, service=service, sleep=sleep, network=network)
+    if ConfigMonitor is not None:
+        try:
+            core.config_monitor = ConfigMonitor(core.config_file, core.reload_config)
+        except Exception as e:
+            print(f"Cannot watch {core.config_file}: {e}")
+
+    def on_signal():
+        loop.quit()
+        return False
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.signal_add(signum, on_signal)
+
+    core.start()
+    from kerio_vpn.control import ControlServer
+    try:
+        server = ControlServer(loop, core)
+    except OSError as e:
+        print(f"Cannot open the control socket: {e}")
+        server = None
+    loop.run()
+    if server is not None:
+        server.close()
+    core.shutdown()
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else None
+
+    if command in (None, '--daemon'):
+        # One tray or daemon per user; the lock is held until this process exits
+        lock = claim_instance()
+        if lock is None:
+            return 1
+        if command is None:
+            from kerio_vpn import tray
+            return tray.main()
+        return daemon(argv[1:])
+    if command == 'status':
+        return status(argv[1:])
+    if command.lstrip('-') in ('connect', 'disconnect', 'reconnect', 'reload'):
+        return control(command.lstrip('-'))
+    if command == 'auto-reconnect':
+        if argv[1:] not in ([], ['on'], ['off']):
+            print("usage: kerio-vpn-indicator auto-reconnect [on|off]", file=sys.stderr)
+            return 2
+        enabled = {'on': True, 'off': False}.get(argv[1]) if argv[1:] else None
+        return control('auto_reconnect', **({} if enabled is None else {'enabled': enabled}))
+    if command == 'gateways':
+        return gateways(argv[1:])
+    if command == 'history':
+        from kerio_vpn import history
+        return history.main(argv[1:])
+    if command in ('-h', '--help'):
+        print(USAGE, end='')
+        return 0
+    print(USAGE, end='', file=sys.stderr)
+    return 2
@@ -0,0 +1,220 @@
+"""
+Non-blocking command execution
+Commands and blocking Python calls (such as health probes) run on a small
+worker pool and their results are handed back to the main loop through a
+dispatch function (GLib.idle_add in the GUI), so a slow
+`sudo systemctl start` never freezes the tray menu
+"""
+
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CommandResult:
+    """Outcome of a finished command"""
+
+    def __init__(self, args, returncode=None, stdout='', stderr='',
+                 error=None, timed_out=False, cancelled=False):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.error = error
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+
+    @classmethod
+    def from_call_error(cls, args, error):
+        """Result for a call() that raised, passed its deadline or was cancelled"""
+        if isinstance(error, CallTimeout):
+            return cls(args, timed_out=True)
+        if isinstance(error, CallCancelled):
+            return cls(args, cancelled=True)
+        return cls(args, error=error)
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not (self.timed_out or self.cancelled)
+
+    def describe_error(self):
+        """Human-readable failure reason for notifications"""
+        if self.cancelled:
+            return "cancelled"
+        if self.timed_out:
+            return f"timed out: {' '.join(self.args)}"
+        if self.error is not None:
+            return str(self.error)
+        return self.stderr.strip() or f"{' '.join(self.args)} exited with status {self.returncode}"
+
+
+class CallTimeout(TimeoutError):
+    """A call() job passed its deadline; its result, if it ever comes, is dropped"""
+
+
+class CallCancelled(Exception):
+    """A call() job was cancelled before it returned"""
+
+
+class CommandJob:
+    """A command in flight, possibly shared by several callers"""
+
+    def __init__(self, args, timeout, call=False):
+        self.args = args
+        self.timeout = timeout
+        self.call = call  # A Python callable from call(), not a process
+        self.callbacks = []
+        self.process = None
+        self.cancelled = False
+        self.finished = False  # Callbacks have run, from the result or the deadline
+        self.deadline = None  # threading.Timer of a call() job with a timeout
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.process is not None and self.process.poll() is None:
+                self.process.kill()
+            if self.deadline is not None:
+                self.deadline.cancel()
+
+
+class CommandRunner:
+    """Runs commands on worker threads with timeouts, cancellation and deduplication"""
+
+    def __init__(self, dispatch, max_workers=4, executor=None):
+        """
+        dispatch: schedules fn(*args) on the main loop, e.g. GLib.idle_add.
+        The dispatched function returns False so idle sources run once.
+        executor: anything with submit() and shutdown(wait), defaults to a
+        thread pool; the simulator runs jobs inline instead
+        """
+        self.dispatch = dispatch
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers,
+                                                       thread_name_prefix='kerio-cmd')
+        self.in_flight = {}
+        self.spawned = 0  # processes started, for metrics
+
+    def run(self, args, callback=None, timeout=10, key=None):
+        """
+        Start args in the background and call callback(result) on the main loop.
+        A command whose key (default: the argument list) is already running
+        is not started again; the caller is attached to the running one.
+        Must be called from the main loop.
+        """
+        key = tuple(args) if key is None else key
+        job = self.in_flight.get(key)
+        if job is None:
+            job = CommandJob(list(args), timeout)
+            self.in_flight[key] = job
+            self.executor.submit(self._execute, key, job)
+        if callback is not None:
+            job.callbacks.append(callback)
+        return job
+
+    def call(self, fn, callback=None, key=None, timeout=None):
+        """
+        Run fn() on a worker and call callback(value, error) on the main loop.
+        Calls sharing a key are deduplicated like commands. A worker cannot
+        be killed, so past `timeout` seconds the callbacks get a CallTimeout
+        error and whatever fn() returns later is dropped; cancel() does the
+        same with CallCancelled.
+        """
+        key = ('call', fn) if key is None else key
+        job = self.in_flight.get(key)
+        if job is None:
+            job = CommandJob([getattr(fn, '__name__', repr(fn))], timeout, call=True)
+            self.in_flight[key] = job
+            if timeout is not None:
+                job.deadline = threading.Timer(timeout, self.dispatch, (
+                    self._abandon, key, job,
+                    (None, CallTimeout(f"no result after {timeout:g}s"))))
+                job.deadline.daemon = True
+                job.deadline.start()
+            self.executor.submit(self._execute_call, key, job, fn)
+        if callback is not None:
+            job.callbacks.append(lambda outcome: callback(*outcome))
+        return job
+
+    def is_running(self, key):
+        return key in self.in_flight
+
+    def cancel(self, key):
+        """Kill a running command; its callbacks receive a cancelled result"""
+        job = self.in_flight.get(key)
+        if job is not None:
+            job.cancel()
+            if job.call:
+                # The worker runs on regardless; its callers hear now
+                self._abandon(key, job, (None, CallCancelled("cancelled")))
+
+    def shutdown(self):
+        """Cancel everything in flight and stop the workers"""
+        for job in list(self.in_flight.values()):
+            job.cancel()
+        self.executor.shutdown(wait=False)
+
+    def _execute(self, key, job):
+        """Worker thread: run the process and hand the result to the main loop"""
+        try:
+            with job.lock:
+                if job.cancelled:
+                    raise _Cancelled()
+                job.process = subprocess.Popen(
+                    job.args,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
+                self.spawned += 1
+            try:
+                stdout, stderr = job.process.communicate(timeout=job.timeout)
+                result = CommandResult(job.args, job.process.returncode, stdout, stderr,
+                                       cancelled=job.cancelled)
+            except subprocess.TimeoutExpired:
+                job.process.kill()
+                stdout, stderr = job.process.communicate()
+                result = CommandResult(job.args, job.process.returncode, stdout, stderr,
+                                       timed_out=True)
+        except _Cancelled:
+            result = CommandResult(job.args, cancelled=True)
+        except Exception as e:
+            result = CommandResult(job.args, error=e)
+
+        self.dispatch(self._finish, key, job, result)
+
+    def _execute_call(self, key, job, fn):
+        """Worker thread: run a Python callable instead of a process"""
+        try:
+            outcome = (fn(), None)
+        except Exception as e:
+            outcome = (None, e)
+        self.dispatch(self._finish, key, job, outcome)
+
+    def _abandon(self, key, job, outcome):
+        """Main loop: answer a call() job's callers before its worker returns"""
+        if not job.finished:
+            print(f"Giving up on {key}: {outcome[1]}")
+            self._finish(key, job, outcome)
+        return False
+
+    def _finish(self, key, job, result):
+        """Main loop: retire the job and notify every caller attached to it"""
+        if job.finished:
+            return False  # Its deadline passed or it was cancelled; callers have been told
+        job.finished = True
+        if job.deadline is not None:
+            job.deadline.cancel()
+        if self.in_flight.get(key) is job:
+            del self.in_flight[key]
+        for callback in job.callbacks:
+            try:
+                callback(result)
+            except Exception as e:
+                print(f"Error in command callback for {' '.join(job.args)}: {e}")
+        return False  # Run the idle source once
+
+
+class _Cancelled(Exception):
+    pass
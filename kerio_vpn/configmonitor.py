@@ -0,0 +1,53 @@
+"""
+Config file monitor
+Watches /etc/kerio-kvc.conf through a Gio.FileMonitor (inotify) on its
+directory, so writes in place, atomic renames over the file and
+delete/recreate all arrive as events. Bursts (write, rename, chmod) are
+folded into one callback after a short settle delay
+"""
+
+import os
+
+from gi.repository import Gio, GLib
+
+SETTLE_MS = 150
+
+
+class ConfigMonitor:
+    """Calls on_change() shortly after the watched file changed in any way"""
+
+    def __init__(self, path, on_change, settle_ms=SETTLE_MS):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.on_change = on_change
+        self.settle_ms = settle_ms
+        self.source = None
+
+        # A file monitor would follow the old inode after a rename; the
+        # directory sees the new name arrive
+        directory = Gio.File.new_for_path(os.path.dirname(path) or '.')
+        self.monitor = directory.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        self.monitor.connect('changed', self.on_monitor_event)
+
+    def on_monitor_event(self, monitor, file, other_file, event_type):
+        names = {file.get_basename()}
+        if other_file is not None:
+            names.add(other_file.get_basename())  # RENAMED: old and new name
+        if self.name not in names:
+            return
+        if self.source is None:
+            self.source = GLib.timeout_add(self.settle_ms, self.fire)
+
+    def fire(self):
+        self.source = None
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"Error reloading {self.path}: {e}")
+        return False  # One-shot timeout
+
+    def close(self):
+        if self.source is not None:
+            GLib.source_remove(self.source)
+            self.source = None
+        self.monitor.cancel()
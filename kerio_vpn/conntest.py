@@ -0,0 +1,247 @@
+"""
+Connection test
+Restarts kerio-kvc.service and follows the tunnel coming up through unit
+state changes and netlink events instead of polling, timing each phase
+from the moment the restart was issued. Fails as soon as the unit enters
+'failed'. Nothing here imports gi: it runs on any kerio_vpn.mainloop loop
+"""
+
+import time
+
+from kerio_vpn.netlink import INTERFACE, InterfaceMonitor, ip_addr_status
+
+# (key, label) in the order the tunnel comes up
+PHASES = (
+    ('restart', "restart issued"),
+    ('unit', "unit active"),
+    ('interface', "kvnet created"),
+    ('link', "link up"),
+    ('address', "IPv4 assigned"),
+    ('probe', "tunnel probe"),
+)
+LABELS = dict(PHASES)
+
+DEFAULT_TIMEOUT = 60
+POLL_MS = 250  # Without D-Bus or netlink only
+PROBE_RETRY_MS = 1000
+
+
+class ConnectionTest:
+    """One restart-and-wait run; create a new one per test"""
+
+    def __init__(self, loop, commands, privileged, service, on_progress=None, on_done=None,
+                 prober=None, ifname=INTERFACE, timeout=DEFAULT_TIMEOUT, clock=time.monotonic):
+        """
+        commands: the CommandRunner blocking work is handed to.
+        privileged: PrivilegedClient used for `systemctl restart`.
+        service: kerio-kvc.service backend (UnitWatcher or SystemctlService);
+        its on_change is borrowed while the test runs.
+        prober: HealthProber whose targets prove traffic flows through the
+        tunnel; without one the test succeeds once an address is assigned.
+        on_progress(test, phase) after each phase, on_done(test) at the end
+        """
+        self.loop = loop
+        self.commands = commands
+        self.privileged = privileged
+        self.service = service
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.prober = prober
+        self.ifname = ifname
+        self.timeout = timeout
+        self.clock = clock
+
+        self.started = None
+        self.timings = {}  # phase key -> seconds since the restart was issued
+        self.running = False
+        self.ok = None
+        self.error = None
+
+        self.restarted = False
+        self.unit_state = None
+        self.unit_active_at = None
+        self.monitor = None
+        self.polled_link = None
+        self.previous_on_change = None
+        self.link_source = None
+        self.poll_source = None
+        self.timeout_source = None
+        self.probe_source = None
+
+    def start(self):
+        self.started = self.clock()
+        self.running = True
+
+        # Subscribe before restarting so the teardown and the new tunnel are both seen
+        try:
+            self.monitor = InterfaceMonitor(self.ifname)
+            self.link_source = self.loop.io_add_watch(self.monitor.fileno(), self.on_link_event)
+        except OSError as e:
+            print(f"Netlink unavailable, polling interface instead: {e}")
+            self.monitor = None
+        self.previous_on_change = self.service.on_change
+        self.service.on_change = self.on_unit_change
+        if self.service.available:
+            self.unit_state = self.service.status()[1]
+        if self.monitor is None or not self.service.available:
+            self.poll_source = self.loop.timeout_add(POLL_MS, self.poll)
+        self.timeout_source = self.loop.timeout_add(int(self.timeout * 1000), self.on_timeout)
+
+        self.commands.call(lambda: self.privileged.systemctl('restart'),
+                           callback=self.on_restart_done, key=('systemctl', 'restart'))
+
+    @property
+    def phases(self):
+        """Phase keys this test waits for"""
+        return [key for key, _label in PHASES if key != 'probe' or self.prober is not None]
+
+    @property
+    def next_phase(self):
+        for key in self.phases:
+            if key not in self.timings:
+                return key
+        return None
+
+    @property
+    def vpn_ip(self):
+        return self.interface_state()[2]
+
+    def describe(self):
+        """Phase timings, e.g. "restart issued 1.20s, unit active 1.21s, ..." """
+        return ", ".join(f"{label} {self.timings[key]:.2f}s"
+                         for key, label in PHASES if key in self.timings)
+
+    def interface_state(self):
+        """(exists, up, IPv4 address) of the interface"""
+        if self.monitor is not None:
+            return self.monitor.exists, self.monitor.up, self.monitor.vpn_ip
+        if self.polled_link is None:
+            return False, False, None
+        up, state, vpn_ip = self.polled_link
+        return state not in ('not found', 'error'), up, vpn_ip
+
+    def mark(self, phase, at=None):
+        self.timings[phase] = (at if at is not None else self.clock()) - self.started
+        if self.on_progress:
+            self.on_progress(self, phase)
+
+    def on_restart_done(self, result, error):
+        if not self.running:
+            return
+        if error is not None:
+            self.fail(f"Failed to restart service: {error}")
+        elif not result.ok:
+            self.fail(f"Failed to restart service: {result.describe_error()}")
+        else:
+            self.restarted = True
+            self.mark('restart')
+            if self.unit_state == 'active' and self.unit_active_at is None:
+                self.unit_active_at = self.clock()  # No transition was reported
+            self.advance()
+
+    def on_unit_change(self, service):
+        self.observe_unit(service.status()[1])
+        if self.previous_on_change is not None:
+            self.previous_on_change(service)
+
+    def observe_unit(self, state):
+        if not self.running:
+            return
+        previous = self.unit_state
+        self.unit_state = state
+        if state == 'failed' and (previous != 'failed' or self.restarted):
+            self.fail("Service failed - check credentials and server")
+            return
+        if (state == 'active' and self.unit_active_at is None
+                and (self.restarted or previous not in (None, 'active'))):
+            self.unit_active_at = self.clock()
+        self.advance()
+
+    def on_link_event(self, fd):
+        self.monitor.read()
+        self.advance()
+        return self.running
+
+    def poll(self):
+        """Fallback: check whichever of unit and interface has no event source"""
+        self.commands.call(self.poll_status, callback=self.on_polled, key=('conntest', 'poll'))
+        return self.running
+
+    def poll_status(self):
+        """Worker thread"""
+        unit = None if self.service.available else self.service.status()[1]
+        link = ip_addr_status(self.ifname) if self.monitor is None else None
+        return unit, link
+
+    def on_polled(self, value, error):
+        if not self.running or error is not None:
+            return
+        unit, link = value
+        if link is not None:
+            self.polled_link = link
+        if unit is not None:
+            self.observe_unit(unit)  # Also advances
+        else:
+            self.advance()
+
+    def advance(self):
+        """Mark every phase whose condition now holds, in order"""
+        if not self.running or not self.restarted:
+            return  # Until the restart returns, state may still be the old tunnel's
+        exists, up, vpn_ip = self.interface_state()
+        reached = {
+            'unit': self.unit_active_at is not None,
+            'interface': exists,
+            'link': up,
+            'address': vpn_ip is not None,
+        }
+        for phase in ('unit', 'interface', 'link', 'address'):
+            if phase in self.timings:
+                continue
+            if not reached[phase]:
+                return
+            self.mark(phase, self.unit_active_at if phase == 'unit' else None)
+        if self.prober is None:
+            self.finish(True)
+        elif self.probe_source is None and not self.commands.is_running(('conntest', 'probe')):
+            self.probe()
+
+    def probe(self):
+        self.probe_source = None
+        self.commands.call(self.prober.probe_round, callback=self.on_probe,
+                           key=('conntest', 'probe'))
+        return False  # One-shot when used as a retry timeout
+
+    def on_probe(self, results, error):
+        if not self.running:
+            return
+        if error is None and any(rtt is not None for rtt in results):
+            self.mark('probe')
+            self.finish(True)
+        else:
+            self.probe_source = self.loop.timeout_add(PROBE_RETRY_MS, self.probe)
+
+    def on_timeout(self):
+        self.timeout_source = None
+        self.fail(f"Timeout - {LABELS[self.next_phase]} not reached after {self.timeout:.0f}s")
+        return False
+
+    def fail(self, message):
+        self.error = message
+        self.finish(False)
+
+    def finish(self, ok):
+        if not self.running:
+            return
+        self.running = False
+        self.ok = ok
+        for name in ('link_source', 'poll_source', 'timeout_source', 'probe_source'):
+            source = getattr(self, name)
+            if source is not None:
+                self.loop.source_remove(source)
+                setattr(self, name, None)
+        if self.monitor is not None:
+            self.monitor.close()
+        self.service.on_change = self.previous_on_change
+        if self.on_done:
+            self.on_done(self)
@@ -0,0 +1,208 @@
+"""
+Control channel
+Keeps the indicator to one instance per user and lets scripts and the
+command line drive that instance over a unix socket in $XDG_RUNTIME_DIR
+instead of starting a second copy. The framing is the helper's, one
+JSON object per line in each direction:
+
+    {"id": 1, "method": "connect", "params": {}}
+    {"id": 1, "result": {...}}  or  {"id": 1, "error": "message"}
+
+Methods: status, connect, disconnect, reconnect, auto_reconnect
+({"enabled": true|false}, toggles without it) and reload. Every one
+answers with the cached state; nothing here runs systemctl or ip on the
+caller's behalf beyond what the action itself starts. The server runs on
+the core's loop, so it never touches the core from another thread
+"""
+
+import fcntl
+import json
+import os
+import socket
+
+from kerio_vpn.settings import runtime_dir
+
+MAX_LINE_BYTES = 4096
+CLIENT_TIMEOUT = 2
+
+
+def socket_path():
+    return os.path.join(runtime_dir(), 'kerio-vpn-indicator.sock')
+
+
+def lock_path():
+    return os.path.join(runtime_dir(), 'kerio-vpn-indicator.lock')
+
+
+class InstanceLock:
+    """flock() on a file in the runtime dir; the kernel drops it when the process dies"""
+
+    def __init__(self, path=None):
+        self.path = path or lock_path()
+        self.fd = None
+
+    def acquire(self):
+        """True if this process is now the only instance"""
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self.fd = fd
+        return True
+
+    def holder(self):
+        """pid written by the instance holding the lock, None if unknown"""
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def request(method, path=None, timeout=CLIENT_TIMEOUT, **params):
+    """
+    Ask the running instance; returns its result. Raises HelperUnavailable
+    when the request did not get through (its errno tells whether anything
+    is listening), HelperTimeout when no answer came in time and
+    HelperError when it refused
+    """
+    from kerio_vpn.helper import HelperClient
+
+    client = HelperClient(path or socket_path(), timeout=timeout)
+    try:
+        return client.call(method, **params)
+    finally:
+        client.close()
+
+
+class ControlServer:
+    """Answers control requests on the loop; only the user's own processes may connect"""
+
+    def __init__(self, loop, core, path=None):
+        """Call while holding the InstanceLock: a leftover socket file is replaced"""
+        self.loop = loop
+        self.core = core
+        self.path = path or socket_path()
+        self.clients = {}  # fd -> [socket, buffered bytes, source id]
+
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(8)
+        self.sock.setblocking(False)
+        self.source = loop.io_add_watch(self.sock.fileno(), self.on_accept)
+
+    def on_accept(self, fd):
+        from kerio_vpn.helper import peer_credentials
+
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError as e:
+                print(f"Control socket error: {e}")
+                return True
+            _pid, uid, _gid = peer_credentials(conn)
+            if uid not in (0, os.getuid()):
+                conn.close()
+                continue
+            conn.setblocking(False)
+            source = self.loop.io_add_watch(conn.fileno(), self.on_readable)
+            self.clients[conn.fileno()] = [conn, b'', source]
+
+    def on_readable(self, fd):
+        client = self.clients.get(fd)
+        if client is None:
+            return False
+        conn = client[0]
+        try:
+            data = conn.recv(MAX_LINE_BYTES)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(fd)
+            return False
+        *lines, client[1] = (client[1] + data).split(b'\n')
+        if len(client[1]) > MAX_LINE_BYTES:
+            lines, client[1] = [None], b''
+        try:
+            for line in lines:
+                response = self.answer(line) if line is not None else {
+                    'id': None, 'error': 'request too large'}
+                # Answers are a few hundred bytes, far below the socket buffer
+                conn.sendall(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+        except OSError:
+            self.drop(fd)
+            return False
+        return True
+
+    def drop(self, fd):
+        conn, _pending, source = self.clients.pop(fd)
+        self.loop.source_remove(source)
+        conn.close()
+
+    def answer(self, line):
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            method = request.get('method')
+            params = request.get('params') or {}
+        except (ValueError, AttributeError):
+            return {'id': None, 'error': 'malformed request'}
+        try:
+            return {'id': request_id, 'result': self.dispatch(method, params)}
+        except ValueError as e:
+            return {'id': request_id, 'error': str(e)}
+
+    def dispatch(self, method, params):
+        core = self.core
+        if method == 'status':
+            pass
+        elif method == 'connect':
+            core.connect_vpn()
+        elif method == 'disconnect':
+            core.disconnect_vpn()
+        elif method == 'reconnect':
+            core.reconnect_vpn()
+        elif method == 'auto_reconnect':
+            enabled = params.get('enabled')
+            if enabled is None:
+                enabled = not core.reconnect_policy.enabled
+            elif not isinstance(enabled, bool):
+                raise ValueError("enabled must be true or false")
+            core.set_auto_reconnect(enabled)
+        elif method == 'reload':
+            core.reload_config()
+        else:
+            raise ValueError(f"unknown method: {method}")
+        if method != 'status':
+            print(f"Control request: {method}")
+        return core.status_snapshot()
+
+    def close(self):
+        for fd in list(self.clients):
+            self.drop(fd)
+        if self.source is not None:
+            self.loop.source_remove(self.source)
+            self.source = None
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,768 @@
+"""
+VPN core
+Connection state detection, auto-reconnect, health probes, traffic,
+session history and metrics for kvnet/kerio-kvc.service, independent
+of any user interface. Nothing here imports gi: the main loop, the
+service, interface and helper backends, notifications and even the clock
+are passed in, so the same core drives the tray icon, the headless
+daemon and the simulator in kerio_vpn.simulation
+"""
+
+import os
+import signal
+import time
+
+from kerio_vpn import kerioconf
+from kerio_vpn.commands import CommandResult, CommandRunner
+from kerio_vpn.flapping import FlapDetector
+from kerio_vpn.health import HealthProber
+from kerio_vpn.helper import SYSTEMCTL_TIMEOUT, PrivilegedClient
+from kerio_vpn.history import CHECKPOINT_INTERVAL, SessionLog
+from kerio_vpn.instrument import Instrumentation
+from kerio_vpn.metrics import Histogram, MetricsExporter
+from kerio_vpn.netlink import INTERFACE, LinkWatcher
+from kerio_vpn.reconnect import ReconnectPolicy
+from kerio_vpn.scheduler import StatusScheduler
+from kerio_vpn.service import UNIT, SystemctlService
+from kerio_vpn.settings import load_settings
+from kerio_vpn.statecache import StateCache
+from kerio_vpn.traffic import InterfaceCounters, TrafficMonitor
+
+
+def print_notification(category, title, message):
+    """Default notification sink for headless use"""
+    print(f"{title}: {message}".replace('\n', ' - '))
+
+
+class VPNCore:
+    """State machine behind every front end"""
+
+    def __init__(self, loop, settings=None, service=None, notify=None,
+                 config_file=kerioconf.CONFIG_FILE, sleep=None, network=None,
+                 interface=None, privileged=None, counters=None, executor=None, clock=None):
+        """
+        loop: a kerio_vpn.mainloop loop (GLibLoop or SelectorLoop).
+        service: kerio-kvc.service backend with status(), `available` and
+        `on_change`, e.g. systemd.UnitWatcher; defaults to SystemctlService.
+        notify: notify(category, title, message), defaults to printing.
+        sleep: optional suspend source with `sleeping` and `on_change`,
+        e.g. logind.SleepWatcher.
+        network: optional uplink source with `online`, `primary_connection`
+        and `on_change`, e.g. networkmanager.ConnectivityWatcher.
+        interface: kvnet backend with status() -> (is_up, state, IPv4),
+        `available`, `on_change` and close(); defaults to netlink.LinkWatcher.
+        privileged: systemctl(action) -> CommandResult and close(), defaults
+        to helper.PrivilegedClient.
+        counters: kvnet traffic counters, defaults to traffic.InterfaceCounters.
+        executor: runs blocking calls off the loop, defaults to a thread pool.
+        clock: stands in for both time.time and time.monotonic, for simulation
+        """
+        self.loop = loop
+        self.clock = clock or time.time
+        self.settings = settings or load_settings()
+        self.notify = notify or print_notification
+        self.listeners = []  # listener(core) after every state refresh
+
+        # Optional hot-path timings; must see the loop before its methods are handed out
+        self.instrumentation = Instrumentation.from_settings(self.settings)
+        self.instrumentation.watch_loop(loop)
+
+        # State variables
+        self.is_connected = False
+        self.connection_start_time = None
+        self.vpn_ip = None
+        self.vpn_server = None
+        self.service_active = False
+        self.service_state = None  # e.g. 'active', 'activating', 'failed'
+        self.interface_state = None
+        self.is_degraded = False  # Connected but failing health probes
+        self.restart_phase = None  # 'restarting', then 'probing' until a probe answers
+
+        # Privileged and helper commands run off the main loop
+        self.commands = CommandRunner(loop.idle_add, executor=executor)
+        self.instrumentation.wrap(self.commands, '_execute', 'subprocess')
+        self.instrumentation.wrap(self.commands, '_execute_call', 'worker_call')
+
+        # Root operations go over one connection to kerio-vpn-helper, sudo without it
+        self.privileged = privileged or PrivilegedClient(self.settings.get('helper', 'socket'))
+
+        # kvnet traffic counters, sampled while connected
+        self.traffic_counters = counters or InterfaceCounters(INTERFACE)
+        self.traffic = TrafficMonitor(self.traffic_counters, clock=clock or time.monotonic)
+        self.traffic_source = None
+
+        # Connection history, written when a session ends and checkpointed
+        # while it lasts, so a crash does not lose it
+        self.session_log = SessionLog()
+        self.session = None
+        self.checkpoint_source = None
+
+        # What the tray shows on its next start before the first check
+        self.state_cache = StateCache()
+
+        # Counters for the optional OpenMetrics endpoint
+        self.poll_histogram = Histogram()
+        self.spawned = 0  # processes started directly on the main loop
+        self.lifetime_rx_bytes = 0
+        self.lifetime_tx_bytes = 0
+        self.metrics = None
+        listen = self.settings.get('metrics', 'listen')
+        if listen:
+            try:
+                self.metrics = MetricsExporter(listen)
+                self.metrics.start()
+            except (OSError, ValueError) as e:
+                print(f"Could not start metrics endpoint on {listen}: {e}")
+                self.metrics = None
+
+        # Optional tunnel health probes from the [health] settings
+        self.health = HealthProber.from_settings(self.settings)
+        self.health_source = None
+
+        # Load config; front ends that can watch the file set config_monitor,
+        # otherwise every status check re-validates the cached parse
+        self.config_file = config_file
+        self.config_monitor = None
+        self.load_config()
+
+        # One coalesced status timer whose interval follows the connection state
+        self.instrumentation.wrap(self, 'update_status')
+        self.instrumentation.wrap(self, 'check_interface')
+        self.scheduler = StatusScheduler(
+            self.update_status, loop.timeout_add, loop.source_remove,
+            fast_interval=self.settings.getfloat('scheduler', 'fast_interval'),
+            base_interval=self.settings.getfloat('scheduler', 'base_interval'),
+            max_interval=self.settings.getfloat('scheduler', 'max_interval'),
+            clock=clock or time.monotonic,
+        )
+        self.reconnect_source = None
+        self.instrumentation.wrap(self, 'schedule_auto_reconnect')
+        self.instrumentation.wrap(self, 'auto_reconnect', 'reconnect_timer')
+
+        # Backoff, attempt limits and manual-disconnect tracking for auto-reconnect
+        self.reconnect_policy = ReconnectPolicy.from_settings(
+            self.settings, clock=clock or time.monotonic,
+            damped_delay=self.settings.getfloat('flapping', 'reconnect_delay'))
+
+        # Debounce and flap detection between the raw checks and is_connected
+        self.flap = FlapDetector.from_settings(self.settings, clock=clock or time.monotonic)
+        self.suppressed_notifications = 0  # Connection notifications held back while flapping
+
+        # Optional gateway list: with switching enabled, auto-reconnect moves
+        # to the fastest candidate whose certificate fingerprint is known
+        self.gateway_candidates = []
+        self.gateway_fingerprints = {}
+        self.gateway_selector = None
+        candidates = self.settings.get('gateways', 'candidates').strip()
+        if candidates and self.settings.getboolean('gateways', 'switch'):
+            # asyncio and ssl are only loaded when there is something to rank
+            from kerio_vpn.gateways import GatewaySelector, parse_candidates, parse_fingerprints
+            try:
+                self.gateway_candidates = parse_candidates(candidates)
+            except ValueError as e:
+                print(f"Invalid gateway list {candidates!r}: {e}")
+            try:
+                self.gateway_fingerprints = parse_fingerprints(
+                    self.settings.get('gateways', 'fingerprints'))
+            except ValueError as e:
+                print(f"Invalid gateway fingerprints: {e}")
+            self.gateway_selector = GatewaySelector(
+                attempts=self.settings.getint('gateways', 'attempts'),
+                timeout=self.settings.getfloat('gateways', 'timeout'),
+                ttl=self.settings.getfloat('gateways', 'cache_ttl'),
+            )
+
+        # kvnet over rtnetlink and kerio-kvc.service; event-driven backends
+        # trigger a re-check, polling ones leave it to the scheduler
+        self.interface = interface or LinkWatcher(loop, INTERFACE)
+        self.interface.on_change = self.on_backend_change
+        self.service = service or SystemctlService(UNIT)
+        self.service.on_change = self.on_backend_change
+        self.instrumentation.wrap(self.service, 'status', 'service_status')
+
+        # Suspend/resume and uplink changes: no polling while asleep, and
+        # reconnects wait for a usable uplink instead of burning attempts
+        self.asleep = False
+        self.resume_pending = False  # Reconnect once the uplink is back after a resume
+        self.sleep = sleep
+        if sleep is not None:
+            sleep.on_change = self.on_sleep_change
+        self.network = network
+        self.primary_connection = None
+        if network is not None:
+            network.on_change = self.on_network_change
+            self.reconnect_policy.online = network.online
+            self.primary_connection = network.primary_connection
+
+    def start(self):
+        """Start monitoring; with both event sources the poll is only a safety net"""
+        self.scheduler.events_available = self.interface.available and self.service.available
+        recovered = self.session_log.recover()
+        if recovered is not None:
+            print(f"Logged the session left open since {time.ctime(recovered['connect'])}")
+        # First check on the next loop iteration rather than a full interval later
+        self.scheduler.trigger()
+        self.loop.signal_add(signal.SIGUSR1, self.dump_diagnostics)
+
+    def shutdown(self):
+        """Close the open session and stop everything the core started"""
+        if self.is_connected:
+            self.close_session('exit')
+        self.scheduler.stop()
+        self.stop_traffic_sampling()
+        self.stop_health_probing()
+        if self.reconnect_source is not None:
+            self.loop.source_remove(self.reconnect_source)
+            self.reconnect_source = None
+        self.interface.close()
+        if self.config_monitor is not None:
+            self.config_monitor.close()
+            self.config_monitor = None
+        for watcher in (self.sleep, self.network):
+            if watcher is not None:
+                watcher.close()
+        if self.metrics is not None:
+            self.metrics.stop()
+        self.commands.shutdown()
+        self.privileged.close()
+
+    def load_config(self):
+        """Load VPN server info from Kerio config; returns True if it changed"""
+        previous = self.vpn_server
+        try:
+            self.vpn_server = kerioconf.read_server(self.config_file)
+        except Exception as e:
+            if previous != "Unknown":
+                print(f"Error loading config: {e}")
+            self.vpn_server = "Unknown"
+        return self.vpn_server != previous
+
+    def reload_config(self):
+        """Show the server the editor just saved; a no-op for an unchanged file"""
+        if self.load_config():
+            print(f"Config reloaded, server: {self.vpn_server}")
+            self.changed()
+            self.state_cache.save(self.last_known_state())
+
+    def changed(self):
+        """Tell the front ends to redraw"""
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                print(f"Error in state listener: {e}")
+
+    def start_traffic_sampling(self):
+        """Begin a new traffic session sampled at 1 Hz"""
+        self.traffic.reset()
+        self.traffic.sample()
+        if self.traffic_source is None:
+            self.traffic_source = self.loop.timeout_add(1000, self.sample_traffic)
+
+    def stop_traffic_sampling(self):
+        """Stop sampling and release the counter files"""
+        if self.traffic_source is not None:
+            self.loop.source_remove(self.traffic_source)
+            self.traffic_source = None
+        self.traffic_counters.close()
+
+    def sample_traffic(self):
+        """Take a traffic sample and refresh the front ends"""
+        # Also refreshes the duration, so the status poll can stay relaxed
+        if self.traffic.sample() and self.is_connected:
+            self.changed()
+            self.publish_metrics()
+        return True  # Keep sampling until stopped
+
+    def get_connection_duration(self):
+        """Get formatted connection duration"""
+        if not self.connection_start_time:
+            return "00:00:00"
+
+        duration = int(self.clock() - self.connection_start_time)
+        hours = duration // 3600
+        minutes = (duration % 3600) // 60
+        seconds = duration % 60
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    def update_status(self):
+        """Check VPN status and update state; returns True if the state changed"""
+        started = time.perf_counter()
+        was_connected = self.is_connected
+        if self.config_monitor is None:
+            self.load_config()  # One stat() unless the file changed
+
+        # Check service status
+        service_active, service_status = self.service.status()
+        self.service_active = service_active
+        self.service_state = service_status
+
+        # Check network interface
+        interface_up, interface_state, vpn_ip = self.check_interface()
+        self.interface_state = interface_state
+
+        # Debug output
+        print(f"Service: {service_status} (active={service_active}), Interface: {interface_state} (up={interface_up}), IP: {vpn_ip}, "
+              f"Checks: {self.scheduler.tick_rate():.2f}/s")
+
+        # Update connection state - require BOTH service active AND interface up with IP,
+        # debounced while the unit keeps running: a stopped unit is not a blip
+        was_flapping = self.flap.flapping
+        self.is_connected = self.flap.update(service_active and interface_up and vpn_ip is not None,
+                                             definite=not service_active)
+        if self.flap.pending is not None:
+            self.scheduler.check_in(self.flap.pending)  # Decide when the window ends
+        if self.flap.flapping != was_flapping:
+            self.on_flapping_changed()
+
+        # Connected but failing health probes
+        was_degraded = self.is_degraded
+        self.is_degraded = (self.is_connected and self.health is not None
+                            and self.health.stats.degraded)
+
+        if self.is_connected:
+            if vpn_ip is not None:
+                self.vpn_ip = vpn_ip  # Else a blip inside the debounce window
+            if not was_connected:
+                self.connection_start_time = self.clock()
+                self.start_traffic_sampling()
+                self.start_health_probing()
+                self.cancel_auto_reconnect()  # Back on its own, don't restart a working tunnel
+                attempts = self.reconnect_policy.attempts
+                reconnect_time = self.record_reconnect()
+                self.open_session(vpn_ip, attempts, reconnect_time)
+                self.show_notification("Kerio VPN Connected",
+                                       f"VPN connection established\nIP: {vpn_ip}",
+                                       category='connection')
+            elif self.is_degraded and not was_degraded:
+                self.show_notification("Kerio VPN Degraded",
+                                       f"Tunnel is up but not passing traffic\n{self.health.stats.describe()}",
+                                       category='connection')
+                if self.settings.getboolean('health', 'reconnect'):
+                    self.reconnect_policy.on_connection_lost()
+                    self.schedule_auto_reconnect()
+            elif (not self.is_degraded and self.reconnect_policy.in_outage
+                  and self.restart_phase is None):
+                # Restarted out of a degraded state without losing the link
+                self.cancel_auto_reconnect()
+                self.record_reconnect()
+        else:
+            self.connection_start_time = None
+            self.vpn_ip = None
+            if was_connected:
+                self.stop_traffic_sampling()
+                self.stop_health_probing()
+                self.close_session('manual' if self.reconnect_policy.manual_disconnect
+                                   else 'degraded' if was_degraded else 'lost')
+                self.show_notification("Kerio VPN Disconnected",
+                                       "VPN connection lost",
+                                       category='connection')
+
+                self.reconnect_policy.on_connection_lost()
+                if self.reconnect_policy.attempt_settled(service_active):
+                    self.schedule_auto_reconnect()  # Else the running attempt may still succeed
+            elif (self.reconnect_policy.in_outage
+                  and self.reconnect_policy.attempt_settled(service_active)):
+                # The last attempt ended without a tunnel, back off and try again
+                self.schedule_auto_reconnect()
+
+        self.changed()
+        self.state_cache.save(self.last_known_state())
+        self.poll_histogram.observe(time.perf_counter() - started)
+        self.publish_metrics()
+        return self.is_connected != was_connected or self.is_degraded != was_degraded
+
+    def last_known_state(self):
+        return {
+            'connected': self.is_connected,
+            'degraded': self.is_degraded,
+            'vpn_ip': self.vpn_ip,
+            'server': self.vpn_server,
+        }
+
+    def status_snapshot(self):
+        """State as of the last check, for `kerio-vpn-indicator status` over the control socket"""
+        return dict(self.last_known_state(),
+                    service=self.service_state,
+                    interface=self.interface_state,
+                    connected_since=self.connection_start_time,
+                    auto_reconnect=self.reconnect_policy.enabled,
+                    asleep=self.asleep,
+                    online=self.reconnect_policy.online,
+                    reconnect_attempts=self.reconnect_policy.attempts,
+                    flap_score=self.flap.score,
+                    flapping=self.flap.flapping,
+                    pid=os.getpid())
+
+    def publish_metrics(self):
+        """Hand the current state to the metrics endpoint as a cached snapshot"""
+        if self.metrics is None:
+            return
+        totals = self.traffic.session_totals() if self.session is not None else {}
+        policy = self.reconnect_policy.stats()
+        stats = self.health.stats if self.health is not None else None
+        self.metrics.publish({
+            'connected': self.is_connected,
+            'degraded': self.is_degraded,
+            'service_active': self.service_active,
+            'connection_start_time': self.connection_start_time,
+            'outages': policy['outages'],
+            'reconnect_attempts': policy['total_attempts'],
+            'last_reconnect_time': policy['last_reconnect_time'],
+            'rx_bytes': self.lifetime_rx_bytes + totals.get('rx_bytes', 0),
+            'tx_bytes': self.lifetime_tx_bytes + totals.get('tx_bytes', 0),
+            'health_rtt': stats.rtt if stats is not None else None,
+            'health_loss': stats.loss if stats is not None and stats.samples else None,
+            'poll_duration': self.poll_histogram.snapshot(),
+            'status_checks': self.poll_histogram.count,
+            'subprocess_spawns': self.subprocess_spawns(),
+        })
+
+    def subprocess_spawns(self):
+        return (self.spawned + self.commands.spawned + self.service.spawned
+                + self.interface.spawned + self.privileged.spawned)
+
+    def dump_diagnostics(self):
+        """SIGUSR1: write timings and process counters to $XDG_RUNTIME_DIR"""
+        state = dict(self.last_known_state(),
+                     service_active=self.service_active,
+                     subprocess_spawns=self.subprocess_spawns(),
+                     commands_in_flight=len(self.commands.in_flight),
+                     status_checks=self.poll_histogram.count,
+                     check_rate=self.scheduler.tick_rate(),
+                     reconnect=self.reconnect_policy.stats(),
+                     flap=self.flap.stats())
+        try:
+            print(f"Diagnostics written to {self.instrumentation.dump(state)}")
+        except OSError as e:
+            print(f"Could not write diagnostics: {e}")
+        return True  # Keep the handler installed
+
+    def schedule_auto_reconnect(self, immediate=False):
+        """Queue the next auto-reconnect attempt if the policy allows one"""
+        if self.reconnect_source is not None:
+            return  # An attempt is already pending
+        if (self.commands.is_running(('systemctl', 'start'))
+                or self.commands.is_running(('systemctl', 'restart'))):
+            return  # The previous start has not returned yet
+        if self.commands.is_running(('gateways', 'select')):
+            return  # The previous attempt is still probing gateways
+
+        gave_up = self.reconnect_policy.gave_up
+        delay = self.reconnect_policy.next_delay(immediate)
+        if delay is None:
+            if self.reconnect_policy.gave_up > gave_up:
+                self.show_notification("Kerio VPN",
+                                       f"Auto-reconnect gave up after {self.reconnect_policy.attempts} attempts",
+                                       category='connection')
+            return
+        print(f"Auto-reconnect {self.reconnect_policy.describe_attempt()} in {delay:.1f}s")
+        self.reconnect_source = self.loop.timeout_add(int(delay * 1000), self.auto_reconnect)
+
+    def cancel_auto_reconnect(self):
+        """Drop the pending attempt; it never ran, so it does not count"""
+        if self.reconnect_source is not None:
+            self.loop.source_remove(self.reconnect_source)
+            self.reconnect_source = None
+            self.reconnect_policy.uncount_attempt()
+
+    def on_sleep_change(self, sleep):
+        """logind PrepareForSleep: pause before suspend, reconnect after resume"""
+        if sleep.sleeping:
+            print("Host is going to sleep, pausing status checks")
+            self.asleep = True
+            policy = self.reconnect_policy
+            # The tunnel does not survive a suspend; restore it on wake-up
+            self.resume_pending = (policy.enabled and not policy.manual_disconnect
+                                   and (self.is_connected or policy.in_outage))
+            self.scheduler.pause()
+            self.cancel_auto_reconnect()
+            self.stop_health_probing()
+        else:
+            print("Host resumed")
+            self.asleep = False
+            self.scheduler.resume()
+            if self.is_connected:
+                self.start_health_probing()
+            self.reconnect_on_uplink()
+
+    def on_network_change(self, network):
+        """NetworkManager connectivity or default route changed"""
+        online = network.online
+        was_online = self.reconnect_policy.online
+        self.reconnect_policy.online = online
+        route_changed = network.primary_connection != self.primary_connection
+        self.primary_connection = network.primary_connection
+        if self.asleep:
+            return  # Handled on resume
+        if not online:
+            if was_online:
+                print("Uplink lost, holding auto-reconnect until it is back")
+                self.cancel_auto_reconnect()
+            return
+        if self.resume_pending:
+            self.reconnect_on_uplink()
+        elif not was_online or route_changed:
+            print("Uplink is back" if not was_online else "Default route changed")
+            if self.reconnect_policy.in_outage and not self.is_connected:
+                # Retry now instead of sitting out a backoff meant for a dead uplink
+                self.cancel_auto_reconnect()
+                self.schedule_auto_reconnect(immediate=True)
+            else:
+                self.scheduler.trigger()
+                if self.is_connected and self.health is not None:
+                    self.run_health_probe()
+
+    def reconnect_on_uplink(self):
+        """After a resume, restart the tunnel as soon as the uplink is usable"""
+        policy = self.reconnect_policy
+        if not self.resume_pending or self.asleep or not policy.online:
+            return
+        self.resume_pending = False
+        if not policy.enabled or policy.manual_disconnect:
+            return
+        print("Uplink usable after resume, reconnecting")
+        policy.on_connection_lost()
+        policy.on_attempt()  # Not counted: no backoff was consumed
+        self.reconnect_now()
+
+    def on_flapping_changed(self):
+        """Hold back connection notifications and damp auto-reconnect while flapping"""
+        flapping = self.flap.flapping
+        self.reconnect_policy.damped = flapping
+        if flapping:
+            print(f"Connection is flapping: {self.flap.describe()}")
+            self.notify('connection', "Kerio VPN Unstable",
+                        f"The connection keeps dropping ({self.flap.describe()})\n"
+                        "Notifications paused, reconnecting less eagerly")
+        else:
+            print(f"Connection settled, {self.suppressed_notifications} notifications held back")
+            state = "connected" if self.is_connected else "disconnected"
+            self.notify('connection', "Kerio VPN Stable",
+                        f"The connection has settled and is {state}")
+            self.suppressed_notifications = 0
+
+    def record_reconnect(self):
+        """Close the current outage and log how long reconnecting took"""
+        reconnect_time = self.reconnect_policy.on_connected()
+        if reconnect_time is not None:
+            print(f"Reconnected after {reconnect_time:.1f}s")
+        return reconnect_time
+
+    def open_session(self, vpn_ip, reconnect_attempts, reconnect_time):
+        """Start the history record for a new connection"""
+        self.session = {
+            'connect': self.clock(),
+            'vpn_ip': vpn_ip,
+            'server': self.vpn_server,
+            'reconnect_attempts': reconnect_attempts,
+            'reconnect_time': reconnect_time,
+        }
+        self.checkpoint_session()
+        if self.checkpoint_source is None:
+            self.checkpoint_source = self.loop.timeout_add(CHECKPOINT_INTERVAL * 1000,
+                                                           self.checkpoint_session)
+
+    def checkpoint_session(self):
+        """Save the open session as it would be logged if the process died now"""
+        if self.session is None:
+            return True
+        totals = self.traffic.session_totals()
+        self.session_log.checkpoint(dict(self.session, disconnect=self.clock(), cause='interrupted',
+                                         rx_bytes=totals['rx_bytes'], tx_bytes=totals['tx_bytes']))
+        return True  # Keep checkpointing until the session closes
+
+    def close_session(self, cause):
+        """Finish the current history record and write it out"""
+        if self.session is None:
+            return
+        totals = self.traffic.session_totals()
+        self.lifetime_rx_bytes += totals['rx_bytes']
+        self.lifetime_tx_bytes += totals['tx_bytes']
+        self.session.update({
+            'disconnect': self.clock(),
+            'cause': cause,
+            'rx_bytes': totals['rx_bytes'],
+            'tx_bytes': totals['tx_bytes'],
+        })
+        self.session_log.append(self.session)
+        self.session_log.flush()
+        self.session_log.clear_checkpoint()
+        self.session = None
+        if self.checkpoint_source is not None:
+            self.loop.source_remove(self.checkpoint_source)
+            self.checkpoint_source = None
+
+    def start_health_probing(self):
+        """Probe the tunnel periodically while connected"""
+        if self.health is None:
+            return
+        self.health.stats.reset()
+        self.restart_phase = None  # A new tunnel; its connect closed the outage
+        if self.health_source is None:
+            interval = self.settings.getint('health', 'interval')
+            self.health_source = self.loop.timeout_add(interval * 1000, self.run_health_probe)
+
+    def stop_health_probing(self):
+        """Stop probing once the tunnel is down"""
+        if self.health_source is not None:
+            self.loop.source_remove(self.health_source)
+            self.health_source = None
+
+    def run_health_probe(self):
+        """Run one probe round on a worker thread"""
+        self.commands.call(self.health.probe_round, callback=self.on_health_result,
+                           key='health-probe')
+        return True  # Keep probing until stopped
+
+    def on_health_result(self, results, error):
+        """Fold probe results into the health stats and re-evaluate state"""
+        if error is not None:
+            print(f"Health probe error: {error}")
+            return
+        if not self.is_connected:
+            return
+        self.health.record(results)
+        print(f"Health: {self.health.stats.describe()}")
+        if self.restart_phase == 'probing' and any(rtt is not None for rtt in results):
+            self.restart_phase = None  # The restarted tunnel passes traffic
+        self.scheduler.trigger()
+
+    def check_interface(self):
+        """Return (is_up, state description, IPv4 address) for kvnet"""
+        return self.interface.status()
+
+    def on_backend_change(self, backend):
+        """The unit or kvnet changed, or a backend fell back to polling"""
+        if not backend.available:
+            self.scheduler.events_available = False
+        self.scheduler.trigger()
+
+    def auto_reconnect(self):
+        """Attempt to reconnect automatically"""
+        self.reconnect_source = None
+        self.reconnect_policy.on_attempt()
+        print(f"Auto-reconnect {self.reconnect_policy.describe_attempt()}")
+        self.show_notification("Kerio VPN",
+                               f"Auto-reconnecting... ({self.reconnect_policy.describe_attempt()})",
+                               category='connection')
+        if len(self.gateway_candidates) > 1:
+            # Probe off the main loop, then reconnect to whichever answered best
+            self.commands.call(self.select_gateway, callback=self.on_gateway_selected,
+                               key=('gateways', 'select'))
+        else:
+            self.reconnect_now()
+        return False  # Don't repeat this timeout
+
+    def reconnect_now(self):
+        if self.service_active:
+            # Degraded, or the service is up without a tunnel: a start would be a no-op
+            self.restart_vpn()
+        else:
+            self.connect_vpn()
+
+    def select_gateway(self):
+        """Worker: point the config at the best trusted gateway; returns it if the config changed"""
+        from kerio_vpn.gateways import UntrustedGateway, write_gateway
+
+        for result in self.gateway_selector.rank(self.gateway_candidates):
+            if not result.rtts:
+                break  # Ranked last: nothing further down answered either
+            try:
+                if write_gateway(self.privileged, result, self.config_file,
+                                 fingerprints=self.gateway_fingerprints):
+                    return result
+                return None  # Already the best one we may use
+            except UntrustedGateway as e:
+                print(f"Not switching to {result.address}: {e}")
+        return None
+
+    def on_gateway_selected(self, best, error):
+        if error is not None:
+            print(f"Gateway selection failed: {error}")
+        elif best is not None:
+            print(f"Switching to gateway {best.describe()}")
+        self.reconnect_now()
+
+    def set_auto_reconnect(self, enabled):
+        """Turn auto-reconnect on or off; re-enabling starts with a fresh budget"""
+        self.reconnect_policy.enabled = enabled
+        if enabled:
+            self.reconnect_policy.reset()
+        self.changed()
+
+    def connect_vpn(self):
+        """Start VPN connection in the background"""
+        self.reconnect_policy.on_manual_connect()  # Clear manual disconnect flag when connecting
+        self.scheduler.fast_window(self.settings.getfloat('scheduler', 'fast_window'))
+        self.systemctl('start', self.on_connect_done)
+
+    def on_connect_done(self, result):
+        """Report a failed `systemctl start`"""
+        if not result.ok and not result.cancelled:
+            self.show_notification("Kerio VPN Error", f"Failed to start VPN: {result.describe_error()}",
+                                   category='error')
+
+    def restart_vpn(self):
+        """Restart VPN connection in the background"""
+        self.reconnect_policy.on_manual_connect()
+        self.scheduler.fast_window(self.settings.getfloat('scheduler', 'fast_window'))
+        if self.health is not None:
+            # Stats from the old tunnel stay until the restart is done, so
+            # the outage is not closed while systemctl is still running
+            self.restart_phase = 'restarting'
+        self.systemctl('restart', self.on_restart_done)
+
+    def on_restart_done(self, result):
+        """Probe the restarted tunnel afresh; its first answer ends the outage"""
+        if self.restart_phase == 'restarting':
+            self.health.stats.reset()
+            self.restart_phase = 'probing'
+        self.on_connect_done(result)
+
+    def systemctl(self, action, callback):
+        """Run `systemctl <action>` on the unit off the main loop, then callback(result)"""
+        def on_done(result, error):
+            if error is not None:
+                result = CommandResult.from_call_error(['systemctl', action, UNIT], error)
+            callback(result)
+
+        # The helper allows systemctl SYSTEMCTL_TIMEOUT seconds; a hung helper
+        # or sudo is reported as timed out a little after that
+        self.commands.call(lambda: self.privileged.systemctl(action), callback=on_done,
+                           key=('systemctl', action), timeout=SYSTEMCTL_TIMEOUT + 10)
+
+    def disconnect_vpn(self, on_done=None):
+        """Stop VPN connection in the background, then call on_done(result)"""
+        self.reconnect_policy.on_manual_disconnect()  # Set flag to prevent auto-reconnect
+        if self.reconnect_source is not None:
+            self.loop.source_remove(self.reconnect_source)
+            self.reconnect_source = None
+
+        def on_disconnect_done(result):
+            self.scheduler.trigger()
+            if not result.ok and not result.cancelled:
+                self.show_notification("Kerio VPN Error", f"Failed to stop VPN: {result.describe_error()}",
+                                       category='error')
+            if on_done:
+                on_done(result)
+
+        self.systemctl('stop', on_disconnect_done)
+
+    def reconnect_vpn(self):
+        """Stop, then start again once the stop has finished"""
+        self.disconnect_vpn(on_done=lambda result: self.connect_vpn())
+
+    def toggle_connection(self):
+        if self.is_connected:
+            self.disconnect_vpn()
+        else:
+            self.connect_vpn()
+
+    def show_notification(self, title, message, category='info'):
+        """Show a notification, replacing the previous one of the same category"""
+        if category == 'connection' and self.flap.flapping:
+            self.suppressed_notifications += 1
+            return  # on_flapping_changed sums up once the link settles
+        self.notify(category, title, message)
+
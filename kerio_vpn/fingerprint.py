@@ -0,0 +1,143 @@
+"""
+Gateway certificate fingerprints
+Fetches the certificate a Kerio gateway presents with the ssl module and
+computes the MD5 fingerprint kerio-kvc.conf stores (and SHA-256 for
+display). Results are cached per (host, port) until the TTL runs out or
+the certificate expires, whichever comes first, so repeated saves and
+connection tests do not reconnect to the gateway
+"""
+
+import hashlib
+import socket
+import ssl
+import threading
+import time
+
+DEFAULT_TIMEOUT = 5
+DEFAULT_TTL = 3600
+FAILURE_TTL = 30  # Don't hammer an unreachable gateway on every save
+
+
+class Fingerprint:
+    """Fingerprints of one certificate, formatted like `openssl x509 -fingerprint`"""
+
+    def __init__(self, der):
+        self.der = der
+        self.md5 = format_digest(hashlib.md5(der).digest())
+        self.sha256 = format_digest(hashlib.sha256(der).digest())
+        self.not_after = certificate_not_after(der)
+
+    def __repr__(self):
+        return f"Fingerprint(md5={self.md5})"
+
+
+def format_digest(digest):
+    return ':'.join(f'{byte:02X}' for byte in digest)
+
+
+def split_host(host):
+    """Strip the brackets of an IPv6 literal"""
+    if host.startswith('[') and host.endswith(']'):
+        return host[1:-1]
+    return host
+
+
+def fetch_certificate(host, port, timeout=DEFAULT_TIMEOUT):
+    """
+    DER bytes of the certificate the server presents. Not verified: the
+    fingerprint is what pins a self-signed gateway
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    host = split_host(host)
+    with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+        with context.wrap_socket(sock, server_hostname=host) as tls:
+            return tls.getpeercert(binary_form=True)
+
+
+def _der_element(data, offset):
+    """(tag, start of contents, end of contents) of the DER element at offset"""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7f
+        length = int.from_bytes(data[offset:offset + count], 'big')
+        offset += count
+    return tag, offset, offset + length
+
+
+def certificate_not_after(der):
+    """Expiry of a DER certificate as a Unix time, None if it cannot be read"""
+    try:
+        _tag, start, _end = _der_element(der, 0)  # Certificate
+        _tag, start, _end = _der_element(der, start)  # TBSCertificate
+        tag, _start, end = _der_element(der, start)
+        if tag == 0xa0:  # Explicit version, absent in v1 certificates
+            tag, _start, end = _der_element(der, end)  # serialNumber
+        for _field in ('signature', 'issuer'):
+            _tag, _start, end = _der_element(der, end)
+        _tag, start, _end = _der_element(der, end)  # validity
+        _tag, start, end = _der_element(der, start)  # notBefore
+        tag, start, end = _der_element(der, end)  # notAfter
+        text = der[start:end].decode('ascii')
+        if tag == 0x17:  # UTCTime, two-digit year
+            year = int(text[:2])
+            text = str(1900 + year if year >= 50 else 2000 + year) + text[2:]
+        import calendar
+
+        return calendar.timegm(time.strptime(text, '%Y%m%d%H%M%SZ'))
+    except (IndexError, ValueError, UnicodeDecodeError):
+        return None
+
+
+class FingerprintCache:
+    """Fingerprints per (host, port); fetch errors are cached for a short while too"""
+
+    def __init__(self, ttl=DEFAULT_TTL, failure_ttl=FAILURE_TTL, clock=time.time,
+                 fetch=fetch_certificate):
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.clock = clock
+        self.fetch_certificate = fetch
+        self.entries = {}  # (host, port) -> (expires at, Fingerprint or the error)
+        self.lock = threading.Lock()
+
+    def get(self, host, port, timeout=DEFAULT_TIMEOUT):
+        """Fingerprint of host:port; raises OSError (including ssl.SSLError) on failure"""
+        key = (split_host(host).lower(), int(port))
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or entry[0] <= now:
+            try:
+                result = Fingerprint(self.fetch_certificate(key[0], key[1], timeout))
+                expires = now + self.ttl
+                if result.not_after is not None:
+                    expires = min(expires, result.not_after)
+            except OSError as e:
+                result = e
+                expires = now + self.failure_ttl
+            entry = (expires, result)
+            with self.lock:
+                self.entries[key] = entry
+        if isinstance(entry[1], Exception):
+            raise entry[1].with_traceback(None)  # Raising it again would grow its traceback
+        return entry[1]
+
+    def invalidate(self, host=None, port=None):
+        """Forget one endpoint, or everything"""
+        with self.lock:
+            if host is None:
+                self.entries.clear()
+            else:
+                self.entries.pop((split_host(host).lower(), int(port)), None)
+
+
+_cache = FingerprintCache()
+
+
+def get_fingerprint(host, port, timeout=DEFAULT_TIMEOUT):
+    """Fingerprint of host:port through the process-wide cache"""
+    return _cache.get(host, port, timeout)
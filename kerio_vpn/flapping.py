@@ -0,0 +1,115 @@
+"""
+Connection debounce and flap detection
+Turns the raw result of each status check into a stable state: a drop
+must last down_after seconds and a recovery up_after seconds before the
+state follows, so one missed `inet` line or a moment of `state DOWN`
+goes unnoticed. Every raw change also counts towards a flap score over a
+sliding window; past enter_changes the connection is flapping until the
+score falls to leave_changes. Pure and clock-injectable like the
+reconnect policy, so flap traces replay on simulated time
+"""
+
+import collections
+import time
+
+
+class FlapDetector:
+    """Debounced connection state with a sliding-window flap score"""
+
+    def __init__(self, down_after=3.0, up_after=0.0, window=600.0, enter_changes=6,
+                 leave_changes=2, clock=time.monotonic):
+        """
+        down_after / up_after: seconds a raw drop / recovery must last.
+        window: seconds of raw changes the flap score counts.
+        enter_changes / leave_changes: score at which flapping starts and
+        at or below which it ends; enter_changes = 0 turns detection off
+        """
+        self.down_after = down_after
+        self.up_after = up_after
+        self.window = window
+        self.enter_changes = enter_changes
+        self.leave_changes = leave_changes
+        self.clock = clock
+
+        self.stable = None  # Debounced state, None before the first sample
+        self.raw = None
+        self.raw_since = None
+        self.changes = collections.deque()  # Times of raw changes inside the window
+        self.flapping = False
+        self.flap_periods = 0
+        self.ignored = 0  # Raw drops that recovered inside down_after
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        section = settings['flapping']
+        return cls(
+            down_after=section.getfloat('down_after'),
+            up_after=section.getfloat('up_after'),
+            window=section.getfloat('window'),
+            enter_changes=section.getint('enter_changes'),
+            leave_changes=section.getint('leave_changes'),
+            **kwargs
+        )
+
+    def update(self, raw, definite=False):
+        """
+        Feed one raw sample and return the debounced state. definite skips
+        the debounce, e.g. for a stopped unit: there is nothing to wait out
+        """
+        now = self.clock()
+        if raw != self.raw:
+            if self.raw is not None:
+                self.changes.append(now)
+                if raw and self.stable:
+                    self.ignored += 1  # Back before the drop counted
+            self.raw = raw
+            self.raw_since = now
+        self._expire(now)
+
+        if self.stable is None or definite:
+            self.stable = raw
+        elif raw != self.stable and now - self.raw_since >= self._hold(raw):
+            self.stable = raw
+
+        score = len(self.changes)
+        if not self.flapping and self.enter_changes and score >= self.enter_changes:
+            self.flapping = True
+            self.flap_periods += 1
+        elif self.flapping and score <= self.leave_changes:
+            self.flapping = False
+        return self.stable
+
+    @property
+    def pending(self):
+        """Seconds until the raw state outlasts its debounce window, None if it agrees"""
+        if self.raw is None or self.raw == self.stable:
+            return None
+        return max(0.0, self.raw_since + self._hold(self.raw) - self.clock())
+
+    @property
+    def score(self):
+        """Raw state changes within the window"""
+        self._expire(self.clock())
+        return len(self.changes)
+
+    def _hold(self, raw):
+        return self.up_after if raw else self.down_after
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        while self.changes and self.changes[0] < cutoff:
+            self.changes.popleft()
+
+    def describe(self):
+        minutes = self.window / 60
+        text = f"Flap score: {self.score} in {minutes:.0f} min"
+        return f"{text} (unstable)" if self.flapping else text
+
+    def stats(self):
+        return {
+            'score': self.score,
+            'flapping': self.flapping,
+            'flap_periods': self.flap_periods,
+            'ignored_drops': self.ignored,
+            'window': self.window,
+        }
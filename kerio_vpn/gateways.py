@@ -0,0 +1,233 @@
+"""
+Gateway selection
+Picks the fastest of several Kerio Control gateways. Every candidate is
+probed at the same time with TLS handshakes to its VPN port (asyncio),
+a few handshakes each, and candidates are ranked by success rate, then
+median handshake time. Rankings are cached for a short while so
+reconnects in quick succession don't probe again
+"""
+
+import asyncio
+import ssl
+import statistics
+import threading
+import time
+
+DEFAULT_PORT = 4090
+DEFAULT_ATTEMPTS = 3
+DEFAULT_TIMEOUT = 3
+DEFAULT_TTL = 300
+
+
+class GatewayResult:
+    """Handshake times (seconds) and errors of one candidate"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.rtts = []
+        self.errors = []
+
+    @property
+    def address(self):
+        host = f'[{self.host}]' if ':' in self.host else self.host
+        return f"{host}:{self.port}"
+
+    @property
+    def attempts(self):
+        return len(self.rtts) + len(self.errors)
+
+    @property
+    def success_rate(self):
+        return len(self.rtts) / self.attempts if self.attempts else 0.0
+
+    @property
+    def median_rtt(self):
+        return statistics.median(self.rtts) if self.rtts else None
+
+    def sort_key(self):
+        median = self.median_rtt
+        return (-self.success_rate, median if median is not None else float('inf'))
+
+    def describe(self):
+        if not self.rtts:
+            return f"{self.address}: unreachable ({self.errors[-1] if self.errors else 'not probed'})"
+        return (f"{self.address}: {self.median_rtt * 1000:.0f} ms median, "
+                f"{len(self.rtts)}/{self.attempts} handshakes")
+
+    def as_dict(self):
+        median = self.median_rtt
+        return {
+            'address': self.address,
+            'median_rtt_ms': round(median * 1000, 1) if median is not None else None,
+            'success_rate': self.success_rate,
+            'errors': self.errors,
+        }
+
+
+def parse_candidates(text, default_port=DEFAULT_PORT):
+    """
+    [(host, port)] from "a.example.com, b.example.com:4091 [2001:db8::1]:4090",
+    in order and without duplicates
+    """
+    candidates = []
+    for item in text.replace(',', ' ').split():
+        if item.startswith('['):
+            host, _, rest = item[1:].partition(']')
+            port = rest[1:] if rest.startswith(':') else ''
+        elif item.count(':') == 1:
+            host, port = item.split(':')
+        else:
+            host, port = item, ''  # Plain name or bare IPv6 address
+        candidate = (host, int(port) if port else int(default_port))
+        if host and candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def parse_fingerprints(text, default_port=DEFAULT_PORT):
+    """
+    {(host, port): md5} from "vpn1.example.com=AA:BB:... vpn2.example.com:4091=CC:DD:...",
+    the certificates auto-reconnect may pin when it switches gateways
+    """
+    fingerprints = {}
+    for item in text.replace(',', ' ').split():
+        endpoint, _, md5 = item.partition('=')
+        candidates = parse_candidates(endpoint, default_port)
+        if len(candidates) != 1 or not md5:
+            raise ValueError(f"expected host[:port]=fingerprint, got {item!r}")
+        fingerprints[candidates[0]] = md5.upper()
+    return fingerprints
+
+
+class UntrustedGateway(Exception):
+    """A gateway without a known fingerprint, or presenting another certificate"""
+
+
+def tls_context():
+    """Handshake only: gateways commonly use self-signed certificates"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def handshake(host, port, context, timeout):
+    """Seconds from connect to a completed TLS handshake"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    _reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=context, server_hostname=host), timeout)
+    elapsed = loop.time() - started
+    writer.close()
+    try:
+        await asyncio.wait_for(writer.wait_closed(), 1)
+    except (OSError, asyncio.TimeoutError):
+        pass
+    return elapsed
+
+
+async def probe(host, port, attempts=DEFAULT_ATTEMPTS, timeout=DEFAULT_TIMEOUT, context=None):
+    """GatewayResult of `attempts` handshakes, one after another"""
+    context = context or tls_context()
+    result = GatewayResult(host, port)
+    for _ in range(attempts):
+        try:
+            result.rtts.append(await handshake(host, port, context, timeout))
+        except asyncio.TimeoutError:
+            result.errors.append('timed out')
+        except (OSError, ssl.SSLError) as e:
+            result.errors.append(e.strerror or str(e) or type(e).__name__)
+    return result
+
+
+async def probe_all(candidates, attempts=DEFAULT_ATTEMPTS, timeout=DEFAULT_TIMEOUT):
+    """Probe every candidate concurrently; results best first"""
+    context = tls_context()
+    results = await asyncio.gather(*(probe(host, port, attempts, timeout, context)
+                                     for host, port in candidates))
+    return sorted(results, key=GatewayResult.sort_key)
+
+
+class GatewaySelector:
+    """Cached rankings per candidate list; safe to call from worker threads"""
+
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, timeout=DEFAULT_TIMEOUT, ttl=DEFAULT_TTL,
+                 clock=time.monotonic):
+        self.attempts = attempts
+        self.timeout = timeout
+        self.ttl = ttl
+        self.clock = clock
+        self.rankings = {}  # tuple of candidates -> (time ranked, [GatewayResult])
+        self.lock = threading.Lock()
+
+    def rank(self, candidates):
+        """[GatewayResult] best first, probing only when no recent ranking exists"""
+        key = tuple(candidates)
+        with self.lock:
+            cached = self.rankings.get(key)
+            if cached is not None and self.clock() - cached[0] < self.ttl:
+                return cached[1]
+            # Held while probing so concurrent callers share one probe round
+            results = asyncio.run(probe_all(candidates, self.attempts, self.timeout))
+            self.rankings[key] = (self.clock(), results)
+            return results
+
+    def best(self, candidates):
+        """The best reachable candidate, None if none answered"""
+        results = self.rank(candidates)
+        if not results or not results[0].rtts:
+            return None
+        return results[0]
+
+    def invalidate(self):
+        with self.lock:
+            self.rankings.clear()
+
+
+def write_gateway(privileged, result, config_file=None, fingerprints=None):
+    """
+    Point the persistent connection at result through a PrivilegedClient.
+    The stored fingerprint belongs to the old gateway, so it is replaced.
+    fingerprints: {(host, port): md5} of trusted gateways. The one for
+    result is pinned, and result must present that certificate. The pin
+    kerio-kvc.conf holds for its current server is added to the dict, so
+    switching back later is trusted too. Raises UntrustedGateway
+    otherwise. Without fingerprints (an explicit `gateways --apply`) the
+    live certificate is pinned as is, or none if it cannot be fetched.
+    Returns whether the config changed
+    """
+    from kerio_vpn import kerioconf
+    from kerio_vpn.fingerprint import get_fingerprint
+
+    config_file = config_file or kerioconf.CONFIG_FILE
+    text = privileged.get_config(config_file)
+    config = kerioconf.KerioConfig.parse(text) if text else kerioconf.KerioConfig.new()
+    if fingerprints is not None and config.get('fingerprint'):
+        try:
+            current = parse_candidates(config.get('server') or '', config.get('port') or DEFAULT_PORT)
+        except ValueError:
+            current = []
+        if len(current) == 1:
+            fingerprints.setdefault(current[0], config.get('fingerprint').upper())
+    if not config.set_endpoint(result.host, result.port):
+        return False
+
+    known = None
+    if fingerprints is not None:
+        known = fingerprints.get((result.host, result.port))
+        if known is None:
+            raise UntrustedGateway(f"no known fingerprint for {result.address}")
+        known = known.upper()
+    try:
+        live = get_fingerprint(result.host, result.port).md5
+    except OSError as e:
+        print(f"Could not get fingerprint of {result.address}: {e}")
+        live = None
+    if known is not None and live is not None and live.upper() != known:
+        raise UntrustedGateway(f"{result.address} presents {live}, expected {known}")
+    # A known pin is written even when the gateway cannot be reached now;
+    # without one Kerio records the fingerprint on first connection
+    config.set('fingerprint', known or live)
+    privileged.put_config(config.to_string(), config_file)
+    return True
@@ -0,0 +1,173 @@
+"""
+Tunnel health probing
+Sends TCP-connect or UDP echo probes to hosts behind the VPN, bound to the
+VPN interface, and tracks an EWMA of the round-trip time and loss rate to
+spot tunnels that are dead while kvnet still looks up
+"""
+
+import errno
+import os
+import socket
+import time
+
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+
+
+class ProbeTarget:
+    """One probe destination, e.g. parsed from 'tcp:10.0.0.1:22'"""
+
+    def __init__(self, protocol, host, port):
+        if protocol not in ('tcp', 'udp'):
+            raise ValueError(f"Unknown probe protocol: {protocol}")
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+
+    @classmethod
+    def parse(cls, spec):
+        protocol, _, rest = spec.partition(':')
+        host, _, port = rest.rpartition(':')
+        if not host or not port.isdigit():
+            raise ValueError(f"Invalid probe target '{spec}', expected proto:host:port")
+        return cls(protocol.lower(), host.strip('[]'), int(port))
+
+    def __str__(self):
+        return f"{self.protocol}:{self.host}:{self.port}"
+
+
+def parse_targets(value):
+    """Parse a whitespace- or comma-separated list of probe targets"""
+    targets = []
+    for spec in value.replace(',', ' ').split():
+        try:
+            targets.append(ProbeTarget.parse(spec))
+        except ValueError as e:
+            print(e)
+    return targets
+
+
+def _open_socket(target, sock_type, device):
+    family = socket.AF_INET6 if ':' in target.host else socket.AF_INET
+    sock = socket.socket(family, sock_type)
+    if device:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, device.encode() + b'\0')
+        except PermissionError:
+            # Older kernels need CAP_NET_RAW; routing still sends the probe via the tunnel
+            pass
+    return sock
+
+
+def probe_tcp(target, timeout=2.0, device=None):
+    """TCP handshake time in seconds, or None if the target did not answer"""
+    sock = _open_socket(target, socket.SOCK_STREAM, device)
+    try:
+        sock.settimeout(timeout)
+        start = time.monotonic()
+        error = sock.connect_ex((target.host, target.port))
+        elapsed = time.monotonic() - start
+        # A refusal is still a full round trip through the tunnel
+        if error in (0, errno.ECONNREFUSED):
+            return elapsed
+        return None
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+def probe_udp(target, timeout=2.0, device=None):
+    """UDP echo round-trip time in seconds, or None if nothing came back"""
+    sock = _open_socket(target, socket.SOCK_DGRAM, device)
+    try:
+        sock.settimeout(timeout)
+        payload = os.urandom(8)
+        start = time.monotonic()
+        sock.sendto(payload, (target.host, target.port))
+        deadline = start + timeout
+        while True:
+            data = sock.recv(64)
+            if data == payload:
+                return time.monotonic() - start
+            # Stale reply from an earlier probe, keep waiting
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            sock.settimeout(remaining)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+PROBES = {'tcp': probe_tcp, 'udp': probe_udp}
+
+
+class HealthStats:
+    """EWMA round-trip time and loss rate over probe results"""
+
+    def __init__(self, alpha=0.3, loss_threshold=0.5, rtt_threshold=0.0, min_samples=3):
+        self.alpha = alpha
+        self.loss_threshold = loss_threshold
+        self.rtt_threshold = rtt_threshold  # seconds, 0 disables the RTT check
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self.rtt = None
+        self.loss = 0.0
+        self.samples = 0
+
+    def add(self, rtt):
+        """Record one probe: rtt in seconds, or None for a lost probe"""
+        self.samples += 1
+        lost = 1.0 if rtt is None else 0.0
+        self.loss += self.alpha * (lost - self.loss)
+        if rtt is not None:
+            self.rtt = rtt if self.rtt is None else self.rtt + self.alpha * (rtt - self.rtt)
+
+    @property
+    def degraded(self):
+        if self.samples < self.min_samples:
+            return False
+        if self.loss >= self.loss_threshold:
+            return True
+        return bool(self.rtt_threshold) and self.rtt is not None and self.rtt > self.rtt_threshold
+
+    def describe(self):
+        rtt = f"{self.rtt * 1000:.0f} ms" if self.rtt is not None else "n/a"
+        return f"RTT {rtt}, loss {self.loss * 100:.0f}%"
+
+
+class HealthProber:
+    """Probes every target once per round and feeds the results into HealthStats"""
+
+    def __init__(self, targets, stats, device='kvnet', timeout=2.0):
+        self.targets = targets
+        self.stats = stats
+        self.device = device
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls, settings, device='kvnet'):
+        """Build a prober from the [health] settings section, None if no targets"""
+        section = settings['health']
+        targets = parse_targets(section.get('targets', ''))
+        if not targets:
+            return None
+        stats = HealthStats(
+            alpha=section.getfloat('ewma_alpha'),
+            loss_threshold=section.getfloat('loss_threshold'),
+            rtt_threshold=section.getfloat('rtt_threshold_ms') / 1000,
+        )
+        return cls(targets, stats, device=device, timeout=section.getfloat('timeout'))
+
+    def probe_round(self):
+        """Blocking: probe all targets, returns a list of RTTs (None = lost)"""
+        return [PROBES[target.protocol](target, self.timeout, self.device)
+                for target in self.targets]
+
+    def record(self, results):
+        """Main loop: fold one round of results into the stats"""
+        for rtt in results:
+            self.stats.add(rtt)
@@ -0,0 +1,437 @@
+"""
+Privileged helper
+A small root service on a unix socket that performs the few operations
+the indicator and the editor need root for: read and atomically replace
+/etc/kerio-kvc.conf and start/stop/restart/query kerio-kvc.service.
+Clients keep one connection open instead of forking sudo per action.
+
+Peers are checked with SO_PEERCRED: root, the helper's own user and
+members of the allowed groups (sudo and wheel, like kerio-vpn-sudoers).
+The protocol is one JSON object per line in each direction:
+
+    {"id": 1, "method": "put_config", "params": {"text": "<config>..."}}
+    {"id": 1, "result": null}  or  {"id": 1, "error": "message"}
+
+Run unprivileged against a scratch tree for testing:
+
+    python3 -m kerio_vpn.helper --socket /tmp/h.sock --root /tmp/root --systemctl echo
+"""
+
+import json
+import os
+import socket
+import struct
+import subprocess
+import threading
+
+from kerio_vpn import kerioconf
+from kerio_vpn.service import UNIT
+
+SOCKET_PATH = '/run/kerio-vpn-helper.sock'
+ALLOWED_GROUPS = ('sudo', 'wheel')
+ACTIONS = ('start', 'stop', 'restart')
+MAX_CONFIG_BYTES = 1024 * 1024
+MAX_LINE_BYTES = 4 * MAX_CONFIG_BYTES  # JSON escaping can grow the text
+SYSTEMCTL_TIMEOUT = 30
+
+
+class HelperError(Exception):
+    """The helper refused or failed a request"""
+
+
+class HelperUnavailable(HelperError):
+    """No helper is listening, or the connection broke before a request got through"""
+
+    def __init__(self, message, errno=None):
+        super().__init__(message)
+        self.errno = errno  # Of the failed connect, None otherwise
+
+
+class HelperTimeout(HelperError):
+    """The request was delivered but no answer came in time; it may still run"""
+
+
+def peer_credentials(sock):
+    """(pid, uid, gid) of the process on the other end of a unix socket"""
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)
+
+
+class HelperService:
+    """The operations themselves, rooted at `root` so tests can use a temp dir"""
+
+    def __init__(self, root='/', systemctl=('systemctl',)):
+        self.config_path = os.path.join(root, kerioconf.CONFIG_FILE.lstrip('/'))
+        self.systemctl_command = list(systemctl)
+        self.write_lock = threading.Lock()
+
+    def get_config(self):
+        """Config text, None if there is no config yet"""
+        try:
+            with open(self.config_path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_config(self, text):
+        """Validate and atomically replace the config with mode 600"""
+        if not isinstance(text, str):
+            raise ValueError("config text must be a string")
+        if len(text.encode()) > MAX_CONFIG_BYTES:
+            raise ValueError("config is too large")
+        import xml.etree.ElementTree as ET
+        try:
+            ET.fromstring(text)
+        except ET.ParseError as e:
+            raise ValueError(f"config is not valid XML: {e}")
+        with self.write_lock:
+            kerioconf.atomic_write(self.config_path, text, mode=0o600)
+
+    def systemctl(self, action):
+        """Run `systemctl <action>` on kerio-kvc.service"""
+        if action not in ACTIONS:
+            raise ValueError(f"unsupported action: {action}")
+        return self._run([action, UNIT])
+
+    def status(self):
+        result = self._run(['is-active', UNIT])
+        return {'active': result['returncode'] == 0, 'state': result['stdout'].strip()}
+
+    def _run(self, args):
+        try:
+            result = subprocess.run(self.systemctl_command + args, stdin=subprocess.DEVNULL,
+                                    capture_output=True, text=True, timeout=SYSTEMCTL_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise HelperError(f"systemctl {' '.join(args)} timed out")
+        return {'returncode': result.returncode, 'stdout': result.stdout, 'stderr': result.stderr}
+
+    def dispatch(self, method, params):
+        if method == 'get_config':
+            return self.get_config()
+        if method == 'put_config':
+            return self.put_config(params.get('text'))
+        if method == 'systemctl':
+            return self.systemctl(params.get('action'))
+        if method == 'status':
+            return self.status()
+        raise ValueError(f"unknown method: {method}")
+
+
+class HelperServer:
+    """Threaded unix socket front of HelperService with peer checks"""
+
+    def __init__(self, service, socket_path=SOCKET_PATH, allowed_groups=ALLOWED_GROUPS,
+                 allowed_uids=(), listen_fd=None):
+        """listen_fd: an already listening socket, e.g. from systemd socket activation"""
+        self.service = service
+        self.socket_path = socket_path
+        self.allowed_uids = {0, os.geteuid()} | set(allowed_uids)
+        self.allowed_gids = set()
+        import grp
+        for name in allowed_groups:
+            try:
+                self.allowed_gids.add(grp.getgrnam(name).gr_gid)
+            except KeyError:
+                continue
+
+        if listen_fd is not None:
+            self.sock = socket.socket(fileno=listen_fd)
+            self.owns_path = False
+        else:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(socket_path)
+            # Anyone may connect, authorization happens per peer below
+            os.chmod(socket_path, 0o666)
+            self.sock.listen(8)
+            self.owns_path = True
+        self.running = False
+
+    def authorized(self, uid):
+        if uid in self.allowed_uids:
+            return True
+        import pwd
+        try:
+            user = pwd.getpwuid(uid)
+        except KeyError:
+            return False
+        return bool(self.allowed_gids & set(os.getgrouplist(user.pw_name, user.pw_gid)))
+
+    def serve_forever(self):
+        self.running = True
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                if not self.running:
+                    break
+                raise
+            threading.Thread(target=self.handle, args=(conn,), daemon=True,
+                             name='kerio-helper-conn').start()
+
+    def shutdown(self):
+        self.running = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        if self.owns_path:
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def handle(self, conn):
+        """One client connection: requests are answered in order until EOF"""
+        with conn:
+            try:
+                self._serve(conn)
+            except (BrokenPipeError, ConnectionResetError):
+                return  # The client gave up waiting, e.g. on a slow restart
+
+    def _serve(self, conn):
+        pid, uid, _gid = peer_credentials(conn)
+        reader = conn.makefile('rb')
+        if not self.authorized(uid):
+            print(f"Rejected helper client pid {pid} uid {uid}")
+            self._send(conn, {'id': None, 'error': 'permission denied'})
+            return
+        while True:
+            line = reader.readline(MAX_LINE_BYTES + 1)
+            if not line:
+                return
+            if len(line) > MAX_LINE_BYTES:
+                self._send(conn, {'id': None, 'error': 'request too large'})
+                return
+            self._send(conn, self.answer(line, uid))
+
+    def answer(self, line, uid):
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            method = request.get('method')
+            params = request.get('params') or {}
+        except (ValueError, AttributeError):
+            return {'id': None, 'error': 'malformed request'}
+        try:
+            result = self.service.dispatch(method, params)
+        except (ValueError, OSError, HelperError) as e:
+            return {'id': request_id, 'error': str(e)}
+        if method in ('put_config', 'systemctl'):
+            print(f"uid {uid}: {method} {params.get('action', '')}".rstrip())
+        return {'id': request_id, 'result': result}
+
+    def _send(self, conn, response):
+        conn.sendall(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+
+
+class HelperClient:
+    """One persistent connection to the helper, safe to share between threads"""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=SYSTEMCTL_TIMEOUT + 5):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise HelperUnavailable(f"{self.socket_path}: {e.strerror or e}", e.errno)
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+            self.reader = None
+
+    def call(self, method, **params):
+        """
+        Send one request and wait for its answer. Only a request that never
+        got through is sent again, on a new connection in case the helper
+        restarted: once delivered, a `restart` must not run twice
+        """
+        with self.lock:
+            self.next_id += 1
+            request = json.dumps({'id': self.next_id, 'method': method, 'params': params},
+                                 separators=(',', ':')).encode() + b'\n'
+            for attempt in range(2):
+                if self.sock is None:
+                    self.connect()
+                try:
+                    self.sock.sendall(request)
+                except OSError as e:
+                    self.close()
+                    if attempt:
+                        raise HelperUnavailable(f"helper connection lost: {e}")
+                    continue
+                try:
+                    line = self.reader.readline()
+                except socket.timeout:
+                    self.close()  # A late answer would be read as the next one's
+                    raise HelperTimeout(f"no answer from the helper within {self.timeout:g}s")
+                except OSError as e:
+                    self.close()
+                    raise HelperError(f"helper connection lost during {method}: {e}")
+                if not line:
+                    self.close()
+                    raise HelperError(f"helper closed the connection during {method}")
+                break
+        response = json.loads(line)
+        if 'error' in response:
+            if response.get('id') is None:
+                self.close()  # The helper hangs up after refusing a peer
+            raise HelperError(response['error'])
+        return response.get('result')
+
+    def get_config(self):
+        return self.call('get_config')
+
+    def put_config(self, text):
+        self.call('put_config', text=text)
+
+    def systemctl(self, action):
+        return self.call('systemctl', action=action)
+
+    def status(self):
+        return self.call('status')
+
+
+class PrivilegedClient:
+    """
+    Privileged operations through the helper, falling back to the sudo
+    commands allowed by kerio-vpn-sudoers when no helper is installed.
+    Blocking: call from a worker thread or a short-lived CLI
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, interactive=False):
+        """interactive: let sudo ask for a password on the terminal (CLI use)"""
+        self.helper = HelperClient(socket_path) if socket_path else None
+        self.interactive = interactive
+        self.spawned = 0  # sudo fallbacks run, for metrics
+
+    def _sudo(self, args, timeout=10):
+        self.spawned += 1
+        if self.interactive:
+            return subprocess.run(['sudo'] + args, stdout=subprocess.PIPE, text=True)
+        return subprocess.run(['sudo'] + args, stdin=subprocess.DEVNULL,
+                              capture_output=True, text=True, timeout=timeout)
+
+    def _helper(self, method, *args):
+        """Result of the helper call, or raises HelperUnavailable to fall back"""
+        if self.helper is None:
+            raise HelperUnavailable("no helper configured")
+        return getattr(self.helper, method)(*args)
+
+    def systemctl(self, action):
+        """Run `systemctl <action>` on the unit; returns a CommandResult"""
+        from kerio_vpn.commands import CommandResult
+
+        args = ['systemctl', action, UNIT]
+        try:
+            result = self._helper('systemctl', action)
+            return CommandResult(args, result['returncode'], result['stdout'], result['stderr'])
+        except HelperUnavailable:
+            pass
+        except HelperTimeout as e:
+            return CommandResult(args, timed_out=True, stderr=str(e))
+        except HelperError as e:
+            return CommandResult(args, error=e)
+        try:
+            result = self._sudo(args)
+            return CommandResult(args, result.returncode, result.stdout, result.stderr or '')
+        except subprocess.TimeoutExpired as e:
+            return CommandResult(args, timed_out=True, stderr=str(e))
+        except OSError as e:
+            return CommandResult(args, error=e)
+
+    def get_config(self, path=kerioconf.CONFIG_FILE):
+        """Config text, None if it does not exist or cannot be read"""
+        try:
+            return self._helper('get_config')
+        except HelperUnavailable:
+            pass
+        try:
+            result = self._sudo(['cat', path])
+        except (subprocess.TimeoutExpired, OSError) as e:
+            print(f"Cannot read {path} through sudo: {e}")
+            return None
+        return result.stdout if result.returncode == 0 else None
+
+    def put_config(self, text, path=kerioconf.CONFIG_FILE):
+        """Replace the config; raises HelperError or OSError on failure"""
+        try:
+            return self._helper('put_config', text)
+        except HelperUnavailable:
+            pass
+        # The sudoers rules only allow this fixed temp path
+        temp_file = '/tmp/kerio-kvc.conf.tmp'
+        with open(temp_file, 'w') as f:
+            f.write(text)
+        try:
+            result = self._sudo(['mv', temp_file, path])
+        except subprocess.TimeoutExpired as e:
+            raise HelperError(f"sudo timed out: {e}")
+        if result.returncode != 0:
+            raise HelperError(result.stderr.strip() or f"mv exited with {result.returncode}")
+        self._sudo(['chmod', '600', path], timeout=5)
+
+    def close(self):
+        if self.helper is not None:
+            self.helper.close()
+
+
+def listen_fd_from_systemd():
+    """The socket passed by systemd socket activation, if any"""
+    if os.environ.get('LISTEN_PID') != str(os.getpid()):
+        return None
+    if os.environ.get('LISTEN_FDS') != '1':
+        return None
+    return 3  # SD_LISTEN_FDS_START
+
+
+def main(argv=None):
+    """`kerio-vpn-helper` entry point"""
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(prog='kerio-vpn-helper',
+                                     description='Privileged helper for the Kerio VPN indicator')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='unix socket to listen on')
+    parser.add_argument('--root', default='/', help='filesystem root holding etc/kerio-kvc.conf')
+    parser.add_argument('--systemctl', default='systemctl',
+                        help='systemctl command, e.g. "echo" for a dry run')
+    parser.add_argument('--allow-group', action='append', dest='groups',
+                        help=f"group whose members may connect (default: {', '.join(ALLOWED_GROUPS)})")
+    parser.add_argument('--allow-uid', action='append', type=int, default=[],
+                        help='additional user id that may connect')
+    args = parser.parse_args(argv)
+
+    import sys
+    sys.stdout.reconfigure(line_buffering=True)
+
+    service = HelperService(root=args.root, systemctl=args.systemctl.split())
+    server = HelperServer(service, socket_path=args.socket,
+                          allowed_groups=args.groups or ALLOWED_GROUPS,
+                          allowed_uids=args.allow_uid, listen_fd=listen_fd_from_systemd())
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,251 @@
+"""
+Session history
+Append-only JSON-lines log of VPN sessions under $XDG_STATE_HOME, rotated
+by size, plus the summaries behind `kerio-vpn-indicator history`
+"""
+
+import json
+import math
+import os
+import time
+from datetime import datetime, timedelta
+
+from kerio_vpn.settings import state_dir
+
+DROP_CAUSES = ('lost', 'degraded')
+CHECKPOINT_INTERVAL = 300  # Seconds between checkpoints of the open session
+
+
+class SessionLog:
+    """Buffered, size-rotated session log"""
+
+    def __init__(self, path=None, max_bytes=1024 * 1024, keep=5):
+        self.path = path or os.path.join(state_dir(), 'sessions.jsonl')
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.buffer = []
+        # The open session as it would be logged if the process died now
+        self.checkpoint_path = f"{self.path}.open"
+
+    def append(self, record):
+        """Queue a record; nothing touches the disk until flush()"""
+        self.buffer.append(json.dumps(record, separators=(',', ':')))
+
+    def flush(self):
+        """Write queued records in one append and rotate if the log grew too big"""
+        if not self.buffer:
+            return
+        data = ('\n'.join(self.buffer) + '\n').encode()
+        self.buffer = []
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'ab+') as f:
+                # A write cut short by a crash left no newline; don't glue onto it
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        data = b'\n' + data
+                f.write(data)
+                size = f.tell()
+            if size > self.max_bytes:
+                self.rotate()
+        except OSError as e:
+            print(f"Error writing session history: {e}")
+
+    def checkpoint(self, record):
+        """Replace the open-session checkpoint; a crash loses at most one interval"""
+        temporary = f"{self.checkpoint_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temporary, 'w') as f:
+                f.write(json.dumps(record, separators=(',', ':')))
+            os.replace(temporary, self.checkpoint_path)
+        except OSError as e:
+            print(f"Error writing session checkpoint: {e}")
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing session checkpoint: {e}")
+
+    def checkpointed(self):
+        """The checkpointed open session, closed at its last checkpoint; None without one"""
+        try:
+            with open(self.checkpoint_path, errors='replace') as f:
+                record = json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        return record if is_session(record) else None
+
+    def recover(self):
+        """Log the session a crashed process left open; returns it, or None"""
+        record = self.checkpointed()
+        if record is not None:
+            self.append(record)
+            self.flush()
+        self.clear_checkpoint()
+        return record
+
+    def rotate(self):
+        """sessions.jsonl -> .1 -> .2 ... dropping the oldest beyond `keep`"""
+        oldest = f"{self.path}.{self.keep}"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for index in range(self.keep - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def files(self):
+        """Log files from oldest to newest"""
+        rotated = [f"{self.path}.{index}" for index in range(self.keep, 0, -1)]
+        return [path for path in rotated + [self.path] if os.path.exists(path)]
+
+    def records(self):
+        """All records, oldest first; unreadable lines are skipped"""
+        records = []
+        for path in self.files():
+            # Junk bytes from a crash become U+FFFD and fail to parse like any bad line
+            with open(path, errors='replace') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if is_session(record):
+                        records.append(record)
+        return records
+
+
+def is_session(record):
+    """True for a record with the numeric times summarize() relies on"""
+    if not isinstance(record, dict):
+        return False
+    times = [record.get('connect'), record.get('disconnect')]
+    if record.get('reconnect_time') is not None:
+        times.append(record['reconnect_time'])
+    return all(isinstance(value, (int, float)) and not isinstance(value, bool)
+               for value in times)
+
+
+def uptime_percentage(records, start, end):
+    """Share of [start, end] covered by sessions, in percent"""
+    if end <= start:
+        return 0.0
+    covered = 0.0
+    for record in records:
+        session_start = max(record['connect'], start)
+        session_end = min(record['disconnect'], end)
+        if session_end > session_start:
+            covered += session_end - session_start
+    return 100.0 * covered / (end - start)
+
+
+def mean_time_between_drops(records):
+    """Connected time per unplanned disconnect in seconds, None without drops"""
+    drops = sum(1 for record in records if record.get('cause') in DROP_CAUSES)
+    if not drops:
+        return None
+    connected = sum(record['disconnect'] - record['connect'] for record in records)
+    return connected / drops
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values, None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def week_start(now):
+    """Monday 00:00 local time of the week containing `now`"""
+    today = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (today - timedelta(days=today.weekday())).timestamp()
+
+
+def summarize(records, now=None):
+    now = time.time() if now is None else now
+    reconnect_times = [record['reconnect_time'] for record in records
+                       if record.get('reconnect_time') is not None]
+    p95 = percentile(reconnect_times, 95)
+    return {
+        'sessions': len(records),
+        'drops': sum(1 for record in records if record.get('cause') in DROP_CAUSES),
+        'uptime_week_pct': uptime_percentage(records, week_start(now), now),
+        'mtbd_seconds': mean_time_between_drops(records),
+        'p95_reconnect_ms': p95 * 1000 if p95 is not None else None,
+    }
+
+
+def current_session(log, now, ask_instance=True):
+    """
+    The session not in the log yet: the running instance's, connected
+    until now (cause None), else the one a crashed instance left open,
+    closed at its last checkpoint. None without either
+    """
+    record = log.checkpointed()
+    state = None
+    if ask_instance:
+        from kerio_vpn.cli import running_instance
+
+        try:
+            state = running_instance('status')
+        except Exception:  # HelperError: it is there but did not answer, the checkpoint will do
+            state = None
+    if state is None:
+        return record
+    if not state.get('connected') or not state.get('connected_since'):
+        return None  # Running and not connected; it logged its last session itself
+    return dict(record or {}, connect=state['connected_since'], disconnect=now, cause=None)
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "n/a"
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    prefix = f"{days}d " if days else ""
+    return f"{prefix}{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def main(argv):
+    """`kerio-vpn-indicator history` entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='kerio-vpn-indicator history',
+                                     description='Summarize recorded VPN sessions')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    parser.add_argument('--file', help='session log to read (default: under $XDG_STATE_HOME)')
+    args = parser.parse_args(argv)
+
+    now = time.time()
+    log = SessionLog(args.file)
+    records = log.records()
+    # The running instance only owns the default log
+    current = current_session(log, now, ask_instance=args.file is None)
+    if current is not None:
+        records.append(current)
+    summary = summarize(records, now=now)
+    live = current is not None and current['cause'] is None
+    summary['connected_since'] = current['connect'] if live else None
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+
+    p95 = summary['p95_reconnect_ms']
+    print(f"Sessions recorded:        {summary['sessions']}")
+    if live:
+        print(f"Connected for:            {format_duration(now - current['connect'])}")
+    print(f"Drops:                    {summary['drops']}")
+    print(f"Uptime this week:         {summary['uptime_week_pct']:.2f}%")
+    print(f"Mean time between drops:  {format_duration(summary['mtbd_seconds'])}")
+    print(f"p95 reconnect time:       {f'{p95:.0f} ms' if p95 is not None else 'n/a'}")
+    return 0
@@ -0,0 +1,189 @@
+"""
+Journal follower
+Streams `journalctl -o json -f` for kerio-kvc.service through a
+non-blocking pipe into a bounded ring buffer, so memory stays flat no
+matter how long the viewer follows. Nothing here imports gi: the pipe
+is watched through a kerio_vpn.mainloop loop and the GTK window in
+kerio_vpn.logviewer only renders what this module collects
+"""
+
+import collections
+import json
+import os
+import re
+import subprocess
+import time
+
+from kerio_vpn.service import UNIT
+
+CAPACITY = 10000  # Entries kept in memory
+BACKLOG = 1000  # Entries journalctl replays before following
+READ_SIZE = 65536
+READS_PER_WAKEUP = 16  # Then yield to the loop; the watch fires again
+
+# syslog priorities as journald stores them
+PRIORITY_NAMES = ('emerg', 'alert', 'crit', 'err', 'warning', 'notice', 'info', 'debug')
+
+# Lines that mark the tunnel going away, from kvc itself or from systemd
+DISCONNECT_PATTERN = re.compile(
+    r'disconnect|connection (?:lost|closed|reset|timed out)|stopp(?:ed|ing)|deactivated'
+    r'|main process exited|failed with result', re.IGNORECASE)
+
+
+class JournalEntry:
+    """One journal record with the fields the viewer shows"""
+
+    __slots__ = ('seq', 'timestamp', 'priority', 'identifier', 'pid', 'message', 'folded')
+
+    def __init__(self, seq, timestamp, priority, identifier, pid, message):
+        self.seq = seq
+        self.timestamp = timestamp  # Unix time
+        self.priority = priority
+        self.identifier = identifier
+        self.pid = pid
+        self.message = message
+        self.folded = message.casefold()  # Filtering compares against this
+
+    @classmethod
+    def from_json(cls, seq, line):
+        """Parse one line of `journalctl -o json`; None for lines that are not records"""
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        try:
+            timestamp = int(record.get('__REALTIME_TIMESTAMP', 0)) / 1000000
+        except (TypeError, ValueError):
+            timestamp = 0.0
+        try:
+            priority = int(record.get('PRIORITY', 6))
+        except (TypeError, ValueError):
+            priority = 6
+        return cls(seq, timestamp, priority,
+                   _text(record.get('SYSLOG_IDENTIFIER')) or _text(record.get('_COMM')),
+                   _text(record.get('_PID')), _text(record.get('MESSAGE')))
+
+    @property
+    def priority_name(self):
+        return PRIORITY_NAMES[self.priority] if 0 <= self.priority < len(PRIORITY_NAMES) else ''
+
+    @property
+    def is_disconnect(self):
+        return DISCONNECT_PATTERN.search(self.message) is not None
+
+    def matches(self, folded_query):
+        """Whether the entry passes a filter already folded with str.casefold()"""
+        return not folded_query or folded_query in self.folded
+
+    def format_time(self):
+        return time.strftime('%b %d %H:%M:%S', time.localtime(self.timestamp))
+
+
+def _text(value):
+    """journald sends non-UTF-8 fields as arrays of byte values"""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return bytes(value).decode('utf-8', 'replace')
+    return str(value)
+
+
+class JournalBuffer:
+    """Ring buffer of the newest `capacity` entries"""
+
+    def __init__(self, capacity=CAPACITY):
+        self.entries = collections.deque(maxlen=capacity)
+        self.total = 0  # Entries ever added, also the next sequence number
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    @property
+    def capacity(self):
+        return self.entries.maxlen
+
+    def add(self, entry):
+        self.entries.append(entry)
+        self.total += 1
+
+    def filter(self, query):
+        folded = query.casefold()
+        return [entry for entry in self.entries if entry.matches(folded)]
+
+    def last_disconnect(self):
+        """Newest entry that looks like the tunnel going down, None if there is none"""
+        for entry in reversed(self.entries):
+            if entry.is_disconnect:
+                return entry
+        return None
+
+
+class JournalFollower:
+    """Runs journalctl and feeds parsed entries to on_entries(list) on the loop"""
+
+    def __init__(self, loop, on_entries, unit=UNIT, backlog=BACKLOG, capacity=CAPACITY,
+                 command=('journalctl',), on_exit=None):
+        """
+        command: journalctl and any leading arguments; tests point it at a
+        script replaying a recorded JSON stream.
+        on_exit(returncode) once journalctl exits or the pipe closes
+        """
+        self.loop = loop
+        self.on_entries = on_entries
+        self.on_exit = on_exit
+        self.buffer = JournalBuffer(capacity)
+        self.pending = b''
+        self.process = subprocess.Popen(
+            list(command) + ['-u', unit, '-o', 'json', '-f', '-n', str(backlog)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.fd = self.process.stdout.fileno()
+        os.set_blocking(self.fd, False)
+        self.source = loop.io_add_watch(self.fd, self.on_readable)
+
+    def on_readable(self, fd):
+        entries = []
+        eof = False
+        for _read in range(READS_PER_WAKEUP):
+            try:
+                chunk = os.read(fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            if not chunk:
+                eof = True
+                break
+            *lines, self.pending = (self.pending + chunk).split(b'\n')
+            for line in lines:
+                entry = JournalEntry.from_json(self.buffer.total, line)
+                if entry is not None:
+                    self.buffer.add(entry)
+                    entries.append(entry)
+        if len(entries) > self.buffer.capacity:
+            entries = entries[-self.buffer.capacity:]  # The rest already fell out of the ring
+        if entries:
+            self.on_entries(entries)
+        if eof:
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        """Stop journalctl; safe to call more than once"""
+        if self.source is not None:
+            self.loop.source_remove(self.source)
+            self.source = None
+        if self.process.poll() is None:
+            self.process.terminate()
+        try:
+            returncode = self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            returncode = self.process.wait()
+        if not self.process.stdout.closed:
+            self.process.stdout.close()
+            if self.on_exit:
+                self.on_exit(returncode)
@@ -0,0 +1,289 @@
+"""
+Kerio VPN client configuration
+Access to /etc/kerio-kvc.conf, the XML file kerio-kvc.service connects
+with. Parses are cached per path and keyed on the file's (inode, mtime,
+size), so every reader in the process shares one parse and an unchanged
+file is never read twice. KerioConfig edits a private copy of the file
+and writes it back without losing elements it does not know about
+"""
+
+import os
+import re
+
+CONFIG_FILE = '/etc/kerio-kvc.conf'
+
+# Kerio writes these characters as numeric character references
+ENTITY_CHARS = '!"#$%&\'<>@\\'
+_ENTITY_TABLE = str.maketrans({char: f'&#{ord(char)};' for char in ENTITY_CHARS})
+_ENTITY_SEARCH = re.compile('[' + re.escape(ENTITY_CHARS) + ']').search
+
+# Fields of a <connection> element, in the order the editor writes them
+FIELDS = ('server', 'port', 'username', 'password', 'fingerprint', 'active', 'description')
+
+_cache = {}  # path -> (file key, parsed root element or the parse error)
+
+
+def file_key(path):
+    """
+    (inode, mtime, size) of path, None if it does not exist. A rename
+    over the file changes the inode even within one mtime tick
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def load(path=CONFIG_FILE):
+    """
+    Root element of path, None if the file does not exist. The tree is
+    shared with every other caller: treat it as read-only
+    """
+    key = file_key(path)
+    if key is None:
+        _cache.pop(path, None)
+        return None
+    cached = _cache.get(path)
+    if cached is None or cached[0] != key:
+        # Imported here so `kerio-vpn-indicator status` only pays for XML when needed
+        import xml.etree.ElementTree as ET
+
+        try:
+            cached = (key, ET.parse(path).getroot())
+        except (OSError, ET.ParseError) as e:
+            cached = (key, e)  # Unreadable or broken: don't retry until it changes
+        _cache[path] = cached
+    if isinstance(cached[1], Exception):
+        raise cached[1].with_traceback(None)  # Raising it again would grow its traceback
+    return cached[1]
+
+
+def read_server(path=CONFIG_FILE):
+    """Return "server[:port]" of the persistent connection, None if not configured"""
+    root = load(path)
+    if root is None:
+        return None
+    connection = root.find('.//connection[@type="persistent"]')
+    if connection is None:
+        return None
+    server = connection.find('server')
+    port = connection.find('port')
+    if server is None or not server.text:
+        return None
+
+    address = decode(server.text)
+    if port is not None and port.text:
+        address += f":{port.text}"
+    return address
+
+
+def atomic_write(path, text, mode=0o600):
+    """
+    Replace path with text: write a temp file in the same directory,
+    fsync it, rename it over path and fsync the directory, so readers
+    see either the old or the new file and a crash leaves no torn config
+    """
+    import tempfile
+
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=directory)
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def encode(text):
+    """Escape text the way Kerio does, in one pass so nothing is encoded twice"""
+    if _ENTITY_SEARCH(text) is None:
+        return text  # Most text nodes: the scan is much cheaper than translate()
+    return text.translate(_ENTITY_TABLE)
+
+
+def decode(text):
+    """Undo encode(); also accepts references that were escaped once more"""
+    if not text or '&' not in text:
+        return text
+    import html
+
+    return html.unescape(text)
+
+
+def _escape_attribute(value):
+    return (value.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('"', '&quot;').replace('\n', '&#10;'))
+
+
+class KerioConfig:
+    """
+    An editable copy of a config file. Only fields that are set to a new
+    value are touched; other connections, unknown elements, attributes,
+    comments and whitespace are written back as they were read. Text is
+    re-encoded with encode(), the form Kerio and the editor write
+    """
+
+    TEMPLATE = ('<config>\n  <connections>\n    <connection type="persistent">\n'
+                '    </connection>\n  </connections>\n</config>\n')
+
+    def __init__(self, root, prolog='', epilogue='\n'):
+        self.root = root
+        self.prolog = prolog
+        self.epilogue = epilogue
+
+    @classmethod
+    def parse(cls, text):
+        """Raises xml.etree.ElementTree.ParseError on malformed text"""
+        import xml.etree.ElementTree as ET
+
+        parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True, insert_pis=True))
+        parser.feed(text)
+        root = parser.close()
+        # Keep what ElementTree drops around the root: declaration, leading comments
+        start = re.search(r'<(?![?!])', text)
+        prolog = text[:start.start()] if start else ''
+        return cls(root, prolog, text[len(text.rstrip()):])
+
+    @classmethod
+    def new(cls):
+        """An empty config with one persistent connection"""
+        return cls.parse(cls.TEMPLATE)
+
+    @classmethod
+    def read(cls, path=CONFIG_FILE):
+        """The config at path, None if it does not exist"""
+        try:
+            with open(path) as f:
+                return cls.parse(f.read())
+        except FileNotFoundError:
+            return None
+
+    def connections(self):
+        return self.root.findall('.//connection')
+
+    def connection(self, create=False):
+        """The persistent connection element, added if create and missing"""
+        connection = self.root.find('.//connection[@type="persistent"]')
+        if connection is None and create:
+            connections = self.root.find('connections')
+            if connections is None:
+                connections = _append(self.root, 'connections')
+            connection = _append(connections, 'connection')
+            connection.set('type', 'persistent')
+        return connection
+
+    def get(self, field):
+        """Decoded text of a persistent connection field, None if absent"""
+        connection = self.connection()
+        if connection is None:
+            return None
+        element = connection.find(field)
+        if element is None:
+            return None
+        return decode(element.text or '')
+
+    def set(self, field, value):
+        """
+        Set a persistent connection field, None removes it. Returns whether
+        anything changed; an equal value leaves the element untouched
+        """
+        if value is None:
+            connection = self.connection()
+            element = connection.find(field) if connection is not None else None
+            if element is None:
+                return False
+            _remove(connection, element)
+            return True
+        if self.get(field) == value:
+            return False
+        connection = self.connection(create=True)
+        element = connection.find(field)
+        if element is None:
+            element = _append(connection, field)
+        element.text = value
+        return True
+
+    def set_endpoint(self, host, port):
+        """Point the persistent connection at host:port in the form the file uses"""
+        if self.get('port') is not None:
+            changed = self.set('server', host)
+            return self.set('port', str(port)) or changed
+        return self.set('server', f"{host}:{port}")
+
+    def to_string(self):
+        out = [self.prolog]
+        _serialize(self.root, out, tail=False)
+        out.append(self.epilogue)
+        return ''.join(out)
+
+    def save(self, path=CONFIG_FILE, mode=0o600):
+        """Write atomically; needs write access to path's directory"""
+        atomic_write(path, self.to_string(), mode)
+
+
+def _append(parent, tag):
+    """Append a child indented like its siblings"""
+    import xml.etree.ElementTree as ET
+
+    element = ET.Element(tag)
+    children = list(parent)
+    if children:
+        last = children[-1]
+        element.tail = last.tail
+        last.tail = children[-2].tail if len(children) > 1 else parent.text
+    else:
+        closing = parent.text if parent.text and not parent.text.strip() else '\n'
+        element.tail = closing
+        parent.text = closing + '  '
+    parent.append(element)
+    return element
+
+
+def _remove(parent, element):
+    """Remove a child, keeping the indentation of the closing tag"""
+    children = list(parent)
+    index = children.index(element)
+    if index == len(children) - 1:
+        if index:
+            children[index - 1].tail = element.tail
+        else:
+            parent.text = element.tail
+    parent.remove(element)
+
+
+def _serialize(element, out, tail=True):
+    import xml.etree.ElementTree as ET
+
+    if element.tag is ET.Comment:
+        out.append(f'<!--{element.text}-->')
+    elif element.tag is ET.ProcessingInstruction:
+        out.append(f'<?{element.text}?>')
+    else:
+        out.append('<' + element.tag)
+        for name, value in element.items():
+            out.append(f' {name}="{_escape_attribute(value)}"')
+        if element.text is None and not len(element):
+            out.append('/>')
+        else:
+            out.append('>')
+            if element.text:
+                out.append(encode(element.text))
+            for child in element:
+                _serialize(child, out)
+            out.append(f'</{element.tag}>')
+    if tail and element.tail:
+        out.append(encode(element.tail))
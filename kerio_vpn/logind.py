@@ -0,0 +1,51 @@
+"""
+Suspend and resume over D-Bus
+Follows logind's PrepareForSleep signal, sent with true just before the
+host suspends or hibernates and with false right after it resumes, so
+the core can stop polling while asleep and reconnect on wake-up
+"""
+
+from gi.repository import Gio, GLib
+
+LOGIND_BUS_NAME = 'org.freedesktop.login1'
+LOGIND_PATH = '/org/freedesktop/login1'
+MANAGER_INTERFACE = 'org.freedesktop.login1.Manager'
+
+
+class SleepWatcher:
+    """Whether the host is about to sleep, from PrepareForSleep"""
+
+    def __init__(self, connection=None, on_change=None):
+        """
+        connection: a Gio.DBusConnection to listen on, defaults to the system
+        bus; tests pass a private bus with a stand-in logind.
+        on_change: called with the watcher when `sleeping` flips
+        """
+        self.on_change = on_change
+        self.sleeping = False
+        self.available = False
+        self.connection = None
+        self.subscription = None
+
+        try:
+            self.connection = connection or Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+            self.subscription = self.connection.signal_subscribe(
+                LOGIND_BUS_NAME, MANAGER_INTERFACE, 'PrepareForSleep', LOGIND_PATH,
+                None, Gio.DBusSignalFlags.NONE, self.on_prepare_for_sleep
+            )
+            self.available = True
+        except GLib.Error as e:
+            print(f"logind unavailable, suspend will go unnoticed: {e.message}")
+
+    def on_prepare_for_sleep(self, connection, sender, path, interface, signal, parameters):
+        (sleeping,) = parameters.unpack()
+        if sleeping == self.sleeping:
+            return
+        self.sleeping = sleeping
+        if self.on_change:
+            self.on_change(self)
+
+    def close(self):
+        if self.subscription is not None:
+            self.connection.signal_unsubscribe(self.subscription)
+            self.subscription = None
@@ -0,0 +1,142 @@
+"""
+Log viewer window
+Follows the kerio-kvc.service journal inside the indicator instead of
+opening a terminal. Rows live in a Gtk.ListStore capped at the ring
+buffer's size and the TreeView only renders visible rows, so memory
+stays flat however long the window stays open
+"""
+
+from gi.repository import Gtk, GLib, Pango
+
+from kerio_vpn.journal import CAPACITY, JournalFollower
+
+# Foreground colour per syslog priority; info and debug keep the theme colour
+PRIORITY_COLOURS = {0: '#c01c28', 1: '#c01c28', 2: '#c01c28', 3: '#c01c28',
+                    4: '#c64600', 5: '#1a5fb4'}
+
+COL_TIME, COL_PRIORITY, COL_MESSAGE, COL_COLOUR, COL_FOLDED, COL_DISCONNECT = range(6)
+
+
+class LogWindow(Gtk.Window):
+    def __init__(self, loop, capacity=CAPACITY, command=('journalctl',)):
+        super().__init__(title="Kerio VPN Logs")
+        self.set_default_size(800, 450)
+        self.capacity = capacity
+        self.query = ''
+        self.follow = True  # Keep the newest row in view until the user scrolls up
+
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        vbox.set_border_width(6)
+        self.add(vbox)
+
+        toolbar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        vbox.pack_start(toolbar, False, False, 0)
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text("Filter messages")
+        self.search_entry.connect('search-changed', self.on_search_changed)
+        toolbar.pack_start(self.search_entry, True, True, 0)
+        jump_button = Gtk.Button(label="Last Disconnect")
+        jump_button.connect('clicked', self.on_jump_to_disconnect)
+        toolbar.pack_start(jump_button, False, False, 0)
+
+        self.store = Gtk.ListStore(str, str, str, str, str, bool)
+        self.filtered = self.store.filter_new()
+        self.filtered.set_visible_func(self.row_visible)
+
+        self.view = Gtk.TreeView(model=self.filtered)
+        self.view.set_fixed_height_mode(True)  # Rows are measured once, not per row
+        for title, column_id, width in (("Time", COL_TIME, 130), ("Level", COL_PRIORITY, 70),
+                                        ("Message", COL_MESSAGE, 560)):
+            renderer = Gtk.CellRendererText()
+            if column_id == COL_MESSAGE:
+                renderer.set_property('ellipsize', Pango.EllipsizeMode.END)
+            column = Gtk.TreeViewColumn(title, renderer, text=column_id, foreground=COL_COLOUR)
+            column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+            column.set_fixed_width(width)
+            column.set_resizable(True)
+            self.view.append_column(column)
+
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.add(self.view)
+        self.adjustment = scrolled.get_vadjustment()
+        self.adjustment.connect('value-changed', self.on_scrolled)
+        vbox.pack_start(scrolled, True, True, 0)
+
+        self.status_label = Gtk.Label(label="Starting journalctl...", xalign=0)
+        vbox.pack_start(self.status_label, False, False, 0)
+
+        try:
+            self.follower = JournalFollower(loop, self.on_entries, capacity=capacity,
+                                            command=command, on_exit=self.on_journal_exit)
+        except OSError as e:
+            self.follower = None
+            self.status_label.set_text(f"Cannot run journalctl: {e}")
+        self.connect('destroy', self.on_destroy)
+
+    def row_visible(self, model, tree_iter, data):
+        return not self.query or self.query in model[tree_iter][COL_FOLDED]
+
+    def on_entries(self, entries):
+        """Append a batch from the follower, dropping rows that left the ring buffer"""
+        for entry in entries:
+            self.store.append([entry.format_time(), entry.priority_name, entry.message,
+                               PRIORITY_COLOURS.get(entry.priority), entry.folded,
+                               entry.is_disconnect])
+        excess = len(self.store) - self.capacity
+        while excess > 0:
+            self.store.remove(self.store.get_iter_first())
+            excess -= 1
+        self.update_status()
+        if self.follow:
+            GLib.idle_add(self.scroll_to_end)
+
+    def scroll_to_end(self):
+        rows = len(self.filtered)
+        if rows:
+            self.view.scroll_to_cell(Gtk.TreePath(rows - 1), None, False, 0, 0)
+        return False
+
+    def on_scrolled(self, adjustment):
+        bottom = adjustment.get_upper() - adjustment.get_page_size()
+        self.follow = adjustment.get_value() >= bottom - 1
+
+    def on_search_changed(self, entry):
+        self.query = entry.get_text().casefold()
+        self.filtered.refilter()
+        self.update_status()
+
+    def on_jump_to_disconnect(self, button):
+        """Select the newest row that looks like the tunnel going down"""
+        for index in range(len(self.store) - 1, -1, -1):
+            row = self.store[index]
+            if not row[COL_DISCONNECT]:
+                continue
+            if self.query and self.query not in row[COL_FOLDED]:
+                # Clear the filter so the row can be shown
+                self.search_entry.set_text('')
+                self.query = ''
+                self.filtered.refilter()
+            found, filter_iter = self.filtered.convert_child_iter_to_iter(row.iter)
+            if found:
+                path = self.filtered.get_path(filter_iter)
+                self.follow = False
+                self.view.scroll_to_cell(path, None, True, 0.5, 0)
+                self.view.get_selection().select_path(path)
+            return
+        self.status_label.set_text("No disconnect in the buffered log")
+
+    def update_status(self):
+        shown = len(self.filtered)
+        total = len(self.store)
+        text = f"{total} entries" if shown == total else f"{shown} of {total} entries"
+        self.status_label.set_text(text + (", following" if self.follower else ""))
+
+    def on_journal_exit(self, returncode):
+        self.follower = None
+        self.status_label.set_text(f"journalctl exited ({returncode}), {len(self.store)} entries")
+
+    def on_destroy(self, widget):
+        follower, self.follower = self.follower, None
+        if follower is not None:
+            follower.on_exit = None  # The labels are gone
+            follower.close()
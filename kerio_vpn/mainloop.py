@@ -0,0 +1,236 @@
+"""
+Main loops
+The core only needs timers, idle callbacks, fd watches and signal
+handlers. GLibLoop provides them on top of GLib for the tray;
+SelectorLoop is a small pure-Python loop so the headless daemon runs
+without importing gi at all
+"""
+
+import collections
+import heapq
+import os
+import selectors
+import signal
+import threading
+import time
+
+
+class GLibLoop:
+    """The loop interface on top of the default GLib main context"""
+
+    def __init__(self):
+        from gi.repository import GLib
+        self.GLib = GLib
+        self.loop = None
+        self.sources = None  # ids from timeout_add and io_add_watch while tracked
+
+    def timeout_add(self, ms, fn, *args):
+        """Call fn(*args) after ms milliseconds, again every ms while it returns True"""
+        return self.GLib.timeout_add(ms, fn, *args)
+
+    def source_remove(self, source_id):
+        return self.GLib.source_remove(source_id)
+
+    def idle_add(self, fn, *args):
+        """Call fn(*args) on the loop; safe from any thread"""
+        return self.GLib.idle_add(fn, *args)
+
+    def io_add_watch(self, fd, fn):
+        """Call fn(fd) whenever fd is readable, until it returns False"""
+        return self.GLib.io_add_watch(fd, self.GLib.PRIORITY_DEFAULT, self.GLib.IO_IN,
+                                      lambda source, condition: fn(fd))
+
+    def signal_add(self, signum, fn):
+        """Call fn() on the loop when signum arrives"""
+        return self.GLib.unix_signal_add(self.GLib.PRIORITY_DEFAULT, signum, fn)
+
+    def track_sources(self):
+        """
+        Remember the timer and watch ids handed out from now on, for
+        live_sources(). Untracked loops keep the plain methods
+        """
+        if self.sources is not None:
+            return
+        self.sources = set()
+        timeout_add, io_add_watch, source_remove = (
+            self.timeout_add, self.io_add_watch, self.source_remove)
+
+        def tracked_timeout_add(ms, fn, *args):
+            source_id = timeout_add(ms, fn, *args)
+            self.sources.add(source_id)
+            return source_id
+
+        def tracked_io_add_watch(fd, fn):
+            source_id = io_add_watch(fd, fn)
+            self.sources.add(source_id)
+            return source_id
+
+        def tracked_source_remove(source_id):
+            self.sources.discard(source_id)
+            return source_remove(source_id)
+
+        self.timeout_add = tracked_timeout_add
+        self.io_add_watch = tracked_io_add_watch
+        self.source_remove = tracked_source_remove
+
+    def live_sources(self):
+        """Tracked timers and watches still attached, None while untracked"""
+        if self.sources is None:
+            return None
+        context = self.GLib.MainContext.default()
+        for source_id in list(self.sources):
+            source = context.find_source_by_id(source_id)
+            if source is None or source.is_destroyed():
+                self.sources.discard(source_id)  # Its callback returned False
+        return len(self.sources)
+
+    def run(self):
+        self.loop = self.GLib.MainLoop()
+        self.loop.run()
+
+    def quit(self):
+        if self.loop is not None:
+            self.loop.quit()
+
+
+class SelectorLoop:
+    """Single-threaded timer/fd loop on selectors, for the headless daemon"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.selector = selectors.DefaultSelector()
+        self.timers = {}  # id -> [interval, fn, args]
+        self.timer_heap = []  # (due, id); entries of removed timers are skipped
+        self.watches = {}  # id -> (fd, fn)
+        self.idle = collections.deque()
+        self.signals = collections.deque()  # filled from signal handlers
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.running = False
+
+        # Self-pipe: idle_add from worker threads and signals wake select()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+    def _new_id(self):
+        with self.lock:
+            source_id = self.next_id
+            self.next_id += 1
+        return source_id
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Pipe full or closed: the loop is awake anyway
+
+    def timeout_add(self, ms, fn, *args):
+        source_id = self._new_id()
+        interval = ms / 1000
+        self.timers[source_id] = [interval, fn, args]
+        heapq.heappush(self.timer_heap, (self.clock() + interval, source_id))
+        return source_id
+
+    def source_remove(self, source_id):
+        if self.timers.pop(source_id, None) is not None:
+            return True
+        watch = self.watches.pop(source_id, None)
+        if watch is not None:
+            self.selector.unregister(watch[0])
+            return True
+        return False
+
+    def idle_add(self, fn, *args):
+        with self.lock:
+            self.idle.append((fn, args))
+        self._wake()
+        return 0
+
+    def io_add_watch(self, fd, fn):
+        source_id = self._new_id()
+        self.watches[source_id] = (fd, fn)
+        self.selector.register(fd, selectors.EVENT_READ, source_id)
+        return source_id
+
+    def signal_add(self, signum, fn):
+        def handler(signum, frame):
+            # Only touch lock-free structures here, the loop runs fn later
+            self.signals.append(fn)
+            self._wake()
+        signal.signal(signum, handler)
+
+    def live_sources(self):
+        """Timers, fd watches and queued idle callbacks"""
+        return len(self.timers) + len(self.watches) + len(self.idle)
+
+    def _timeout(self):
+        """Seconds select() may block: until the next timer, or 0 with work queued"""
+        if self.idle or self.signals:
+            return 0
+        while self.timer_heap and self.timer_heap[0][1] not in self.timers:
+            heapq.heappop(self.timer_heap)
+        if not self.timer_heap:
+            return None
+        return max(0.0, self.timer_heap[0][0] - self.clock())
+
+    def _run_timers(self):
+        now = self.clock()
+        while self.timer_heap and self.timer_heap[0][0] <= now:
+            _due, source_id = heapq.heappop(self.timer_heap)
+            timer = self.timers.get(source_id)
+            if timer is None:
+                continue
+            interval, fn, args = timer
+            if self._dispatch(fn, args) and source_id in self.timers:
+                heapq.heappush(self.timer_heap, (self.clock() + interval, source_id))
+            else:
+                self.timers.pop(source_id, None)
+
+    def _run_idle(self):
+        with self.lock:
+            batch = list(self.idle)
+            self.idle.clear()
+        for fn, args in batch:
+            if self._dispatch(fn, args):
+                self.idle_add(fn, *args)
+        while self.signals:
+            self._dispatch(self.signals.popleft(), ())
+
+    def _dispatch(self, fn, args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f"Error in main loop callback {getattr(fn, '__name__', fn)}: {e}")
+            return False
+
+    def iterate(self):
+        """Wait for and run one batch of due work"""
+        for key, _events in self.selector.select(self._timeout()):
+            if key.data is None:
+                try:
+                    while os.read(self._wake_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                continue
+            watch = self.watches.get(key.data)
+            if watch is not None and not self._dispatch(watch[1], (watch[0],)):
+                self.source_remove(key.data)
+        self._run_idle()
+        self._run_timers()
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.iterate()
+
+    def quit(self):
+        self.running = False
+        self._wake()
+
+    def close(self):
+        self.selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
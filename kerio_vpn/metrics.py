@@ -0,0 +1,162 @@
+"""
+OpenMetrics exporter
+Serves the indicator's cached state on a localhost port or unix socket
+from a background thread. Scrapes only render the last published
+snapshot; they never run systemctl, ip or anything else
+"""
+
+import bisect
+import math
+import os
+import threading
+import time
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Poll durations span sub-millisecond (events) to seconds (subprocess fallbacks)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram with cumulative counts like OpenMetrics expects"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """Immutable copy safe to hand to another thread"""
+        cumulative = []
+        running = 0
+        for count in self.counts:
+            running += count
+            cumulative.append(running)
+        return {'buckets': self.buckets, 'cumulative': tuple(cumulative),
+                'count': self.count, 'sum': self.sum}
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def render(metrics):
+    """
+    Render a list of (name, type, help, value) tuples as OpenMetrics text.
+    value is a number or a histogram snapshot; None skips the metric
+    """
+    lines = []
+    for name, metric_type, help_text, value in metrics:
+        if value is None:
+            continue
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"# HELP {name} {_escape_help(help_text)}")
+        suffix = '_total' if metric_type == 'counter' else ''
+        if metric_type == 'histogram':
+            for bound, count in zip(value['buckets'], value['cumulative']):
+                lines.append(f'{name}_bucket{{le="{_format_value(float(bound))}"}} {count}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {value["cumulative"][-1]}')
+            lines.append(f"{name}_count {value['count']}")
+            lines.append(f"{name}_sum {_format_value(float(value['sum']))}")
+        else:
+            lines.append(f"{name}{suffix} {_format_value(value)}")
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Background HTTP endpoint serving the last published snapshot"""
+
+    def __init__(self, listen):
+        """listen: 'host:port' or 'unix:/path/to/socket'"""
+        self.listen = listen
+        self.snapshot = {}
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        # http.server is only worth importing when the endpoint is enabled
+        from kerio_vpn.metrics_http import Handler, TCPServer, UnixServer
+
+        if self.listen.startswith('unix:'):
+            path = self.listen[len('unix:'):]
+            if os.path.exists(path):
+                os.unlink(path)
+            self.server = UnixServer(path, Handler)
+            os.chmod(path, 0o600)
+        else:
+            host, _, port = self.listen.rpartition(':')
+            self.server = TCPServer((host or '127.0.0.1', int(port)), Handler)
+        self.server.exporter = self
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='kerio-metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            if self.listen.startswith('unix:'):
+                try:
+                    os.unlink(self.listen[len('unix:'):])
+                except OSError:
+                    pass
+            self.server = None
+
+    def publish(self, snapshot):
+        """Main loop: replace the cached snapshot (a plain dict swap)"""
+        self.snapshot = snapshot
+
+    def render(self):
+        """Server thread: build the exposition from the cached snapshot"""
+        snapshot = self.snapshot
+        now = time.time()
+        start = snapshot.get('connection_start_time')
+        return render([
+            ('kerio_vpn_connected', 'gauge', 'VPN tunnel is connected',
+             snapshot.get('connected', False)),
+            ('kerio_vpn_degraded', 'gauge', 'Tunnel is up but failing health probes',
+             snapshot.get('degraded', False)),
+            ('kerio_vpn_service_active', 'gauge', 'kerio-kvc.service is active',
+             snapshot.get('service_active', False)),
+            ('kerio_vpn_uptime_seconds', 'gauge', 'Seconds since the current connection was established',
+             now - start if start else 0.0),
+            ('kerio_vpn_outages', 'counter', 'Outages seen by auto-reconnect',
+             snapshot.get('outages', 0)),
+            ('kerio_vpn_reconnect_attempts', 'counter', 'Auto-reconnect attempts made',
+             snapshot.get('reconnect_attempts', 0)),
+            ('kerio_vpn_last_reconnect_seconds', 'gauge', 'Time to reconnect after the last outage',
+             snapshot.get('last_reconnect_time')),
+            ('kerio_vpn_rx_bytes', 'counter', 'Bytes received over kvnet while connected',
+             snapshot.get('rx_bytes', 0)),
+            ('kerio_vpn_tx_bytes', 'counter', 'Bytes sent over kvnet while connected',
+             snapshot.get('tx_bytes', 0)),
+            ('kerio_vpn_health_rtt_seconds', 'gauge', 'EWMA round-trip time of health probes',
+             snapshot.get('health_rtt')),
+            ('kerio_vpn_health_loss_ratio', 'gauge', 'EWMA loss rate of health probes',
+             snapshot.get('health_loss')),
+            ('kerio_vpn_poll_duration_seconds', 'histogram', 'Duration of status checks',
+             snapshot.get('poll_duration')),
+            ('kerio_vpn_status_checks', 'counter', 'Status checks performed',
+             snapshot.get('status_checks', 0)),
+            ('kerio_vpn_subprocess_spawns', 'counter', 'Child processes started by the indicator',
+             snapshot.get('subprocess_spawns', 0)),
+        ])
@@ -0,0 +1,309 @@
+"""
+rtnetlink interface monitor
+Tracks link state and IPv4 addresses of a single interface (kvnet) from
+kernel RTMGRP_LINK / RTMGRP_IPV4_IFADDR events instead of polling `ip addr`
+"""
+
+import errno
+import os
+import socket
+import struct
+import subprocess
+
+INTERFACE = 'kvnet'
+
+# Multicast groups
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+# Message types
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+# Flags
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+# Attributes
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+# Operational states reported by `ip` as "state UNKNOWN" / "state UP"
+IF_OPER_UNKNOWN = 0
+IF_OPER_UP = 6
+
+NLMSGHDR = struct.Struct('=IHHII')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTATTR = struct.Struct('=HH')
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _parse_attrs(data, offset):
+    """Parse rtattr list into {type: payload}"""
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _iter_messages(data):
+    """Yield (type, seq, payload) for each netlink message in a datagram"""
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, _flags, seq, _pid = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        yield msg_type, seq, data[offset + NLMSGHDR.size:offset + length]
+        offset += _align(length)
+
+
+class InterfaceMonitor:
+    """Event-driven view of one network interface's link and IPv4 state"""
+
+    def __init__(self, ifname=INTERFACE):
+        self.ifname = ifname
+        self.ifindex = None
+        self.exists = False
+        self.up = False
+        self.addresses = []
+        self._seq = 0
+
+        # Subscribe before the initial dump so no event can slip in between
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 256 * 1024)
+        self.sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+        self.sock.setblocking(False)
+        self.resync()
+
+    @property
+    def vpn_ip(self):
+        """First IPv4 address while the link is up, as ip_addr_status reports it"""
+        return self.addresses[0] if self.up and self.addresses else None
+
+    @property
+    def state(self):
+        """Interface state in the wording used by the status output"""
+        if not self.exists:
+            return "not found"
+        return "up" if self.up else "exists but down"
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def resync(self):
+        """Rebuild state from a full link and address dump"""
+        self.ifindex = None
+        self.exists = False
+        self.up = False
+        self.addresses = []
+
+        # Dumps go over a separate blocking socket so they never interleave
+        # with multicast events on the subscribed one
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as dump_sock:
+            dump_sock.settimeout(2)
+            dump_sock.bind((0, 0))
+            self._dump(dump_sock, RTM_GETLINK, IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+            self._dump(dump_sock, RTM_GETADDR, IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0))
+
+    def _dump(self, sock, msg_type, body):
+        self._seq += 1
+        seq = self._seq
+        header = NLMSGHDR.pack(NLMSGHDR.size + len(body), msg_type,
+                               NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+        sock.send(header + body)
+
+        while True:
+            data = sock.recv(65536)
+            for reply_type, reply_seq, payload in _iter_messages(data):
+                if reply_seq != seq:
+                    continue
+                if reply_type == NLMSG_DONE:
+                    return
+                if reply_type == NLMSG_ERROR:
+                    (error,) = struct.unpack_from('=i', payload)
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return
+                self._handle(reply_type, payload)
+
+    def read(self):
+        """Drain pending events; returns True if the interface state changed"""
+        before = (self.exists, self.up, tuple(self.addresses))
+        ifindex = self.ifindex
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # Kernel dropped events on overrun, the dump is authoritative
+                self.resync()
+                continue
+            for msg_type, _seq, payload in _iter_messages(data):
+                self._handle(msg_type, payload)
+        if self.ifindex is not None and self.ifindex != ifindex:
+            # Another link took the name (a rename): its addresses were
+            # announced under a name we were not following
+            self.resync()
+        return before != (self.exists, self.up, tuple(self.addresses))
+
+    def _handle(self, msg_type, payload):
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+            self._handle_link(msg_type, payload)
+        elif msg_type in (RTM_NEWADDR, RTM_DELADDR):
+            self._handle_addr(msg_type, payload)
+
+    def _handle_link(self, msg_type, payload):
+        if len(payload) < IFINFOMSG.size:
+            return
+        _family, _type, index, _flags, _change = IFINFOMSG.unpack_from(payload)
+        attrs = _parse_attrs(payload, IFINFOMSG.size)
+        name = attrs.get(IFLA_IFNAME, b'').split(b'\0', 1)[0].decode(errors='replace')
+        if name != self.ifname and index != self.ifindex:
+            return
+
+        # Renamed away from ifname: gone for us, as if deleted
+        renamed = index == self.ifindex and name and name != self.ifname
+        if msg_type == RTM_DELLINK or renamed:
+            if index != self.ifindex:
+                return  # Another link of that name went away, not ours
+            self.ifindex = None
+            self.exists = False
+            self.up = False
+            self.addresses = []
+            return
+
+        if index != self.ifindex:
+            self.addresses = []  # Those belonged to the link that had the name before
+        self.ifindex = index
+        self.exists = True
+        operstate = attrs.get(IFLA_OPERSTATE)
+        self.up = bool(operstate) and operstate[0] in (IF_OPER_UNKNOWN, IF_OPER_UP)
+
+    def _handle_addr(self, msg_type, payload):
+        if len(payload) < IFADDRMSG.size:
+            return
+        family, _prefixlen, _flags, _scope, index = IFADDRMSG.unpack_from(payload)
+        if family != socket.AF_INET or index != self.ifindex:
+            return
+        attrs = _parse_attrs(payload, IFADDRMSG.size)
+        # On point-to-point links IFA_ADDRESS is the peer, IFA_LOCAL is ours
+        raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+        if not raw or len(raw) != 4:
+            return
+        address = socket.inet_ntoa(raw)
+
+        if msg_type == RTM_NEWADDR:
+            if address not in self.addresses:
+                self.addresses.append(address)
+        elif address in self.addresses:
+            self.addresses.remove(address)
+
+
+class LinkWatcher:
+    """Interface backend for the core: rtnetlink events, `ip addr` polling without them"""
+
+    def __init__(self, loop, ifname=INTERFACE, on_change=None):
+        """
+        loop: the main loop the netlink socket is watched on.
+        on_change: called with the watcher when the interface changed, and
+        once more when netlink fails and the watcher falls back to polling
+        """
+        self.loop = loop
+        self.ifname = ifname
+        self.on_change = on_change
+        self.spawned = 0  # `ip addr` runs, for metrics
+        self.monitor = None
+        self.source = None
+        try:
+            self.monitor = InterfaceMonitor(ifname)
+            self.source = loop.io_add_watch(self.monitor.fileno(), self.on_event)
+        except OSError as e:
+            print(f"Netlink unavailable, polling interface instead: {e}")
+            self.monitor = None
+
+    @property
+    def available(self):
+        """True while changes arrive as events, so the scheduler can relax"""
+        return self.monitor is not None
+
+    def status(self):
+        """Return (is_up, state description, IPv4 address)"""
+        if self.monitor is not None:
+            return self.monitor.up, self.monitor.state, self.monitor.vpn_ip
+        self.spawned += 1
+        return ip_addr_status(self.ifname)
+
+    def on_event(self, fd):
+        try:
+            changed = self.monitor.read()
+        except OSError as e:
+            print(f"Netlink error, falling back to polling: {e}")
+            self.monitor.close()
+            self.monitor = None
+            self.source = None
+            changed = True
+        if changed and self.on_change:
+            self.on_change(self)
+        return self.monitor is not None  # Remove the watch after a failure
+
+    def close(self):
+        if self.monitor is not None:
+            self.loop.source_remove(self.source)
+            self.monitor.close()
+            self.monitor = None
+            self.source = None
+
+
+def ip_addr_status(ifname):
+    """(is_up, state description, IPv4 address) from `ip addr show`"""
+    interface_up = False
+    interface_state = "down"
+    vpn_ip = None
+    try:
+        result = subprocess.run(
+            ['ip', 'addr', 'show', ifname],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        if result.returncode == 0:
+            # Check if interface is UP
+            if 'state UP' in result.stdout or 'state UNKNOWN' in result.stdout:
+                interface_up = True
+                interface_state = "up"
+                # Extract IP address
+                for line in result.stdout.split('\n'):
+                    if 'inet ' in line:
+                        vpn_ip = line.strip().split()[1].split('/')[0]
+                        break
+            else:
+                interface_state = "exists but down"
+        else:
+            interface_state = "not found"
+    except Exception as e:
+        print(f"Error checking interface: {e}")
+        interface_state = "error"
+
+    return interface_up, interface_state, vpn_ip
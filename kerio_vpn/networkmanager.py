@@ -0,0 +1,81 @@
+"""
+Uplink state over D-Bus
+Keeps a cached copy of NetworkManager's State, Connectivity and
+PrimaryConnection, updated from PropertiesChanged signals. The primary
+connection is the one holding the default route, so a change there means
+the tunnel's packets now leave through a different uplink
+"""
+
+from gi.repository import Gio, GLib
+
+NM_BUS_NAME = 'org.freedesktop.NetworkManager'
+NM_PATH = '/org/freedesktop/NetworkManager'
+NM_INTERFACE = 'org.freedesktop.NetworkManager'
+WATCHED_PROPERTIES = ('State', 'Connectivity', 'PrimaryConnection')
+
+# NMState: from CONNECTED_SITE on there is a default route
+NM_STATE_CONNECTED_SITE = 60
+# NMConnectivity: behind a captive portal the gateway is not reachable yet
+NM_CONNECTIVITY_PORTAL = 2
+
+
+class ConnectivityWatcher:
+    """Cached NetworkManager uplink state; without NetworkManager the uplink counts as up"""
+
+    def __init__(self, connection=None, on_change=None):
+        """
+        connection: a Gio.DBusConnection to talk to, defaults to the system
+        bus; tests pass a private bus with a stand-in NetworkManager.
+        on_change: called with the watcher whenever a watched property changes
+        """
+        self.on_change = on_change
+        self.properties = {}
+        self.available = False
+        self.proxy = None
+        self.handler = None
+
+        try:
+            connection = connection or Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+            self.proxy = Gio.DBusProxy.new_sync(
+                connection, Gio.DBusProxyFlags.DO_NOT_AUTO_START, None,
+                NM_BUS_NAME, NM_PATH, NM_INTERFACE, None
+            )
+            for name in WATCHED_PROPERTIES:
+                value = self.proxy.get_cached_property(name)
+                if value is not None:
+                    self.properties[name] = value.unpack()
+            self.handler = self.proxy.connect('g-properties-changed', self.on_properties_changed)
+            self.available = 'State' in self.properties
+            if not self.available:
+                print("NetworkManager is not running, assuming the uplink is up")
+        except GLib.Error as e:
+            print(f"NetworkManager unavailable, assuming the uplink is up: {e.message}")
+
+    @property
+    def online(self):
+        """Default route present and not held at a captive portal"""
+        if not self.available:
+            return True
+        return (self.properties.get('State', 0) >= NM_STATE_CONNECTED_SITE
+                and self.properties.get('Connectivity') != NM_CONNECTIVITY_PORTAL)
+
+    @property
+    def primary_connection(self):
+        return self.properties.get('PrimaryConnection')
+
+    def on_properties_changed(self, proxy, changed, invalidated):
+        changed = changed.unpack()
+        updated = False
+        for name in WATCHED_PROPERTIES:
+            if name in changed and self.properties.get(name) != changed[name]:
+                self.properties[name] = changed[name]
+                updated = True
+        if 'State' in self.properties:
+            self.available = True  # NetworkManager started after us
+        if updated and self.on_change:
+            self.on_change(self)
+
+    def close(self):
+        if self.handler is not None:
+            self.proxy.disconnect(self.handler)
+            self.handler = None
@@ -0,0 +1,112 @@
+"""
+Desktop notifications over D-Bus
+Talks to org.freedesktop.Notifications directly, keeps one bubble per
+event category (later notifications replace it) and folds bursts within
+a short window into a single update
+"""
+
+import time
+
+from gi.repository import Gio, GLib
+
+NOTIFICATIONS_BUS_NAME = 'org.freedesktop.Notifications'
+NOTIFICATIONS_PATH = '/org/freedesktop/Notifications'
+NOTIFICATIONS_INTERFACE = 'org.freedesktop.Notifications'
+
+
+class Notifier:
+    """Per-category, coalescing desktop notifications"""
+
+    def __init__(self, app_name='Kerio VPN', icon='network-vpn', coalesce_window=3.0,
+                 connection=None, fallback=None):
+        """
+        connection: Gio.DBusConnection of the session bus; tests pass a
+        private bus with a fake notification daemon.
+        fallback: fallback(title, message) used when no daemon is reachable
+        """
+        self.app_name = app_name
+        self.icon = icon
+        self.coalesce_window = coalesce_window
+        self.fallback = fallback
+        self.notification_ids = {}  # category -> id of the bubble to replace
+        self.last_shown = {}  # category -> monotonic time of the last bubble
+        self.pending = {}  # category -> (title, message) waiting for the window
+        self.flush_sources = {}  # category -> GLib source id
+
+        try:
+            self.connection = connection or Gio.bus_get_sync(Gio.BusType.SESSION, None)
+            self.connection.signal_subscribe(
+                NOTIFICATIONS_BUS_NAME, NOTIFICATIONS_INTERFACE, 'NotificationClosed',
+                NOTIFICATIONS_PATH, None, Gio.DBusSignalFlags.NONE,
+                self.on_notification_closed
+            )
+        except GLib.Error as e:
+            print(f"Session bus unavailable for notifications: {e.message}")
+            self.connection = None
+
+    def notify(self, category, title, message):
+        """Show or update the bubble for category, coalescing bursts"""
+        now = time.monotonic()
+        last = self.last_shown.get(category)
+        if last is not None and now - last < self.coalesce_window:
+            # Inside the window: keep only the newest text and show it when the window closes
+            self.pending[category] = (title, message)
+            if category not in self.flush_sources:
+                delay_ms = int((self.coalesce_window - (now - last)) * 1000)
+                self.flush_sources[category] = GLib.timeout_add(
+                    max(delay_ms, 1), self.flush, category
+                )
+            return
+
+        self.send(category, title, message)
+
+    def flush(self, category):
+        """Show the newest notification held back for category"""
+        self.flush_sources.pop(category, None)
+        pending = self.pending.pop(category, None)
+        if pending:
+            self.send(category, *pending)
+        return False  # One-shot timeout
+
+    def send(self, category, title, message):
+        self.last_shown[category] = time.monotonic()
+        if self.connection is None:
+            self.send_fallback(title, message)
+            return
+
+        replaces_id = self.notification_ids.get(category, 0)
+        self.connection.call(
+            NOTIFICATIONS_BUS_NAME, NOTIFICATIONS_PATH, NOTIFICATIONS_INTERFACE, 'Notify',
+            GLib.Variant('(susssasa{sv}i)', (
+                self.app_name, replaces_id, self.icon, title, message, [], {}, -1
+            )),
+            GLib.VariantType.new('(u)'), Gio.DBusCallFlags.NONE, -1, None,
+            self.on_notify_done, (category, title, message)
+        )
+
+    def on_notify_done(self, connection, res, data):
+        category, title, message = data
+        try:
+            (notification_id,) = connection.call_finish(res).unpack()
+            self.notification_ids[category] = notification_id
+        except GLib.Error as e:
+            print(f"Notification daemon error: {e.message}")
+            self.send_fallback(title, message)
+
+    def send_fallback(self, title, message):
+        if self.fallback:
+            self.fallback(title, message)
+
+    def on_notification_closed(self, connection, sender, path, interface, signal, params):
+        """Forget bubbles the user or the daemon closed"""
+        notification_id, _reason = params.unpack()
+        for category, known_id in list(self.notification_ids.items()):
+            if known_id == notification_id:
+                del self.notification_ids[category]
+
+    def close(self):
+        """Drop pending notifications and their timers"""
+        for source_id in self.flush_sources.values():
+            GLib.source_remove(source_id)
+        self.flush_sources.clear()
+        self.pending.clear()
@@ -0,0 +1,179 @@
+"""
+Reconnect policy
+Exponential backoff with full jitter, an optional attempt limit, a
+circuit-breaker cool-down for unlimited mode, and time-to-reconnect
+accounting per outage. Pure and clock-injectable so thousands of outages
+can be simulated without a main loop
+"""
+
+import collections
+import random
+import time
+
+
+class ReconnectPolicy:
+    """Decides if and when the next auto-reconnect attempt happens"""
+
+    def __init__(self, base_delay=3.0, max_delay=300.0, max_attempts=3,
+                 breaker_threshold=10, cooldown=600.0, attempt_timeout=30.0,
+                 damped_delay=60.0, clock=time.monotonic, rng=random.random,
+                 history_size=1000):
+        """
+        max_attempts: attempts per outage, 0 for unlimited. In unlimited mode
+        every breaker_threshold consecutive failures open the circuit breaker
+        and the next attempt waits `cooldown` seconds instead of the backoff.
+        attempt_timeout: how long an attempt may run before it counts as failed.
+        damped_delay: added to every wait while `damped` (the link is flapping)
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.breaker_threshold = breaker_threshold
+        self.cooldown = cooldown
+        self.attempt_timeout = attempt_timeout
+        self.damped_delay = damped_delay
+        self.clock = clock
+        self.rng = rng
+
+        self.enabled = True
+        self.online = True  # Uplink usable; attempts wait for it instead of failing
+        self.damped = False  # Flapping: give the tunnel a chance to settle first
+        self.manual_disconnect = False
+        self.attempts = 0
+        self.outage_start = None
+        self.last_attempt = None
+        self.given_up = False
+        self.outages = 0
+        self.total_attempts = 0
+        self.gave_up = 0
+        self.reconnect_times = collections.deque(maxlen=history_size)
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        section = settings['reconnect']
+        return cls(
+            base_delay=section.getfloat('base_delay'),
+            max_delay=section.getfloat('max_delay'),
+            max_attempts=section.getint('max_attempts'),
+            breaker_threshold=section.getint('breaker_threshold'),
+            cooldown=section.getfloat('cooldown'),
+            attempt_timeout=section.getfloat('attempt_timeout'),
+            **kwargs
+        )
+
+    @property
+    def in_outage(self):
+        return self.outage_start is not None
+
+    @property
+    def exhausted(self):
+        return bool(self.max_attempts) and self.attempts >= self.max_attempts
+
+    def on_manual_disconnect(self):
+        """User stopped the VPN: no outage, no reconnects"""
+        self.manual_disconnect = True
+        self.outage_start = None
+        self.attempts = 0
+        self.last_attempt = None
+
+    def on_manual_connect(self):
+        self.manual_disconnect = False
+
+    def on_connection_lost(self):
+        """Tunnel dropped or degraded; starts an outage unless one is running"""
+        if self.manual_disconnect or self.in_outage:
+            return
+        self.outage_start = self.clock()
+        self.outages += 1
+        self.given_up = False
+        self.attempts = 0
+        self.last_attempt = None
+
+    def on_connected(self):
+        """Tunnel is healthy again; returns the outage's time-to-reconnect or None"""
+        self.manual_disconnect = False
+        self.attempts = 0
+        self.last_attempt = None
+        if not self.in_outage:
+            return None
+        elapsed = self.clock() - self.outage_start
+        self.outage_start = None
+        self.reconnect_times.append(elapsed)
+        return elapsed
+
+    def attempt_settled(self, service_active):
+        """True once the last attempt is over: the service gave up or it timed out"""
+        if self.last_attempt is None:
+            return True
+        if not service_active:
+            return True
+        return self.clock() - self.last_attempt >= self.attempt_timeout
+
+    def next_delay(self, immediate=False):
+        """
+        Count a new attempt and return the seconds to wait before it,
+        or None when no attempt should be made. Without an uplink nothing
+        is counted: the attempt could only fail. immediate skips the
+        backoff (the uplink just came back), not the breaker cool-down
+        or the damping
+        """
+        if not self.enabled or self.manual_disconnect or not self.in_outage or not self.online:
+            return None
+        if self.exhausted:
+            if not self.given_up:
+                self.given_up = True
+                self.gave_up += 1
+            return None
+
+        self.attempts += 1
+        self.total_attempts += 1
+        if (not self.max_attempts and self.breaker_threshold
+                and self.attempts % self.breaker_threshold == 0):
+            # Circuit breaker open: stay away from the gateway for a while
+            return self.cooldown
+
+        if immediate:
+            delay = 0.0
+        else:
+            # Full jitter: uniform between 0 and the exponential cap
+            # (the exponent is bounded so unlimited mode cannot overflow a float)
+            cap = min(self.max_delay, self.base_delay * (2 ** min(self.attempts - 1, 32)))
+            delay = self.rng() * cap
+        if self.damped:
+            delay += self.damped_delay
+        return delay
+
+    def on_attempt(self):
+        """The scheduled attempt is being made now"""
+        self.last_attempt = self.clock()
+
+    def uncount_attempt(self):
+        """A scheduled attempt was cancelled before it ran, e.g. the uplink went away"""
+        if self.attempts:
+            self.attempts -= 1
+            self.total_attempts -= 1
+
+    def reset(self):
+        """Forget the current outage's attempts (auto-reconnect re-enabled)"""
+        self.attempts = 0
+        self.last_attempt = None
+        self.given_up = False
+
+    def describe_attempt(self):
+        if self.max_attempts:
+            return f"attempt {self.attempts}/{self.max_attempts}"
+        return f"attempt {self.attempts}"
+
+    def stats(self):
+        times = self.reconnect_times
+        return {
+            'outages': self.outages,
+            'attempts': self.attempts,
+            'total_attempts': self.total_attempts,
+            'gave_up': self.gave_up,
+            'in_outage': self.in_outage,
+            'online': self.online,
+            'damped': self.damped,
+            'last_reconnect_time': times[-1] if times else None,
+            'mean_reconnect_time': sum(times) / len(times) if times else None,
+        }
@@ -0,0 +1,127 @@
+"""
+Adaptive status scheduler
+Keeps exactly one pending status check and picks its interval from the
+current situation: fast polling while connecting or reconnecting,
+exponential relaxation while nothing changes, and immediate re-checks
+on user actions or external events
+"""
+
+import collections
+import time
+
+
+class StatusScheduler:
+    """Single coalesced timer driving the status check"""
+
+    def __init__(self, callback, timeout_add, source_remove, clock=time.monotonic,
+                 fast_interval=0.5, base_interval=2.0, max_interval=30.0, backoff=2.0):
+        """
+        callback: the status check; returns True when the state changed.
+        timeout_add(ms, fn) / source_remove(id): the main loop's timer API,
+        e.g. GLib.timeout_add and GLib.source_remove; fn returns False
+        """
+        self.callback = callback
+        self.timeout_add = timeout_add
+        self.source_remove = source_remove
+        self.clock = clock
+        self.fast_interval = fast_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        # With netlink and D-Bus feeding events the poll is only a safety net
+        self.events_available = False
+        self.paused = False  # While the host sleeps
+        self.interval = base_interval
+        self.fast_until = 0.0
+        self.source = None
+        self.due = None
+        self.ticks = 0
+        self.tick_times = collections.deque(maxlen=512)
+
+    def start(self):
+        self._schedule(self.interval)
+
+    def stop(self):
+        if self.source is not None:
+            self.source_remove(self.source)
+        self.source = None
+        self.due = None
+
+    def pause(self):
+        """No checks at all until resume(), not even triggered ones"""
+        self.paused = True
+        self.stop()
+
+    def resume(self):
+        self.paused = False
+        self.trigger()
+
+    def trigger(self):
+        """Re-check as soon as possible; bursts collapse into one check"""
+        self._schedule(0)
+
+    def check_in(self, seconds):
+        """Make sure a check runs within `seconds`, e.g. when a debounce window ends"""
+        self._schedule(seconds)
+
+    def fast_window(self, seconds):
+        """Poll at the fast interval for the next `seconds` (connect, reconnect, test)"""
+        self.fast_until = max(self.fast_until, self.clock() + seconds)
+        self.interval = self.fast_interval
+        self._schedule(self.fast_interval)
+
+    def _schedule(self, delay):
+        """Arm the timer unless one is already due no later than `delay` from now"""
+        if self.paused:
+            return
+        due = self.clock() + delay
+        if self.source is not None:
+            if self.due is not None and self.due <= due:
+                return
+            self.source_remove(self.source)
+        self.due = due
+        self.source = self.timeout_add(int(delay * 1000), self._on_timer)
+
+    def _on_timer(self):
+        self.source = None
+        self.due = None
+        now = self.clock()
+        self.ticks += 1
+        self.tick_times.append(now)
+
+        try:
+            changed = self.callback()
+        except Exception as e:
+            print(f"Error in status check: {e}")
+            changed = False
+
+        self.interval = self.next_interval(bool(changed), self.clock())
+        # The check itself may already have re-armed the timer
+        if self.source is None:
+            self._schedule(self.interval)
+        return False  # Each timer fires once, the next one is scheduled above
+
+    def next_interval(self, changed, now):
+        """Interval until the next check"""
+        if now < self.fast_until:
+            return self.fast_interval
+        if changed:
+            return self.base_interval
+        if self.events_available:
+            return self.max_interval
+        return min(max(self.interval, self.base_interval) * self.backoff, self.max_interval)
+
+    def tick_rate(self, window=60.0):
+        """Checks per second actually performed over the last `window` seconds"""
+        cutoff = self.clock() - window
+        recent = sum(1 for tick in self.tick_times if tick >= cutoff)
+        return recent / window
+
+    def stats(self):
+        return {
+            'ticks': self.ticks,
+            'interval': self.interval,
+            'tick_rate': self.tick_rate(),
+            'events_available': self.events_available,
+        }
@@ -0,0 +1,40 @@
+"""
+kerio-kvc.service state without D-Bus
+Polls `systemctl is-active`; the D-Bus UnitWatcher in kerio_vpn.systemd
+falls back to the same call. Importing this module never loads gi
+"""
+
+import subprocess
+
+UNIT = 'kerio-kvc.service'
+
+
+class SystemctlService:
+    """Service backend with the UnitWatcher interface, one process per check"""
+
+    available = False  # No change events, the scheduler has to poll
+
+    def __init__(self, unit=UNIT, on_change=None):
+        self.unit = unit
+        self.on_change = on_change  # Never called, kept for interface parity
+        self.spawned = 0  # systemctl runs, for metrics
+
+    def status(self):
+        """Return (is_active, state)"""
+        self.spawned += 1
+        return systemctl_status(self.unit)
+
+
+def systemctl_status(unit):
+    """Return (is_active, state) by running `systemctl is-active`"""
+    try:
+        result = subprocess.run(
+            ['systemctl', 'is-active', unit],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        return result.returncode == 0, result.stdout.strip()
+    except Exception as e:
+        print(f"Error checking service: {e}")
+        return False, "unknown"
@@ -0,0 +1,128 @@
+"""
+Indicator settings
+Optional INI file at $XDG_CONFIG_HOME/kerio-vpn-indicator/settings.conf;
+anything not set there falls back to DEFAULTS
+"""
+
+import os
+
+DEFAULTS = {
+    'notifications': {
+        # Seconds during which further notifications of one category are
+        # folded into a single updating bubble
+        'coalesce_window': '3',
+    },
+    'scheduler': {
+        # Seconds between status checks while connecting or reconnecting,
+        # for how long after such an action, and the relaxed range otherwise
+        'fast_interval': '0.5',
+        'fast_window': '30',
+        'base_interval': '2',
+        'max_interval': '30',
+    },
+    'reconnect': {
+        # Backoff with full jitter: attempt n waits up to
+        # min(max_delay, base_delay * 2^(n-1)) seconds
+        'base_delay': '3',
+        'max_delay': '300',
+        # Attempts per outage; 0 retries forever, pausing `cooldown` seconds
+        # after every breaker_threshold failed attempts
+        'max_attempts': '3',
+        'breaker_threshold': '10',
+        'cooldown': '600',
+        # Seconds an attempt may take before the next one is scheduled
+        'attempt_timeout': '30',
+    },
+    'flapping': {
+        # A drop must last down_after seconds and a recovery up_after
+        # seconds before the state follows; a stopped unit always counts
+        'down_after': '3',
+        'up_after': '0',
+        # Flapping from enter_changes raw changes within window seconds
+        # until leave_changes; 0 turns detection off. While flapping,
+        # connection notifications pause and every auto-reconnect waits
+        # reconnect_delay seconds longer
+        'window': '600',
+        'enter_changes': '6',
+        'leave_changes': '2',
+        'reconnect_delay': '60',
+    },
+    'metrics': {
+        # OpenMetrics endpoint, "127.0.0.1:9105" or "unix:/path/to.sock";
+        # disabled while empty
+        'listen': '',
+    },
+    'diagnostics': {
+        # Time status checks, subprocess calls, menu updates and reconnect
+        # timers; SIGUSR1 dumps them to $XDG_RUNTIME_DIR either way
+        'instrument': 'no',
+    },
+    'helper': {
+        # kerio-vpn-helper socket for root operations; sudo is used when
+        # nothing listens there or this is empty
+        'socket': '/run/kerio-vpn-helper.sock',
+    },
+    'gateways': {
+        # Candidate gateways, e.g. "vpn1.example.com vpn2.example.com:4091",
+        # ranked by TLS handshake time. Rankings are reused for cache_ttl seconds
+        'candidates': '',
+        # Let auto-reconnect rewrite /etc/kerio-kvc.conf to the fastest
+        # candidate. It only moves to gateways with a known certificate
+        # fingerprint ("host[:port]=AA:BB:..." pairs, plus the one the
+        # config already pins for its server) and never to one presenting
+        # another certificate
+        'switch': 'no',
+        'fingerprints': '',
+        'attempts': '3',
+        'timeout': '3',
+        'cache_ttl': '300',
+    },
+    'health': {
+        # Probe targets behind the VPN, e.g. "tcp:10.0.0.1:22 udp:10.0.0.53:7";
+        # probing is off while this is empty
+        'targets': '',
+        'interval': '10',
+        'timeout': '2',
+        'ewma_alpha': '0.3',
+        # Loss rate (0-1) and RTT above which the tunnel counts as degraded
+        'loss_threshold': '0.5',
+        'rtt_threshold_ms': '0',
+        # Restart the tunnel through auto-reconnect when it degrades
+        'reconnect': 'yes',
+    },
+}
+
+
+def config_dir():
+    """Directory holding the indicator's own settings"""
+    base = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+    return os.path.join(base, 'kerio-vpn-indicator')
+
+
+def state_dir():
+    """Directory for the indicator's persistent state"""
+    base = os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state')
+    return os.path.join(base, 'kerio-vpn-indicator')
+
+
+def runtime_dir():
+    """Per-user directory for sockets, locks and diagnostics; cleared at logout"""
+    base = os.environ.get('XDG_RUNTIME_DIR')
+    if base:
+        return base
+    return os.path.join(os.environ.get('TMPDIR') or '/tmp', f'kerio-vpn-indicator-{os.getuid()}')
+
+
+def load_settings(path=None):
+    """Return a ConfigParser with DEFAULTS overlaid by the settings file"""
+    # Not at the top: the command line imports this module for runtime_dir() alone
+    import configparser
+
+    settings = configparser.ConfigParser()
+    settings.read_dict(DEFAULTS)
+    path = path or os.path.join(config_dir(), 'settings.conf')
+    try:
+        settings.read(path)
+    except configparser.Error as e:
+        print(f"Error reading settings from {path}: {e}")
+    return settings
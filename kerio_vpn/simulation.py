@@ -0,0 +1,546 @@
+"""
+Simulated host
+A virtual clock, a main loop that jumps from timer to timer instead of
+sleeping, and stand-ins for kerio-kvc.service, kvnet, the helper, logind
+and NetworkManager, all driven by a trace of timed events. VPNCore runs
+on top unchanged, so hours of flaps, slow starts and suspends replay in
+a fraction of a second with every transition, notification and systemctl
+call recorded. Nothing here imports gi or touches the network
+"""
+
+import collections
+import heapq
+import json
+import os
+import random
+
+from kerio_vpn.commands import CommandResult
+from kerio_vpn.core import VPNCore
+from kerio_vpn.service import UNIT
+from kerio_vpn.settings import load_settings
+
+EPOCH = 1700000000.0  # Simulated clocks start here so timestamps look like wall time
+VPN_IP = '10.8.0.2'
+
+# Trace events that are user actions on the core rather than host changes
+USER_ACTIONS = {
+    'user_connect': 'connect_vpn',
+    'user_disconnect': 'disconnect_vpn',
+    'user_reconnect': 'reconnect_vpn',
+}
+
+
+class SimulatedClock:
+    """Stands in for time.time and time.monotonic; only the loop moves it"""
+
+    def __init__(self, start=EPOCH):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class InlineExecutor:
+    """CommandRunner executor that runs jobs at once; results still arrive via idle_add"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class SimulatedLoop:
+    """The loop interface on a SimulatedClock: timers fire in order without waiting"""
+
+    def __init__(self, clock=None):
+        self.clock = clock or SimulatedClock()
+        self.timers = {}  # id -> [interval, fn, args]
+        self.timer_heap = []  # (due, id); entries of removed timers are skipped
+        self.watches = {}  # id -> (fd, fn); nothing is ever readable
+        self.signals = {}  # signum -> fn, delivered by raise_signal()
+        self.idle = collections.deque()
+        self.next_id = 1
+        self.running = False
+
+    def _new_id(self):
+        source_id = self.next_id
+        self.next_id += 1
+        return source_id
+
+    def timeout_add(self, ms, fn, *args):
+        source_id = self._new_id()
+        interval = ms / 1000
+        self.timers[source_id] = [interval, fn, args]
+        heapq.heappush(self.timer_heap, (self.clock.now + interval, source_id))
+        return source_id
+
+    def source_remove(self, source_id):
+        if self.timers.pop(source_id, None) is not None:
+            return True
+        return self.watches.pop(source_id, None) is not None
+
+    def idle_add(self, fn, *args):
+        self.idle.append((fn, args))
+        return 0
+
+    def io_add_watch(self, fd, fn):
+        source_id = self._new_id()
+        self.watches[source_id] = (fd, fn)
+        return source_id
+
+    def signal_add(self, signum, fn):
+        self.signals[signum] = fn
+
+    def raise_signal(self, signum):
+        """Deliver signum to its handler, as the real loops do after the signal arrives"""
+        self.signals[signum]()
+
+    def live_sources(self):
+        """Timers, fd watches and queued idle callbacks"""
+        return len(self.timers) + len(self.watches) + len(self.idle)
+
+    def _dispatch(self, fn, args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f"Error in main loop callback {getattr(fn, '__name__', fn)}: {e}")
+            return False
+
+    def _step(self, until):
+        """Run the queued idle work or the next timer due by `until`; False if there is none"""
+        if self.idle:
+            batch = list(self.idle)
+            self.idle.clear()
+            for fn, args in batch:
+                if self._dispatch(fn, args):
+                    self.idle.append((fn, args))
+            return True
+        while self.timer_heap and self.timer_heap[0][1] not in self.timers:
+            heapq.heappop(self.timer_heap)
+        if not self.timer_heap or self.timer_heap[0][0] > until:
+            return False
+        due, source_id = heapq.heappop(self.timer_heap)
+        self.clock.now = max(self.clock.now, due)
+        interval, fn, args = self.timers[source_id]
+        if self._dispatch(fn, args) and source_id in self.timers:
+            heapq.heappush(self.timer_heap, (self.clock.now + interval, source_id))
+        else:
+            self.timers.pop(source_id, None)
+        return True
+
+    def run_until(self, when):
+        """Run everything due up to `when`, then set the clock to it"""
+        while self._step(when):
+            pass
+        self.clock.now = max(self.clock.now, when)
+
+    def advance(self, seconds):
+        self.run_until(self.clock.now + seconds)
+
+    def run(self):
+        """Run until quit() or until nothing is left to do"""
+        self.running = True
+        while self.running and self._step(float('inf')):
+            pass
+
+    def quit(self):
+        self.running = False
+
+    def close(self):
+        pass
+
+
+class SimulatedService:
+    """kerio-kvc.service backend with the UnitWatcher interface"""
+
+    spawned = 0
+
+    def __init__(self, host, available):
+        self.host = host
+        self.available = available  # False: no change events, like SystemctlService
+        self.on_change = None
+
+    def status(self):
+        return self.host.unit_state == 'active', self.host.unit_state
+
+    def close(self):
+        pass
+
+
+class SimulatedInterface:
+    """kvnet backend with the LinkWatcher interface"""
+
+    spawned = 0
+
+    def __init__(self, host, available):
+        self.host = host
+        self.available = available
+        self.on_change = None
+
+    def status(self):
+        host = self.host
+        if not host.link_exists:
+            return False, "not found", None
+        if not host.link_running:
+            return False, "exists but down", None
+        return True, "up", host.address
+
+    def close(self):
+        pass
+
+
+class SimulatedCounters:
+    """kvnet statistics that grow by a fixed rate while the link is up"""
+
+    def __init__(self, host, rate=100000):
+        self.host = host
+        self.rate = rate
+
+    def read(self):
+        if not self.host.link_exists:
+            return None
+        total = int((self.host.clock() - EPOCH) * self.rate)
+        return (total, total // 4, total // 1000, total // 4000, 0, 0, 0, 0)
+
+    def close(self):
+        pass
+
+
+class SimulatedHelper:
+    """PrivilegedClient stand-in: systemctl actions play out on the host"""
+
+    spawned = 0
+
+    def __init__(self, host):
+        self.host = host
+
+    def systemctl(self, action):
+        return self.host.systemctl(action)
+
+    def close(self):
+        pass
+
+
+class SimulatedSleep:
+    """logind.SleepWatcher stand-in"""
+
+    available = True
+
+    def __init__(self):
+        self.sleeping = False
+        self.on_change = None
+
+    def close(self):
+        pass
+
+
+class SimulatedNetwork:
+    """networkmanager.ConnectivityWatcher stand-in"""
+
+    available = True
+
+    def __init__(self):
+        self.online = True
+        self.primary_connection = '/org/freedesktop/NetworkManager/ActiveConnection/1'
+        self.on_change = None
+
+    def close(self):
+        pass
+
+
+class SimulatedHost:
+    """
+    kerio-kvc.service, kvnet, the uplink and suspend as plain state.
+    Each trace event is a method; events=False turns the service and
+    interface backends into polled ones without change notifications
+    """
+
+    def __init__(self, loop, events=True, start_delay=2.0):
+        self.loop = loop
+        self.clock = loop.clock
+        self.unit_state = 'inactive'
+        self.link_exists = False
+        self.link_running = False
+        self.address = None
+        self.start_delay = start_delay  # Seconds from start to an address on kvnet
+        self.start_failures = 0  # The next this many starts fail
+        self.handshake = None  # Timer bringing kvnet up after a start
+        self.actions = []  # (time, systemctl action)
+        self.notifications = []  # (time, category, title)
+
+        self.service = SimulatedService(self, events)
+        self.interface = SimulatedInterface(self, events)
+        self.counters = SimulatedCounters(self)
+        self.privileged = SimulatedHelper(self)
+        self.sleep = SimulatedSleep()
+        self.network = SimulatedNetwork()
+
+    def notify(self, category, title, message):
+        self.notifications.append((self.clock(), category, title))
+
+    def changed(self):
+        """Tell event-driven backends; polled ones are found by the next check"""
+        for backend in (self.service, self.interface):
+            if backend.available and backend.on_change:
+                backend.on_change(backend)
+
+    def set_tunnel(self, up):
+        self.link_exists = self.link_running = up
+        self.address = VPN_IP if up else None
+
+    def cancel_handshake(self):
+        if self.handshake is not None:
+            self.loop.source_remove(self.handshake)
+            self.handshake = None
+
+    # systemctl, called through SimulatedHelper
+
+    def systemctl(self, action):
+        """
+        Like kerio-kvc.service: start returns once the daemon has forked and
+        the unit is active, kvnet only appears start_delay seconds later
+        """
+        self.actions.append((self.clock(), action))
+        args = ['systemctl', action, UNIT]
+        if action == 'stop':
+            self.cancel_handshake()
+            self.unit_state = 'inactive'
+            self.set_tunnel(False)
+            self.changed()
+            return CommandResult(args, 0)
+        if action == 'start' and self.unit_state == 'active':
+            return CommandResult(args, 0)  # Nothing to do
+
+        self.cancel_handshake()
+        self.set_tunnel(False)
+        if self.start_failures:
+            self.start_failures -= 1
+            self.unit_state = 'failed'
+            self.changed()
+            return CommandResult(args, 1, stderr=f"Job for {UNIT} failed because the "
+                                 "control process exited with error code.")
+        self.unit_state = 'active'
+        self.handshake = self.loop.timeout_add(int(self.start_delay * 1000), self.handshake_done)
+        self.changed()
+        return CommandResult(args, 0)
+
+    def handshake_done(self):
+        """The daemon reached the gateway; without an uplink it never does"""
+        self.handshake = None
+        if self.unit_state == 'active' and self.network.online:
+            self.set_tunnel(True)
+            self.changed()
+        return False
+
+    # Trace events
+
+    def tunnel_up(self):
+        """The service is running with kvnet up and addressed"""
+        self.cancel_handshake()
+        self.unit_state = 'active'
+        self.set_tunnel(True)
+        self.changed()
+
+    def tunnel_down(self):
+        """kvnet goes away while the service keeps running"""
+        self.set_tunnel(False)
+        self.changed()
+
+    def link_down(self):
+        """A brief `state DOWN` on kvnet"""
+        self.link_running = False
+        self.changed()
+
+    def link_up(self):
+        self.link_running = self.link_exists
+        self.changed()
+
+    def address_lost(self):
+        """The `inet` line is missing for a moment"""
+        self.address = None
+        self.changed()
+
+    def address_added(self):
+        self.address = VPN_IP if self.link_exists else None
+        self.changed()
+
+    def unit_failed(self):
+        self.cancel_handshake()
+        self.unit_state = 'failed'
+        self.set_tunnel(False)
+        self.changed()
+
+    def unit_stopped(self):
+        self.cancel_handshake()
+        self.unit_state = 'inactive'
+        self.set_tunnel(False)
+        self.changed()
+
+    def slow_start(self, seconds):
+        """Later starts take `seconds` until the tunnel is up"""
+        self.start_delay = seconds
+
+    def failing_starts(self, count):
+        """The next `count` starts fail"""
+        self.start_failures = count
+
+    def sleep_host(self):
+        """Suspend: NetworkManager goes to sleep and the tunnel does not survive"""
+        self.sleep.sleeping = True
+        self.sleep.on_change(self.sleep)
+        self.uplink_down()
+        self.set_tunnel(False)
+
+    def resume_host(self):
+        self.sleep.sleeping = False
+        self.sleep.on_change(self.sleep)
+        self.changed()
+
+    def uplink_down(self):
+        self.network.online = False
+        self.network.primary_connection = None
+        if self.network.on_change:
+            self.network.on_change(self.network)
+
+    def uplink_up(self, primary='/org/freedesktop/NetworkManager/ActiveConnection/1'):
+        self.network.online = True
+        self.network.primary_connection = primary
+        if self.network.on_change:
+            self.network.on_change(self.network)
+
+
+# Trace events and the SimulatedHost methods behind them
+HOST_EVENTS = {name: name for name in (
+    'tunnel_up', 'tunnel_down', 'link_down', 'link_up', 'address_lost', 'address_added',
+    'unit_failed', 'unit_stopped', 'slow_start', 'failing_starts', 'uplink_down', 'uplink_up',
+)}
+HOST_EVENTS.update(sleep='sleep_host', resume='resume_host')
+
+
+def load_trace(path):
+    """
+    Read a JSON-lines trace: {"t": seconds, "event": name, ...arguments}.
+    Returns [(t, event, arguments)] in time order
+    """
+    trace = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            try:
+                entry = json.loads(line)
+                t = float(entry.pop('t'))
+                event = entry.pop('event')
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}:{number}: not a trace event: {e}") from None
+            if event not in HOST_EVENTS and event not in USER_ACTIONS:
+                raise ValueError(f"{path}:{number}: unknown trace event {event!r}")
+            trace.append((t, event, entry))
+    trace.sort(key=lambda entry: entry[0])
+    return trace
+
+
+def trace_from_sessions(records):
+    """
+    Turn session history records into a trace: each session starts with
+    the tunnel up and ends the way it ended back then. The recorded
+    reconnects stay in, so a replayed drop lasts at most as long as it did
+    """
+    records = sorted((r for r in records if 'connect' in r), key=lambda r: r['connect'])
+    if not records:
+        return []
+    start = records[0]['connect']
+    trace = []
+    for record in records:
+        trace.append((record['connect'] - start, 'tunnel_up', {}))
+        if 'disconnect' not in record:
+            continue
+        cause = record.get('cause')
+        if cause == 'manual':
+            trace.append((record['disconnect'] - start, 'user_disconnect', {}))
+        elif cause in ('lost', 'degraded'):
+            trace.append((record['disconnect'] - start, 'tunnel_down', {}))
+        # 'exit' or 'interrupted': the indicator stopped, not the tunnel
+    trace.sort(key=lambda entry: entry[0])
+    return trace
+
+
+class Replay:
+    """Runs a VPNCore on a SimulatedHost through a trace and records what it did"""
+
+    def __init__(self, trace, settings=None, events=True, start_delay=2.0,
+                 config_file=os.devnull, seed=0):
+        """
+        trace: [(t, event, arguments)] as from load_trace(); events at t <= 0
+        set up the host before the core starts.
+        settings: defaults to the built-in ones, not the user's file.
+        seed: for the reconnect jitter, so a replay is repeatable.
+        The core writes its state cache and history under $XDG_STATE_HOME,
+        point that somewhere disposable
+        """
+        self.trace = sorted(trace, key=lambda entry: entry[0])
+        self.clock = SimulatedClock()
+        self.loop = SimulatedLoop(self.clock)
+        self.host = SimulatedHost(self.loop, events=events, start_delay=start_delay)
+        host = self.host
+        self.core = VPNCore(self.loop, settings=settings or load_settings(os.devnull),
+                            service=host.service,
+                            notify=host.notify, config_file=config_file,
+                            sleep=host.sleep, network=host.network,
+                            interface=host.interface, privileged=host.privileged,
+                            counters=host.counters, executor=InlineExecutor(),
+                            clock=self.clock)
+        self.core.reconnect_policy.rng = random.Random(seed).random
+        self.core.listeners.append(self.on_changed)
+        self.state = None
+        self.transitions = []  # (seconds since start, 'connected' / 'degraded' / 'disconnected')
+        self.started = False
+
+    def on_changed(self, core):
+        if core.is_degraded:
+            state = 'degraded'
+        else:
+            state = 'connected' if core.is_connected else 'disconnected'
+        if state != self.state:
+            self.state = state
+            self.transitions.append((self.clock() - EPOCH, state))
+
+    def apply(self, event, arguments):
+        if event in USER_ACTIONS:
+            getattr(self.core, USER_ACTIONS[event])(**arguments)
+            return
+        if event not in HOST_EVENTS:
+            raise ValueError(f"unknown trace event {event!r}")
+        getattr(self.host, HOST_EVENTS[event])(**arguments)
+
+    def run(self, settle=600.0):
+        """Replay the whole trace plus `settle` simulated seconds; returns the summary"""
+        for t, event, arguments in self.trace:
+            if t > 0 and not self.started:
+                self.start()
+            self.loop.run_until(EPOCH + t)
+            self.apply(event, arguments)
+        if not self.started:
+            self.start()
+        self.loop.advance(settle)
+        return self.summary()
+
+    def start(self):
+        self.core.start()
+        self.started = True
+
+    def summary(self):
+        policy = self.core.reconnect_policy.stats()
+        return {
+            'simulated': self.clock() - EPOCH,
+            'transitions': [state for _t, state in self.transitions],
+            'notifications': [title for _t, _category, title in self.host.notifications],
+            'actions': [action for _t, action in self.host.actions],
+            'reconnect_attempts': policy['total_attempts'],
+            'gave_up': policy['gave_up'],
+            'decisions': self.core.poll_histogram.count,
+        }
+
+    def close(self):
+        self.core.shutdown()
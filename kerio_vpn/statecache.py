@@ -0,0 +1,56 @@
+"""
+Last-known connection state
+A tiny JSON file under $XDG_STATE_HOME so the tray can draw the right
+icon before the first status check has run. Entries written during an
+earlier boot are ignored: no tunnel survives a reboot
+"""
+
+import json
+import os
+
+from kerio_vpn.settings import state_dir
+
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+
+def boot_id():
+    try:
+        with open(BOOT_ID_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class StateCache:
+    """Load and save the last state the core saw"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(state_dir(), 'last-state.json')
+        self.saved = None
+
+    def load(self):
+        """Last saved state from this boot, {} if there is none"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(state, dict) or state.pop('boot_id', None) != boot_id():
+            return {}
+        self.saved = state
+        return state
+
+    def save(self, state):
+        """Write state if it differs from what is on disk; atomic via rename"""
+        if state == self.saved:
+            return
+        data = dict(state, boot_id=boot_id())
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self.saved = dict(state)
+        except OSError as e:
+            print(f"Error saving last-known state: {e}")
@@ -0,0 +1,117 @@
+"""
+systemd unit state over D-Bus
+Keeps a cached copy of a unit's ActiveState, SubState and
+ActiveEnterTimestamp, updated from PropertiesChanged signals, so callers
+can read the service state without spawning `systemctl is-active`
+"""
+
+from gi.repository import Gio, GLib
+
+from kerio_vpn.service import systemctl_status
+
+SYSTEMD_BUS_NAME = 'org.freedesktop.systemd1'
+SYSTEMD_PATH = '/org/freedesktop/systemd1'
+MANAGER_INTERFACE = 'org.freedesktop.systemd1.Manager'
+UNIT_INTERFACE = 'org.freedesktop.systemd1.Unit'
+WATCHED_PROPERTIES = ('ActiveState', 'SubState', 'ActiveEnterTimestamp')
+DBUS_TIMEOUT_MS = 2000
+
+
+class UnitWatcher:
+    """Cached systemd unit state with a `systemctl` fallback"""
+
+    def __init__(self, unit='kerio-kvc.service', connection=None, on_change=None):
+        """
+        connection: a Gio.DBusConnection to talk to, defaults to the system
+        bus; tests pass a private bus running a stand-in systemd service.
+        on_change: called with the watcher whenever a watched property changes
+        """
+        self.unit = unit
+        self.on_change = on_change
+        self.properties = {}
+        self.available = False
+        self.unit_proxy = None
+        self.spawned = 0  # systemctl fallbacks run, for metrics
+
+        try:
+            if connection is None:
+                connection = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+            self.connection = connection
+
+            manager = Gio.DBusProxy.new_sync(
+                connection, Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES, None,
+                SYSTEMD_BUS_NAME, SYSTEMD_PATH, MANAGER_INTERFACE, None
+            )
+            # Without Subscribe systemd does not emit unit PropertiesChanged
+            manager.call_sync('Subscribe', None, Gio.DBusCallFlags.NONE, DBUS_TIMEOUT_MS, None)
+            # LoadUnit rather than GetUnit so an inactive unit still has a path
+            (unit_path,) = manager.call_sync(
+                'LoadUnit', GLib.Variant('(s)', (unit,)),
+                Gio.DBusCallFlags.NONE, DBUS_TIMEOUT_MS, None
+            ).unpack()
+
+            self.unit_proxy = Gio.DBusProxy.new_sync(
+                connection, Gio.DBusProxyFlags.NONE, None,
+                SYSTEMD_BUS_NAME, unit_path, UNIT_INTERFACE, None
+            )
+            for name in WATCHED_PROPERTIES:
+                value = self.unit_proxy.get_cached_property(name)
+                if value is not None:
+                    self.properties[name] = value.unpack()
+            self.unit_proxy.connect('g-properties-changed', self.on_properties_changed)
+            self.available = 'ActiveState' in self.properties
+        except GLib.Error as e:
+            print(f"systemd D-Bus unavailable, using systemctl: {e.message}")
+            self.available = False
+
+    @property
+    def active_state(self):
+        return self.properties.get('ActiveState', 'unknown')
+
+    @property
+    def sub_state(self):
+        return self.properties.get('SubState', 'unknown')
+
+    @property
+    def active_enter_timestamp(self):
+        """Time the unit last entered 'active', in seconds since the epoch"""
+        usec = self.properties.get('ActiveEnterTimestamp', 0)
+        return usec / 1000000 if usec else None
+
+    def on_properties_changed(self, proxy, changed, invalidated):
+        """Merge PropertiesChanged updates into the cache"""
+        changed = changed.unpack()
+        updated = False
+        for name in WATCHED_PROPERTIES:
+            if name in changed:
+                updated = updated or self.properties.get(name) != changed[name]
+                self.properties[name] = changed[name]
+            elif name in invalidated:
+                # Invalidated without a value, fetch it explicitly
+                updated = self.refresh_property(name) or updated
+        if updated and self.on_change:
+            self.on_change(self)
+
+    def refresh_property(self, name):
+        """Fetch a single property that was invalidated without a value"""
+        try:
+            (value,) = self.connection.call_sync(
+                SYSTEMD_BUS_NAME, self.unit_proxy.get_object_path(),
+                'org.freedesktop.DBus.Properties', 'Get',
+                GLib.Variant('(ss)', (UNIT_INTERFACE, name)),
+                GLib.VariantType.new('(v)'), Gio.DBusCallFlags.NONE, DBUS_TIMEOUT_MS, None
+            ).unpack()
+            changed = self.properties.get(name) != value
+            self.properties[name] = value
+            return changed
+        except GLib.Error as e:
+            print(f"Error refreshing {name}: {e.message}")
+            return False
+
+    def status(self):
+        """Return (is_active, state) from the cache, or from systemctl without D-Bus"""
+        if self.available:
+            return self.active_state == 'active', self.active_state
+        self.spawned += 1
+        return systemctl_status(self.unit)
+
@@ -0,0 +1,133 @@
+"""
+Traffic counters for the VPN interface
+Reads /sys/class/net/<iface>/statistics with pread on descriptors that stay
+open between samples, and keeps a fixed-size ring of samples for rates
+and session totals. No GTK here, so the math can be checked against a
+fake sysfs tree
+"""
+
+import collections
+import os
+import time
+
+COUNTERS = (
+    'rx_bytes', 'tx_bytes',
+    'rx_packets', 'tx_packets',
+    'rx_errors', 'tx_errors',
+    'rx_dropped', 'tx_dropped',
+)
+RX_BYTES = COUNTERS.index('rx_bytes')
+TX_BYTES = COUNTERS.index('tx_bytes')
+
+
+class InterfaceCounters:
+    """Open statistics files of one interface, read with pread"""
+
+    def __init__(self, ifname='kvnet', sysfs_root='/sys/class/net'):
+        self.directory = os.path.join(sysfs_root, ifname, 'statistics')
+        self.fds = None
+
+    def open(self):
+        """Open every counter file; returns False if the interface is missing"""
+        self.close()
+        fds = []
+        try:
+            for name in COUNTERS:
+                fds.append(os.open(os.path.join(self.directory, name), os.O_RDONLY))
+        except OSError:
+            for fd in fds:
+                os.close(fd)
+            return False
+        self.fds = fds
+        return True
+
+    def close(self):
+        if self.fds:
+            for fd in self.fds:
+                os.close(fd)
+        self.fds = None
+
+    def read(self):
+        """Return a tuple of counter values in COUNTERS order, or None"""
+        if self.fds is None and not self.open():
+            return None
+        try:
+            return tuple(int(os.pread(fd, 32, 0)) for fd in self.fds)
+        except (OSError, ValueError):
+            # Interface went away or was recreated; reopen on the next sample
+            self.close()
+            return None
+
+
+class TrafficMonitor:
+    """Session totals and rx/tx rates over a ring buffer of samples"""
+
+    def __init__(self, counters, size=60, clock=time.monotonic):
+        self.counters = counters
+        self.clock = clock
+        self.samples = collections.deque(maxlen=size)  # (time, session totals)
+        self.reset()
+
+    def reset(self):
+        """Start a new session; totals count from the next sample"""
+        self.samples.clear()
+        self.previous = None
+        self.totals = (0,) * len(COUNTERS)
+
+    def sample(self):
+        """Take one sample; returns False if the counters could not be read"""
+        values = self.counters.read()
+        if values is None:
+            if self.previous is not None:
+                # The interface went away; a new one counts from zero
+                self.previous = (0,) * len(COUNTERS)
+            return False
+
+        if self.previous is not None:
+            # A counter that went backwards was reset (interface recreated),
+            # so everything it shows now is new traffic
+            self.totals = tuple(
+                total + (value - prev if value >= prev else value)
+                for total, value, prev in zip(self.totals, values, self.previous)
+            )
+        self.previous = values
+        self.samples.append((self.clock(), self.totals))
+        return True
+
+    def _rate(self, first, last, index):
+        (t0, totals0), (t1, totals1) = first, last
+        elapsed = t1 - t0
+        if elapsed <= 0:
+            return 0.0
+        return (totals1[index] - totals0[index]) / elapsed
+
+    def current_rates(self):
+        """(rx, tx) bytes per second between the last two samples"""
+        if len(self.samples) < 2:
+            return 0.0, 0.0
+        first, last = self.samples[-2], self.samples[-1]
+        return self._rate(first, last, RX_BYTES), self._rate(first, last, TX_BYTES)
+
+    def average_rates(self):
+        """(rx, tx) bytes per second over the whole ring buffer"""
+        if len(self.samples) < 2:
+            return 0.0, 0.0
+        first, last = self.samples[0], self.samples[-1]
+        return self._rate(first, last, RX_BYTES), self._rate(first, last, TX_BYTES)
+
+    def session_totals(self):
+        """Counters accumulated since reset, as a {name: value} dict"""
+        return dict(zip(COUNTERS, self.totals))
+
+
+def format_bytes(count):
+    """Format a byte count as B/KB/MB/GB/TB"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+def format_rate(bytes_per_second):
+    return f"{format_bytes(bytes_per_second)}/s"
@@ -0,0 +1,344 @@
+"""
+Tray front end
+AppIndicator3 icon and GTK menu on top of VPNCore
+Works on: XFCE, MATE, Cinnamon, LXDE, LXQt, and GNOME (fallback)
+"""
+
+import os
+import signal
+import subprocess
+
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('AppIndicator3', '0.1')
+from gi.repository import Gtk, AppIndicator3, GLib
+
+from kerio_vpn.statecache import StateCache
+from kerio_vpn.traffic import format_bytes, format_rate
+
+# Set by benchmarks/tray_startup.py: report startup phases, then quit
+STARTUP_PROBE = bool(os.environ.get('KERIO_VPN_STARTUP_PROBE'))
+
+
+def icon_name(connected, degraded):
+    if not connected:
+        return 'network-offline'
+    return 'network-error' if degraded else 'network-transmit-receive'
+
+
+def startup_mark(phase):
+    """Report a startup phase to benchmarks/tray_startup.py"""
+    if STARTUP_PROBE:
+        print(f"startup: {phase}", flush=True)
+
+
+class KerioVPNIndicator:
+    def __init__(self):
+        self.app_id = 'kerio-vpn-indicator'
+        self.core = None
+        self.control = None
+        self.notifier = None
+        self.secondary_items = False
+        self.log_window = None
+        self.checked = False
+
+        # Draw the last known state right away; the real check runs once the
+        # main loop is up, so the icon never waits for D-Bus or systemctl
+        cached = StateCache().load()
+
+        # Create indicator
+        self.indicator = AppIndicator3.Indicator.new(
+            self.app_id,
+            icon_name(cached.get('connected'), cached.get('degraded')),
+            AppIndicator3.IndicatorCategory.SYSTEM_SERVICES
+        )
+        self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
+
+        # Create menu; entries that are not needed for the first paint come later
+        self.menu = Gtk.Menu()
+        self.build_menu()
+        self.indicator.set_menu(self.menu)
+        self.show_cached_state(cached)
+        startup_mark('icon')
+
+        GLib.idle_add(self.start_core)
+
+    def start_core(self):
+        """Build the core and its D-Bus clients once the icon is on screen"""
+        from kerio_vpn.configmonitor import ConfigMonitor
+        from kerio_vpn.core import VPNCore
+        from kerio_vpn.logind import SleepWatcher
+        from kerio_vpn.mainloop import GLibLoop
+        from kerio_vpn.networkmanager import ConnectivityWatcher
+        from kerio_vpn.notifications import Notifier
+        from kerio_vpn.service import UNIT
+        from kerio_vpn.systemd import UnitWatcher
+
+        # Follow kerio-kvc.service over D-Bus, UnitWatcher falls back to systemctl;
+        # logind and NetworkManager tell the core about suspend and the uplink
+        self.core = VPNCore(GLibLoop(), service=UnitWatcher(UNIT), notify=self.notify,
+                            sleep=SleepWatcher(), network=ConnectivityWatcher())
+
+        # Notifications go straight to the notification daemon over D-Bus
+        self.notifier = Notifier(
+            coalesce_window=self.core.settings.getfloat('notifications', 'coalesce_window'),
+            fallback=self.show_notification_fallback
+        )
+
+        # Show a server saved by the editor without a restart
+        try:
+            self.core.config_monitor = ConfigMonitor(self.core.config_file, self.core.reload_config)
+        except GLib.Error as e:
+            print(f"Cannot watch {self.core.config_file}: {e.message}")
+
+        self.core.instrumentation.wrap(self, 'update_menu', 'menu_update')
+        self.core.listeners.append(self.on_core_changed)
+        self.core.start()
+        startup_mark('core')
+
+        # `kerio-vpn-indicator connect` and scripts talk to this instance
+        from kerio_vpn.control import ControlServer
+        try:
+            self.control = ControlServer(self.core.loop, self.core)
+        except OSError as e:
+            print(f"Cannot open the control socket: {e}")
+
+        GLib.idle_add(self.build_secondary_items, priority=GLib.PRIORITY_LOW)
+        return False  # Run once
+
+    def on_core_changed(self, core):
+        self.update_menu()
+        if not self.checked:
+            self.checked = True
+            startup_mark('first-status')
+            if STARTUP_PROBE:
+                GLib.idle_add(self.on_quit, None)
+
+    def notify(self, category, title, message):
+        self.notifier.notify(category, title, message)
+
+    def build_menu(self):
+        """Build the entries shown from the first paint: state, connect, quit"""
+        # Status item
+        self.status_item = Gtk.MenuItem(label="VPN: Disconnected")
+        self.status_item.set_sensitive(False)
+        self.menu.append(self.status_item)
+
+        # Connection info item
+        self.info_item = Gtk.MenuItem(label="No connection info")
+        self.info_item.set_sensitive(False)
+        self.menu.append(self.info_item)
+
+        # Separator
+        self.menu.append(Gtk.SeparatorMenuItem())
+
+        # Connect/Disconnect
+        self.connect_item = Gtk.MenuItem(label="Connect")
+        self.connect_item.connect('activate', self.on_toggle_connection)
+        self.menu.append(self.connect_item)
+
+        # Separator
+        self.quit_separator = Gtk.SeparatorMenuItem()
+        self.menu.append(self.quit_separator)
+
+        # Quit
+        quit_item = Gtk.MenuItem(label="Quit")
+        quit_item.connect('activate', self.on_quit)
+        self.menu.append(quit_item)
+
+        self.menu.show_all()
+
+    def build_secondary_items(self):
+        """Add the remaining entries around the ones build_menu created"""
+        def insert_after(anchor, item):
+            self.menu.insert(item, self.menu.get_children().index(anchor) + 1)
+
+        # Traffic item
+        self.traffic_item = Gtk.MenuItem(label="No traffic data")
+        self.traffic_item.set_sensitive(False)
+        insert_after(self.info_item, self.traffic_item)
+
+        # Reconnect
+        self.reconnect_item = Gtk.MenuItem(label="Reconnect")
+        self.reconnect_item.connect('activate', self.on_reconnect)
+        self.reconnect_item.set_sensitive(False)
+        insert_after(self.connect_item, self.reconnect_item)
+
+        # Auto-reconnect toggle
+        self.auto_reconnect_item = Gtk.CheckMenuItem(label="Auto-reconnect")
+        self.auto_reconnect_item.set_active(self.core.reconnect_policy.enabled)
+        self.auto_reconnect_item.connect('toggled', self.on_auto_reconnect_toggled)
+
+        # Copy IP
+        self.copy_ip_item = Gtk.MenuItem(label="Copy IP Address")
+        self.copy_ip_item.connect('activate', self.on_copy_ip)
+        self.copy_ip_item.set_sensitive(False)
+
+        # View logs
+        logs_item = Gtk.MenuItem(label="View Logs")
+        logs_item.connect('activate', self.on_view_logs)
+
+        # Settings
+        settings_item = Gtk.MenuItem(label="Settings...")
+        settings_item.connect('activate', self.on_settings)
+
+        position = self.menu.get_children().index(self.quit_separator)
+        for item in (Gtk.SeparatorMenuItem(), self.auto_reconnect_item, Gtk.SeparatorMenuItem(),
+                     self.copy_ip_item, logs_item, settings_item):
+            self.menu.insert(item, position)
+            position += 1
+
+        self.menu.show_all()
+        self.secondary_items = True
+        self.update_menu()
+        return False  # Run once
+
+    def show_cached_state(self, cached):
+        """Label the menu from the last known state until the first check"""
+        if cached.get('connected'):
+            self.status_item.set_label("VPN: Connected (checking...)")
+            self.connect_item.set_label("Disconnect")
+            if cached.get('vpn_ip'):
+                self.info_item.set_label(f"IP: {cached['vpn_ip']}")
+        else:
+            self.status_item.set_label("VPN: Disconnected (checking...)")
+            self.info_item.set_label("Not connected")
+
+    def update_menu(self):
+        """Update menu items based on connection state"""
+        core = self.core
+        if core.is_connected:
+            if core.is_degraded:
+                self.status_item.set_label("VPN: Degraded ⚠")
+            else:
+                self.status_item.set_label("VPN: Connected ✓")
+            self.connect_item.set_label("Disconnect")
+
+            # Update connection info
+            info_parts = []
+            if core.vpn_ip:
+                info_parts.append(f"IP: {core.vpn_ip}")
+            if core.vpn_server:
+                info_parts.append(f"Server: {core.vpn_server}")
+            if core.connection_start_time:
+                duration = core.get_connection_duration()
+                info_parts.append(f"Duration: {duration}")
+            if core.health is not None and core.health.stats.samples:
+                info_parts.append(core.health.stats.describe())
+            if core.flap.score:
+                info_parts.append(core.flap.describe())
+
+            self.info_item.set_label(" | ".join(info_parts) if info_parts else "Connected")
+        else:
+            self.status_item.set_label("VPN: Disconnected")
+            self.connect_item.set_label("Connect")
+            if core.flap.score:
+                self.info_item.set_label(f"Not connected | {core.flap.describe()}")
+            else:
+                self.info_item.set_label("Not connected")
+        self.indicator.set_icon(icon_name(core.is_connected, core.is_degraded))
+
+        if self.secondary_items:
+            # Follows changes made over the control socket
+            self.auto_reconnect_item.set_active(core.reconnect_policy.enabled)
+            self.reconnect_item.set_sensitive(core.is_connected)
+            self.copy_ip_item.set_sensitive(core.is_connected)
+            if core.is_connected:
+                self.update_traffic_item()
+            else:
+                self.traffic_item.set_label("No traffic data")
+
+    def update_traffic_item(self):
+        """Show current/average rates and session totals for kvnet"""
+        traffic = self.core.traffic
+        if len(traffic.samples) < 2:
+            self.traffic_item.set_label("Measuring traffic...")
+            return
+        rx_rate, tx_rate = traffic.current_rates()
+        rx_avg, tx_avg = traffic.average_rates()
+        totals = traffic.session_totals()
+        self.traffic_item.set_label(
+            f"↓ {format_rate(rx_rate)} (avg {format_rate(rx_avg)}) "
+            f"↑ {format_rate(tx_rate)} (avg {format_rate(tx_avg)}) | "
+            f"Total ↓ {format_bytes(totals['rx_bytes'])} ↑ {format_bytes(totals['tx_bytes'])}"
+        )
+
+    def show_notification_fallback(self, title, message):
+        """Show desktop notification through notify-send"""
+        self.core.commands.run(
+            ['notify-send', '-i', 'network-vpn', title, message],
+            timeout=5
+        )
+
+    def on_toggle_connection(self, widget):
+        """Handle connect/disconnect action"""
+        if self.core is None:
+            return  # Clicked before the core finished starting
+        self.core.toggle_connection()
+
+    def on_reconnect(self, widget):
+        """Handle reconnect action"""
+        # Start again once the stop has finished instead of after a fixed delay
+        self.core.reconnect_vpn()
+
+    def on_auto_reconnect_toggled(self, widget):
+        """Handle auto-reconnect toggle"""
+        if widget.get_active() != self.core.reconnect_policy.enabled:
+            self.core.set_auto_reconnect(widget.get_active())
+
+    def on_copy_ip(self, widget):
+        """Copy VPN IP to clipboard"""
+        vpn_ip = self.core.vpn_ip
+        if vpn_ip:
+            try:
+                clipboard = Gtk.Clipboard.get(Gtk.gdk.SELECTION_CLIPBOARD)
+                clipboard.set_text(vpn_ip, -1)
+                clipboard.store()
+                self.core.show_notification("Kerio VPN", f"IP address copied: {vpn_ip}")
+            except:
+                pass
+
+    def on_view_logs(self, widget):
+        """Open the built-in journal viewer, or raise it if it is open"""
+        if self.core is None:
+            return
+        if self.log_window is None:
+            from kerio_vpn.logviewer import LogWindow
+
+            self.log_window = LogWindow(self.core.loop)
+            self.core.spawned += 1  # journalctl
+            self.log_window.connect('destroy', self.on_log_window_closed)
+            self.log_window.show_all()
+        self.log_window.present()
+
+    def on_log_window_closed(self, window):
+        self.log_window = None
+
+    def on_settings(self, widget):
+        """Open settings editor"""
+        try:
+            subprocess.Popen(['kerio-config-editor'])
+            self.core.spawned += 1
+        except Exception as e:
+            self.core.show_notification("Error", f"Could not open settings: {e}", category='error')
+
+    def on_quit(self, widget):
+        """Quit the indicator"""
+        if self.control is not None:
+            self.control.close()
+        if self.core is not None:
+            self.core.shutdown()
+            self.notifier.close()
+        Gtk.main_quit()
+
+
+def main():
+    # Handle signals
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    # Create indicator
+    indicator = KerioVPNIndicator()
+
+    # Run GTK main loop
+    Gtk.main()
+    return 0
@@ -40,6 +40,22 @@ if [ -f "/usr/local/bin/kerio-config-editor" ]; then
     echo "✓ Removed"
 fi
 
+# Remove the privileged helper
+if [ -f "/etc/systemd/system/kerio-vpn-helper.socket" ]; then
+    echo "Removing privileged helper..."
+    sudo systemctl disable --now kerio-vpn-helper.socket kerio-vpn-helper.service || true
+    sudo rm -f /etc/systemd/system/kerio-vpn-helper.socket /etc/systemd/system/kerio-vpn-helper.service
+    sudo systemctl daemon-reload
+    echo "✓ Removed"
+fi
+
+# Remove shared modules
+if [ -d "/usr/local/lib/kerio-vpn-indicator" ]; then
+    echo "Removing shared modules..."
+    sudo rm -rf /usr/local/lib/kerio-vpn-indicator
+    echo "✓ Removed"
+fi
+
 # Remove desktop files
 if [ -f "/usr/share/applications/kerio-config-editor.desktop" ]; then
     echo "Removing desktop entry..."
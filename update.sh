@@ -9,15 +9,30 @@ git pull
 # Stop running indicator
 echo "Stopping running indicator..."
 pkill -f kerio-vpn-indicator
+# The new copy refuses to start while the old one still holds the instance lock
+for i in $(seq 25); do
+    pgrep -f /usr/local/bin/kerio-vpn-indicator > /dev/null || break
+    sleep 0.2
+done
 
 # Copy files
+sudo mkdir -p /usr/local/lib/kerio-vpn-indicator
+sudo rm -rf /usr/local/lib/kerio-vpn-indicator/kerio_vpn
+sudo cp -r kerio_vpn /usr/local/lib/kerio-vpn-indicator/
 sudo cp kerio-vpn-indicator.py /usr/local/bin/kerio-vpn-indicator
 sudo cp kerio-config-editor.py /usr/local/bin/kerio-config-editor
 
+sudo cp kerio-vpn-helper.socket kerio-vpn-helper.service /etc/systemd/system/
+
 # Set permissions
 sudo chmod +x /usr/local/bin/kerio-vpn-indicator
 sudo chmod +x /usr/local/bin/kerio-config-editor
 
+# Restart the helper so it runs the new code; the socket starts it again on demand
+sudo systemctl daemon-reload
+sudo systemctl enable --now kerio-vpn-helper.socket
+sudo systemctl stop kerio-vpn-helper.service
+
 # Restart indicator
 echo "Restarting indicator..."
 nohup kerio-vpn-indicator > /dev/null 2>&1 &